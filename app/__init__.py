@@ -1,4 +1,5 @@
 import os
+import logging
 import pymysql
 from flask import Flask
 from flask_migrate import Migrate
@@ -11,11 +12,15 @@ from sqlalchemy import text # Import text for raw SQL execution
 # Load environment variables from .env
 load_dotenv()
 
+from config import LOG_LEVEL
+from .db_pool import engine_options, configure_engine, warm_up_pool
+
 # Global SQLAlchemy instance (exposed at module level)
 db = SQLAlchemy()
 migrate = Migrate() # Initialize Migrate globally or within create_app
 
 def create_app():
+    logging.basicConfig(level=LOG_LEVEL)
     app = Flask(__name__)
 
     # Configuration
@@ -24,6 +29,7 @@ def create_app():
         f"{os.getenv('DB_HOST')}/{os.getenv('DB_NAME')}"
     )
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'fallback-secret-key')
 
     # Initialize SQLAlchemy and Flask-Migrate
@@ -36,6 +42,8 @@ def create_app():
 
     # Context for database operations
     with app.app_context():
+        configure_engine(db.engine)
+
         # Ensure the database and tables are initialized using init_db.sql
         # This will create tables AND triggers.
         ensure_database_initialized(app)
@@ -67,6 +75,8 @@ def create_app():
             # Catch other potential errors during user creation
             print(f"[ERROR] An unexpected error occurred during admin user setup: {e}")
 
+        # Open the worker's first DB connections before it takes requests
+        warm_up_pool(db.engine)
 
     return app
 
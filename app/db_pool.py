@@ -0,0 +1,163 @@
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from config import (
+    WEB_CONCURRENCY,
+    GUNICORN_THREADS,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_TIMEOUT,
+    DB_POOL_WARMUP
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMetrics:
+    """
+    Checkout counts and wait times of the DB pool of this worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+
+    def record(self, wait, timed_out=False):
+        wait_ms = wait * 1000
+        with self._lock:
+            self.checkouts += 1
+            self.timeouts += int(timed_out)
+            self.wait_ms_total += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+
+    def to_dict(self, pool=None) -> dict:
+        with self._lock:
+            metrics = {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_ms_total": round(self.wait_ms_total, 3),
+                "wait_ms_avg": round(self.wait_ms_total / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.wait_ms_max, 3),
+            }
+
+        if isinstance(pool, QueuePool):
+            metrics.update({
+                "pool_size": pool.size(),
+                "in_use": pool.checkedout(),
+                "idle": pool.checkedin(),
+                "overflow": max(pool.overflow(), 0),
+            })
+        return metrics
+
+
+pool_metrics = PoolMetrics()
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    QueuePool recording how long each checkout waited for a connection
+    (including opening a new one) in `pool_metrics`.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record(time.perf_counter() - started, timed_out=True)
+            raise
+        pool_metrics.record(time.perf_counter() - started)
+        return connection
+
+
+def engine_options(uri) -> dict:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for `uri`. Pool settings only apply to MySQL;
+    other databases (e.g. SQLite in development) keep the defaults.
+    """
+    if not str(uri).startswith("mysql"):
+        return {}
+
+    logger.info(
+        "DB pool: %s connections + %s overflow per worker, %s workers x %s threads.",
+        DB_POOL_SIZE, DB_MAX_OVERFLOW, WEB_CONCURRENCY, GUNICORN_THREADS
+    )
+    return {
+        "poolclass": MeteredQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def _set_statement_timeout(dbapi_connection, connection_record):
+    """
+    Limit statements of a new connection to DB_STATEMENT_TIMEOUT seconds:
+    max_statement_time (seconds) on MariaDB, max_execution_time (ms, SELECT
+    only) on MySQL.
+    """
+    server = str(dbapi_connection.get_server_info())
+    cursor = dbapi_connection.cursor()
+    try:
+        if "mariadb" in server.lower():
+            cursor.execute("SET SESSION max_statement_time = %s" % float(DB_STATEMENT_TIMEOUT))
+        else:
+            cursor.execute("SET SESSION max_execution_time = %s" % int(DB_STATEMENT_TIMEOUT * 1000))
+    finally:
+        cursor.close()
+
+
+def configure_engine(engine):
+    """
+    Per-connection setup and fork safety of the app's engine (call once,
+    right after db.init_app).
+    """
+    if engine.dialect.name != "mysql":
+        return
+
+    if DB_STATEMENT_TIMEOUT > 0:
+        event.listen(engine, "connect", _set_statement_timeout)
+
+    # A forked worker (e.g. gunicorn --preload) must open its own connections
+    # instead of sharing the parent's sockets
+    if hasattr(os, "register_at_fork"):
+        os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
+
+
+def warm_up_pool(engine, connections=DB_POOL_WARMUP):
+    """
+    Open `connections` pooled connections at worker boot, so the first
+    requests do not pay the connect time to the remote DB host.
+    """
+    if engine.dialect.name != "mysql":
+        return
+
+    connections = min(connections, DB_POOL_SIZE)
+    opened = []
+    try:
+        for _ in range(connections):
+            opened.append(engine.connect())
+        logger.info("DB pool warmed up with %s connections.", len(opened))
+    except Exception as e:
+        logger.error("DB pool warm-up failed after %s connections: %s", len(opened), e)
+    finally:
+        for connection in opened:
+            connection.close()
+
+
+def get_pool_metrics(engine) -> dict:
+    return pool_metrics.to_dict(engine.pool)
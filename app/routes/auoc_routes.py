@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, session, redirect, url_for, reques
 from sqlalchemy import or_, cast, String
 from app import db
 from app.models import UnitConversion, UnitAlias
+from app.routes.results.unit_conversion import invalidate_unit_registry
 
 auoc_bp = Blueprint('auoc_bp', __name__)
 
@@ -190,6 +191,7 @@ def registerauoc():
                 return jsonify({"success": False, "message": "No valid Unit Aliases to insert."}), 400
 
             db.session.commit()
+            invalidate_unit_registry()
             return jsonify({"success": True, "message": f"{added_count} Unit Alias(es) registered successfully."}), 200
 
         except Exception as e:
@@ -244,6 +246,7 @@ def updateauoc():
             auoc_to_update.is_active = is_active
 
             db.session.commit()
+            invalidate_unit_registry()
             return jsonify({"success": True, "message": "Unit Alias updated successfully."}), 200
 
         except Exception as e:
@@ -272,6 +275,7 @@ def delete_auoc(auoc_id):
     try:
         db.session.delete(auoc)
         db.session.commit()
+        invalidate_unit_registry()
         return jsonify({"success": True, "message": "Unit alias deleted successfully"})
     except Exception as e:
         db.session.rollback()
@@ -306,6 +310,7 @@ def delete_auocs():
             results.append({"id": auoc_id, "status": "deleted"})
 
         db.session.commit()
+        invalidate_unit_registry()
 
     except Exception:
         db.session.rollback()
@@ -3,11 +3,12 @@ from sqlalchemy import func, or_
 from app import db
 from app.models import Datasheet, Element, Step, UOM, Tasks, Item, UserParameterValue, BElement
 from app.routes.results.unit_conversion import get_si_unit
+from app.routes.results.factorization import invalidate_task_factorizations
+from app.routes.results.analysis_cache import invalidate_task_results
+from app.routes.results.matrix_cache import patch_task_matrices, invalidate_task_matrices
 
 
 import logging
-logging.basicConfig(level=logging.DEBUG)
-
 datasheet_bp = Blueprint('datasheet_bp', __name__)
 
 # ----------------------------------------------------------------
@@ -19,6 +20,21 @@ def get_current_user():
     return session.get('user_id')
 
 
+def datasheet_changed(task_id, idds=None):
+    """
+    Refresh the analysis caches of a task after its datasheet rows changed
+    (call after commit). With `idds`, the cached matrices are patched for
+    those rows; otherwise they are dropped.
+    """
+    invalidate_task_factorizations(task_id)
+    invalidate_task_results(task_id)
+
+    if idds:
+        patch_task_matrices(task_id, idds)
+    else:
+        invalidate_task_matrices(task_id)
+
+
 def normalize_existing_rows_for_task_step(task_id, step_id):
     existing_rows = (
         db.session.query(
@@ -175,11 +191,13 @@ def validate_allocation_payload(allocation):
 def apply_manual_allocation_to_existing_rows(task_id, step_id, allocation_clean):
     """
     Update ManualAllocation for existing relevant rows in DB
-    for the same task and step, based on IDE.
+    for the same task and step, based on IDE. Returns the IDDs of the
+    updated rows.
     """
     if not allocation_clean:
-        return
+        return []
 
+    updated = []
     existing_rows = (
         Datasheet.query
         .filter(Datasheet.IDT == task_id, Datasheet.IDS == step_id)
@@ -190,6 +208,9 @@ def apply_manual_allocation_to_existing_rows(task_id, step_id, allocation_clean)
         ide_str = str(row.IDE)
         if ide_str in allocation_clean:
             row.ManualAllocation = allocation_clean[ide_str]
+            updated.append(row.IDD)
+
+    return updated
 
 # ----------- Pages HTML -----------
 @datasheet_bp.route('/datasheet')
@@ -736,6 +757,7 @@ def delete_datasheet(task_id):
         db.session.delete(task)
         
         db.session.commit()
+        datasheet_changed(task_id)
         return jsonify({"success": True, "message": "Task and related data deleted successfully"})
     except Exception as e:
         db.session.rollback()
@@ -779,6 +801,7 @@ def delete_datasheets():
             # 3. Delete the parent Task itself
             db.session.delete(task)
             db.session.commit()
+            datasheet_changed(task_id)
             results.append({"id": task_id, "status": "deleted"})
         except Exception as e:
             db.session.rollback()
@@ -936,7 +959,7 @@ def save_datasheetregister():
         
         # 5. Save only incoming rows
         # Update already-existing rows in DB
-        apply_manual_allocation_to_existing_rows(task_id, step_id, allocation_clean)
+        allocated_idds = apply_manual_allocation_to_existing_rows(task_id, step_id, allocation_clean)
 
         # Save only incoming rows
         new_entries = []
@@ -967,6 +990,7 @@ def save_datasheetregister():
 
         db.session.add_all(new_entries)
         db.session.commit()
+        datasheet_changed(task_id, allocated_idds + [entry.IDD for entry in new_entries])
 
         return jsonify({
             "success": True,
@@ -1105,6 +1129,7 @@ def save_datasheet():
         # 5. If allocation provided, update ALL relevant existing rows
         # for the same task + step + IDE
         # ---------------------------------------------------------
+        allocated_idds = []
         if allocation_clean:
             for r in relevant_rows:
                 ide_str = str(r["IDE"])
@@ -1120,6 +1145,7 @@ def save_datasheet():
 
                 for db_row in matching_rows:
                     db_row.ManualAllocation = allocation_clean[ide_str]
+                    allocated_idds.append(db_row.IDD)
 
         # ---------------------------------------------------------
         # 6. Update existing rows / insert new rows
@@ -1128,6 +1154,8 @@ def save_datasheet():
         # - only overwrite ManualAllocation when IDE exists in allocation_clean
         # ---------------------------------------------------------
         rows_status = []
+        saved_entries = []
+        previous_tasks = set()
 
         for row in valid_rows:
             idd = row.get("IDD")
@@ -1144,6 +1172,9 @@ def save_datasheet():
                     rows_status.append("error")
                     continue
 
+                if str(entry.IDT) != str(task_id):
+                    previous_tasks.add(entry.IDT)
+
                 entry.IDE = ide
                 entry.IDU = idu1
                 entry.ValueD = value_d1
@@ -1157,6 +1188,7 @@ def save_datasheet():
                 if str(ide) in allocation_clean:
                     entry.ManualAllocation = allocation_clean[str(ide)]
 
+                saved_entries.append(entry)
                 rows_status.append("success")
 
             else:
@@ -1176,9 +1208,13 @@ def save_datasheet():
                     ManualAllocation=manual_alloc
                 )
                 db.session.add(new_entry)
+                saved_entries.append(new_entry)
                 rows_status.append("success")
 
         db.session.commit()
+        datasheet_changed(task_id, allocated_idds + [entry.IDD for entry in saved_entries])
+        for previous_task in previous_tasks:
+            datasheet_changed(previous_task)
 
         return jsonify({
             "success": True,
@@ -1204,8 +1240,10 @@ def delete_datasheet_row(idd):
         # Find the datasheet by IDD
         datasheet = Datasheet.query.get(idd)
         if datasheet:
+            task_id = datasheet.IDT
             db.session.delete(datasheet)
             db.session.commit()
+            datasheet_changed(task_id, [idd])
             return jsonify({"success": True, "message": "Row deleted successfully."}), 200
         else:
             return jsonify({"success": False, "message": "Row not found."}), 404
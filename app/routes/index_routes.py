@@ -1,4 +1,6 @@
-from flask import Blueprint, render_template, session, redirect, url_for
+from flask import Blueprint, render_template, session, redirect, url_for, jsonify
+from app import db
+from app.db_pool import get_pool_metrics
 
 index_bp = Blueprint('index_bp', __name__)
 
@@ -7,3 +9,12 @@ def index():
     if 'username' not in session:
         return redirect(url_for('auth_bp.login'))
     return render_template('index.html')
+
+@index_bp.route('/metrics/db_pool')
+def db_pool_metrics():
+    """
+    DB pool of this worker: checkout count and wait times, connections in use.
+    """
+    if 'username' not in session:
+        return jsonify({"error": "Unauthorized"}), 403
+    return jsonify(get_pool_metrics(db.engine))
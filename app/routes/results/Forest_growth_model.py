@@ -153,19 +153,22 @@ def Forgone_growth(t, pre_harvest_yield):
     return forgone_growth
 
 
-def forest_growth_function(task_id: int):
+def forest_growth_function(task_id: int, params=None):
     """
     Compute forest growth impacts for a given task.
 
     Uses:
     - task region from Tasks.Region
     - HWP_tree from Datasheet Tree flow, converted to kg
+    - `params` (init_param_variable() of the user); read from the session
+      when not given, so pass them outside a request (background jobs)
 
     Returns:
         tuple:
             (E_net, HWP_tree)
     """
-    params = init_param_variable()
+    if params is None:
+        params = init_param_variable()
 
     pre_harvest_yield = float(params['pre_harvest_yield'] or 0.0)
     post_harvest_yield = float(params['post_harvest_yield'] or 0.0)
@@ -0,0 +1,95 @@
+import logging
+
+from config import ANALYSIS_CACHE_ENABLED
+from .getdata import get_datasheet_versions
+from .lci_store import get_lci_store
+from .result_store import get_result_store, make_result_key, analysis_hash
+from .unit_conversion import get_unit_registry
+
+logger = logging.getLogger(__name__)
+
+# Namespace of run_analysis entries in the result store
+ANALYSIS_CACHE_PREFIX = "run"
+
+
+class AnalysisCache:
+    """
+    Content-addressed cache of per-row run_analysis results.
+
+    The key hashes everything a row's result depends on: the row itself
+    (task, flow, unit, functional unit, impact category, allocation, ...),
+    the task's datasheet version, the user's parameters and regeneration
+    mode, and the content checksums of the LCI and unit tables (per-worker
+    reload counters would clash in the store shared by all workers).
+    Entries are kept in the shared result store, so a hit needs neither the
+    matrices nor matplotlib.
+    """
+
+    def __init__(self, store=None, enabled=ANALYSIS_CACHE_ENABLED):
+        self._store = store
+        self.enabled = enabled
+
+    @property
+    def store(self):
+        return self._store or get_result_store()
+
+    def context(self, task_ids, params) -> dict:
+        """
+        Versions shared by every row of one run_analysis call.
+        """
+        return {
+            "datasheets": get_datasheet_versions(task_ids),
+            "params": params,
+            "lci_fingerprint": get_lci_store().fingerprint,
+            "unit_digest": get_unit_registry().digest,
+        }
+
+    def key(self, user, task_id, row, context) -> str:
+        digest = analysis_hash({
+            "row": row,
+            "datasheet": context["datasheets"].get(task_id),
+            "params": context["params"],
+            "lci_fingerprint": context["lci_fingerprint"],
+            "unit_digest": context["unit_digest"],
+        })
+        return make_result_key(user, task_id, f"{ANALYSIS_CACHE_PREFIX}-{digest}")
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        try:
+            return self.store.get(key)
+        except Exception as e:
+            logger.error("Analysis cache lookup failed: %s", e)
+            return None
+
+    def set(self, key, result, contributions, graph_entry):
+        if not self.enabled or "error" in result:
+            return
+        try:
+            self.store.set(key, {
+                "result": result,
+                "contributions": contributions,
+                "graph_entry": graph_entry,
+            })
+        except Exception as e:
+            logger.error("Analysis cache write failed: %s", e)
+
+    def invalidate_task(self, task_id):
+        """
+        Drop cached results of a task (called when its datasheet changes).
+        """
+        try:
+            self.store.delete_task(task_id)
+        except Exception as e:
+            logger.error("Analysis cache invalidation failed for task %s: %s", task_id, e)
+
+
+analysis_cache = AnalysisCache()
+
+
+def invalidate_task_results(task_id):
+    """
+    Called by the datasheet routes whenever the rows of a task change.
+    """
+    analysis_cache.invalidate_task(task_id)
@@ -1,64 +1,107 @@
 import logging
 logger = logging.getLogger(__name__)
 import numpy as np
-from .import_rawdata import import_lci
+from .lci_store import get_lci_store
+from .factorization import Factorization, factorization_cache
+from .diagnostics import snapshot
+from config import LCA_MATRIX_BACKEND, LCA_SPARSE_MIN_PROCESSES
+
+# Optional sparse backend
+try:
+    import scipy.sparse as sp
+except ImportError:
+    sp = None
+
+MATRIX_BACKENDS = ("dense", "sparse", "auto")
+
+
+def select_matrix_backend(requested=None, n_processes=0):
+    """
+    Resolve the matrix backend for one analysis: 'dense' or 'sparse'.
+
+    `requested` (from the analysis row) overrides LCA_MATRIX_BACKEND.
+    'auto' selects sparse from LCA_SPARSE_MIN_PROCESSES process columns.
+    Falls back to dense when scipy is not installed.
+    """
+    backend = str(requested or LCA_MATRIX_BACKEND).strip().lower()
+
+    if backend not in MATRIX_BACKENDS:
+        logger.warning("Unknown matrix backend '%s'. Using dense.", backend)
+        backend = "dense"
+
+    if backend == "auto":
+        backend = "sparse" if n_processes >= LCA_SPARSE_MIN_PROCESSES else "dense"
+
+    if backend == "sparse" and sp is None:
+        logger.warning("Sparse backend requested but scipy is not installed. Using dense.")
+        backend = "dense"
+
+    return backend
+
+
+def to_backend(M, backend, fmt="csr"):
+    """
+    Convert a dense matrix to the given backend ('dense' leaves it as is).
+    """
+    if backend != "sparse":
+        return M
+    return sp.csc_matrix(M) if fmt == "csc" else sp.csr_matrix(M)
+
+
+def _is_sparse(M):
+    return sp is not None and sp.issparse(M)
+
 
 # --- File: calculate.py (MODIFIED) ---
 
 # Function to calculate the scaling vector s based on the final demand f
-def calculate_scaling_vector(A, final_demand):
+def calculate_scaling_vector(A, final_demand, task_id=None):
     """
     Calculates the scaling vector s by solving A * s = final_demand.
-    Uses the pseudoinverse (np.linalg.pinv) for non-square (overdetermined) matrices.
+    Uses LU factors for square matrices and the pseudoinverse (np.linalg.pinv)
+    for non-square (overdetermined) or singular ones.
+    Sparse A uses a sparse LU solve, or LSQR when A is non-square or singular.
+
+    With a task_id the factorization of A is cached (keyed by task and a hash
+    of A), so a rerun with a new final demand only costs the triangular solves.
     """
     A = A.astype(float)
-    
-    # Check if the matrix is square
-    if A.shape[0] == A.shape[1]:
-        # Square matrix: use standard solver
-        logger.warning("A is square (A.s = f). Using np.linalg.solve.")
-        try:
-            scaling_vector = np.linalg.solve(A, final_demand)
-        except np.linalg.LinAlgError as e:
-            # Fallback to pseudoinverse if the square matrix is singular
-            logger.warning(f"Square matrix is singular ({e}). Falling back to pseudoinverse.")
-            scaling_vector = np.dot(np.linalg.pinv(A), final_demand)
+
+    if task_id is None:
+        factorization = Factorization.build(A)
     else:
-        # Non-square matrix (overdetermined): use pseudoinverse for least-squares solution
-        logger.warning(f"A is non-square {A.shape}. Using pseudoinverse (A+).")
-        scaling_vector = np.dot(np.linalg.pinv(A), final_demand)
-        
-    return scaling_vector
+        factorization = factorization_cache.get_or_build(task_id, A)
 
+    return factorization.solve(final_demand)
 
-#function that convert the vect s into a diagonal matrix
-def diagonal_vector (scaling_vector):
-    diag_scaling_vector=np.diag(scaling_vector)
-    #print (f"the diagonal matrix s is: \n{diag_scaling_vector}")
-    return diag_scaling_vector
 
 # Function to calculate the inventory table scaled to the final demand vector f,  using the scaling vector s and the emission matrix B
 def calculate_inventory_impact(B, scaling_vector):
     # Calculate the impact vector g = B.s
-    g = np.dot(B, scaling_vector)  # Matrix multiplication
+    g = B @ scaling_vector  # Matrix multiplication (dense or sparse B)
     
     # Print the resulting impact table (g)
     #print(f"Inventory Impact (g):\n{g}")
     return g
 
-# Function to calculate the inventory table by process [MAtrix as opposed to the vector] scaled to the final demand vector f,  using the diagonal vector diag(s) and the emission matrix B
-def calculate_inventory_matrix(B, diag_scaling_vector):
-    # Calculate the impact vector g = B.s
-    G = np.dot(B, diag_scaling_vector)  # Matrix multiplication
+# Function to calculate the inventory table by process [MAtrix as opposed to the vector] scaled to the final demand vector f,  using the scaling vector s and the emission matrix B
+def calculate_inventory_matrix(B, scaling_vector):
+    # G = B.diag(s), computed by scaling each column of B by s (no n x n diagonal)
+    scaling_vector = np.asarray(scaling_vector, dtype=float).reshape(-1)
+
+    if _is_sparse(B):
+        return sp.csr_matrix(B.multiply(scaling_vector.reshape(1, -1)))
+
+    G = np.asarray(B, dtype=float) * scaling_vector  # Broadcast over columns
     
     # Print the resulting impact table (g)
     #print(f"Inventory Impact by process (G):\n{G}")
     return G
 
 
-def calculate_impact_score(g, lci_flow, category):
+def calculate_impact_score(g, lci_flow, category, store=None):
     
-    logger.warning("Calculating impact score...")
+    logger.debug("Calculating impact score...")
 
     # Convert to array
     g = np.array(g, dtype=float)
@@ -69,50 +112,68 @@ def calculate_impact_score(g, lci_flow, category):
         logger.warning(f"len(g): {len(g)}, len(lci_flow): {len(lci_flow)}")
         return None
 
-    i_LCI_values = []
-
-    for i, flow in enumerate(lci_flow):
-        impact_value = import_lci(flow, category)
-        if impact_value is None:
-            logger.warning(f"No LCI value found for flow '{flow}' and category '{category}'. Skipping.")
-            impact_value = 0.0  # or continue if you want to skip
-        i_LCI_values.append(impact_value)
+    # One vector lookup in the shared LCI store; missing flows count as 0.0
+    i_LCI = (store or get_lci_store()).vector(list(lci_flow), category)
 
-    logger.warning(f"Selected LCI values: {i_LCI_values}")
-
-    i_LCI = np.array(i_LCI_values, dtype=float)
+    snapshot("lci_values", i_LCI, category=category)
 
     I_score = np.dot(g, i_LCI)
-    logger.warning(f"Impact score for final demand: {I_score}")
+    logger.debug(f"Impact score for final demand: {I_score}")
     return I_score
 
 
-def calculate_process_contribution(G, lci_flow, category):
+def calculate_scaled_contribution(B, scaling_vector, lci_flow, category, store=None):
+    """
+    Process contribution for one category without building G:
+        contribution = (c @ B) * s
 
-    logger.warning("Calculating process contribution...")
+    `store` defaults to the shared LCI factor store.
+    """
+    scaling_vector = np.asarray(scaling_vector, dtype=float).reshape(-1)
 
-    # Validate dimensions
-    G = np.array(G, dtype=float)
-    if G.shape[0] != len(lci_flow):
-        logger.error(f"Mismatch between G rows ({G.shape[0]}) and number of LCI flows ({len(lci_flow)}).")
+    if B.shape[0] != len(lci_flow):
+        logger.error(f"Mismatch between B rows ({B.shape[0]}) and number of LCI flows ({len(lci_flow)}).")
         return None
 
-    # Build the LCI vector for the given category
-    LCI_vector = []
-    for i, flow in enumerate(lci_flow):
-        lci_value = import_lci(flow, category)
-        if lci_value is None:
-            logger.warning(f"No LCI value found for flow '{flow}' in category '{category}'. Assuming 0.")
-            lci_value = 0.0
-        LCI_vector.append(lci_value)
+    LCI_vector = (store or get_lci_store()).vector(list(lci_flow), category)  # shape: (n_flows,)
 
-    LCI_vector = np.array(LCI_vector, dtype=float)  # shape: (n_flows,)
+    contribution_score = np.asarray(LCI_vector @ B).reshape(-1) * scaling_vector
 
-    # Compute contribution per process
-    contribution_score = np.dot(LCI_vector.T, G)  # shape: (n_processes,)
-    
-    logger.warning(f"Process contribution scores: {contribution_score}")
-    logger.warning("G shape: %s", G.shape)
-    logger.warning("LCI vector: %s", LCI_vector.tolist())
-    logger.warning("G matrix:\n%s", G)
-    return contribution_score
\ No newline at end of file
+    snapshot("process_contribution", contribution_score, category=category)
+    snapshot("lci_vector", LCI_vector, category=category)
+    return contribution_score
+
+
+def calculate_category_impacts(g, B, scaling_vector, lci_flow, categories, store=None):
+    """
+    Characterize the inventory for several impact categories at once.
+
+    Builds C (categories x flows) from the LCI store (`store`, defaulting to
+    the shared one) and evaluates
+    C @ [g | B] as a single matrix product; the process columns are then
+    scaled by s, so G = B.diag(s) is never materialized.
+
+    Returns:
+        tuple: (impact_scores, contribution_cube)
+            impact_scores     -> shape (n_categories,)
+            contribution_cube -> shape (n_categories, n_processes)
+    """
+    g = np.asarray(g, dtype=float).reshape(-1)
+    scaling_vector = np.asarray(scaling_vector, dtype=float).reshape(-1)
+
+    if B.shape[0] != len(lci_flow) or len(g) != len(lci_flow):
+        raise ValueError(
+            f"Inventory rows (g={len(g)}, B={B.shape[0]}) do not match "
+            f"number of LCI flows ({len(lci_flow)})."
+        )
+
+    C = (store or get_lci_store()).matrix(list(lci_flow), categories)
+    logger.debug("Characterization matrix shape: %s", C.shape)
+
+    if _is_sparse(B):
+        # dense C times sparse B; g is handled separately
+        return C @ g, np.asarray(C @ B) * scaling_vector
+
+    result = C @ np.column_stack([g, np.asarray(B, dtype=float)])
+
+    return result[:, 0], result[:, 1:] * scaling_vector
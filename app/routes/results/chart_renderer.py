@@ -0,0 +1,81 @@
+import logging
+from concurrent.futures.process import BrokenProcessPool
+
+from .create_graph import create_graph, create_graph_wt
+from .executor import get_chart_executor, reset_chart_executor
+
+logger = logging.getLogger(__name__)
+
+# Chart functions a render job may name
+CHART_FUNCTIONS = {
+    "create_graph": create_graph,
+    "create_graph_wt": create_graph_wt,
+}
+
+
+def chart_job(data, function="create_graph_wt", **kwargs) -> dict:
+    """
+    Plain-data description of one PNG chart: `function(data, **kwargs)`.
+    """
+    if function not in CHART_FUNCTIONS:
+        raise ValueError(f"Unknown chart function: {function}")
+    return {"function": function, "data": data, "kwargs": kwargs}
+
+
+def render_job(job) -> str:
+    """
+    Render one chart job to a base64 PNG (runs in a chart worker process).
+    """
+    return CHART_FUNCTIONS[job["function"]](job["data"], **job["kwargs"])
+
+
+def _render_here(jobs, return_exceptions):
+    outputs = []
+    for job in jobs:
+        try:
+            outputs.append(render_job(job))
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            outputs.append(e)
+    return outputs
+
+
+def render_jobs(jobs, return_exceptions=False) -> list:
+    """
+    Render a batch of chart jobs concurrently in the chart process pool and
+    return their base64 PNGs in order.
+
+    With CHART_RENDER_WORKERS = 0 the charts are rendered in the calling
+    thread. With `return_exceptions`, a failing chart gives its exception
+    in the list instead of raising.
+    """
+    if not jobs:
+        return []
+
+    executor = get_chart_executor()
+    if executor is None:
+        return _render_here(jobs, return_exceptions)
+
+    try:
+        futures = [executor.submit(render_job, job) for job in jobs]
+    except (BrokenProcessPool, RuntimeError) as e:
+        logger.error("Chart pool unavailable (%s); rendering in this thread.", e)
+        reset_chart_executor()
+        return _render_here(jobs, return_exceptions)
+
+    outputs = []
+    for job, future in zip(jobs, futures):
+        try:
+            outputs.append(future.result())
+        except BrokenProcessPool as e:
+            logger.error("Chart worker failed (%s); rendering in this thread.", e)
+            reset_chart_executor()
+            outputs.extend(_render_here(jobs[len(outputs):], return_exceptions))
+            break
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            outputs.append(e)
+
+    return outputs
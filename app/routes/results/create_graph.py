@@ -1,11 +1,12 @@
 import base64
 import io
+import threading
+from collections import OrderedDict
 from typing import Optional
 
 import matplotlib
-matplotlib.use("Agg")
-
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 import numpy as np
 
 
@@ -87,15 +88,66 @@ def _pick_colors(theme: str, n: int):
     return list(itertools.islice(itertools.cycle(base_colors), n))
 
 
+# Figures kept for reuse per thread, one per size class
+FIGURE_CACHE_SIZE = 8
+_figures = threading.local()
+
+_SUBPLOT_PARAMS = ("left", "right", "bottom", "top", "wspace", "hspace")
+
+
+def _new_figure(figsize):
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _get_figure(figsize, reuse=True):
+    """
+    Figure and Axes of `figsize`, drawn with the object-oriented Agg API
+    (no pyplot global state, so it is safe in threaded workers).
+
+    Figures are reused per size class within a thread: a reused figure is
+    cleared and its subplot parameters reset, so it draws exactly like a
+    new one.
+    """
+    size = (round(float(figsize[0]), 2), round(float(figsize[1]), 2))
+    if not reuse:
+        fig = _new_figure(size)
+        return fig, fig.add_subplot()
+
+    cache = getattr(_figures, "cache", None)
+    if cache is None:
+        cache = _figures.cache = OrderedDict()
+
+    fig = cache.pop(size, None)
+    if fig is None:
+        fig = _new_figure(size)
+    else:
+        fig.clear()
+        fig.subplots_adjust(**{k: matplotlib.rcParams[f"figure.subplot.{k}"] for k in _SUBPLOT_PARAMS})
+
+    cache[size] = fig
+    while len(cache) > FIGURE_CACHE_SIZE:
+        cache.popitem(last=False)
+
+    return fig, fig.add_subplot()
+
+
 def _save_figure_to_base64(fig) -> str:
     buf = io.BytesIO()
     fig.savefig(buf, format="png", bbox_inches="tight")
-    plt.close(fig)
     buf.seek(0)
     return base64.b64encode(buf.read()).decode("utf-8")
 
 
-def _plot_pie(ax, x_data, y_data, colors, legend_title="Categories"):
+def _pie_buckets(x_data, y_data):
+    """
+    Slices of a pie chart: values below 1% of the total are merged into an
+    "Other" slice, then slices are sorted by decreasing value.
+
+    Returns (labels, values, order, other_value); `order` holds the index in
+    the input of each slice (-1 for "Other").
+    """
     if len(y_data) == 0:
         raise ValueError("No data available for pie chart.")
 
@@ -112,15 +164,20 @@ def _plot_pie(ax, x_data, y_data, colors, legend_title="Categories"):
 
     large_x = x_data[large_mask]
     large_y = y_data[large_mask]
+    large_i = np.flatnonzero(large_mask)
 
     small_sum = np.sum(y_data[small_mask])
     if small_sum > 0:
         large_x = np.append(large_x, "Other")
         large_y = np.append(large_y, small_sum)
+        large_i = np.append(large_i, -1)
 
     sort_order = np.argsort(-large_y)
-    large_x = large_x[sort_order]
-    large_y = large_y[sort_order]
+    return large_x[sort_order], large_y[sort_order], large_i[sort_order], float(small_sum)
+
+
+def _plot_pie(ax, x_data, y_data, colors, legend_title="Categories"):
+    large_x, large_y, _, _ = _pie_buckets(x_data, y_data)
 
     colors = colors[:len(large_y)] if len(colors) >= len(large_y) else _pick_colors("vibrant", len(large_y))
 
@@ -209,13 +266,13 @@ def create_graph(
 
     n = len(x_data)
     fig_width = max(10, min(20, n * 0.4))
-    fig, ax = plt.subplots(figsize=(fig_width, 6))
+    fig, ax = _get_figure((fig_width, 6))
 
     graph_type = str(graph_type).lower()
     colors = kwargs.get("color")
 
     if colors is None:
-        colors = list(plt.cm.tab20.colors)
+        colors = list(matplotlib.colormaps["tab20"].colors)
 
     if graph_type == "pie" and np.any(y_data < 0):
         graph_type = "bar"
@@ -265,7 +322,8 @@ def create_graph_wt(
 
     n = len(x_data)
     fig_width = max(10, min(20, n * 0.4))
-    fig, ax = plt.subplots(figsize=(fig_width, 6))
+    # A returned figure belongs to the caller, so it is never reused
+    fig, ax = _get_figure((fig_width, 6), reuse=not return_fig)
 
     theme = kwargs.get("theme", "vibrant")
     colors = _pick_colors(theme, max(len(y_data), 1))
@@ -307,4 +365,59 @@ def create_graph_wt(
     if return_fig:
         return fig
 
-    return _save_figure_to_base64(fig)
\ No newline at end of file
+    return _save_figure_to_base64(fig)
+
+def chart_series(
+    data,
+    graph_type="pie",
+    x_column=0,
+    y_column=1,
+    has_header=False,
+    **kwargs
+):
+    """
+    Chart-ready series for drawing in the browser, with the same decisions
+    as create_graph_wt but without any matplotlib work:
+
+      - type:        "pie" is replaced by "bar" when a value is negative
+      - labels, short_labels, values: points in drawing order
+      - order:       index in `data` of each point (-1 for "Other")
+      - other:       value merged into the "Other" slice (pie only)
+      - colors:      theme colors, one per point
+    """
+    x_data, y_data, _ = _prepare_xy(
+        data,
+        x_column=x_column,
+        y_column=y_column,
+        has_header=has_header,
+        shorten_labels=False
+    )
+    x_data = np.array(x_data, dtype=object)
+
+    requested_type = str(graph_type).lower()
+    graph_type = requested_type
+    if graph_type == "pie" and np.any(y_data < 0):
+        graph_type = "bar"
+
+    if graph_type == "pie":
+        labels, values, order, other = _pie_buckets(x_data, y_data)
+    elif graph_type in ("bar", "line", "scatter"):
+        order = np.argsort(-y_data)
+        labels, values, other = x_data[order], y_data[order], 0.0
+    else:
+        raise ValueError(f"Unsupported graph type: {graph_type}")
+
+    return {
+        "type": graph_type,
+        "requested_type": requested_type,
+        "title": kwargs.get("title", "Graph Title"),
+        "xlabel": kwargs.get("xlabel", f"Column {x_column}"),
+        "ylabel": kwargs.get("ylabel", f"Column {y_column}"),
+        "legend_title": kwargs.get("legend_title", "Categories"),
+        "labels": [str(v) for v in labels],
+        "short_labels": [short_label(v) for v in labels],
+        "values": [float(v) for v in values],
+        "order": [int(i) for i in order],
+        "other": other,
+        "colors": _pick_colors(kwargs.get("theme", "vibrant"), max(len(values), 1))[:len(values)],
+    }
@@ -0,0 +1,170 @@
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from config import (
+    LCA_DIAGNOSTICS_SAMPLE_RATE,
+    LCA_DIAGNOSTICS_BUFFER,
+    LCA_DIAGNOSTICS_DIR
+)
+
+logger = logging.getLogger(__name__)
+
+# Diagnostics run of the run_analysis call in this thread (None when off)
+_current_run = contextvars.ContextVar("lca_diagnostics", default=None)
+
+
+def _serialize(value):
+    """
+    Shape and text of a snapshot value (DataFrame, array, sparse matrix,
+    list, dict or scalar), in full.
+    """
+    if hasattr(value, "toarray"):
+        value = value.toarray()
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return list(value.shape), value.to_string()
+
+    if isinstance(value, np.ndarray):
+        return list(value.shape), np.array2string(value, threshold=sys.maxsize, max_line_width=200)
+
+    if isinstance(value, (list, tuple, dict)):
+        return [len(value)], json.dumps(value, default=str)
+
+    return None, str(value)
+
+
+class DiagnosticsRun:
+    """
+    Matrix and vector snapshots taken during one run_analysis call.
+    """
+
+    def __init__(self, owner=None, reason="debug"):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.reason = reason
+        self.started_at = time.time()
+        self.snapshots = []
+
+    def capture(self, name, value, fields):
+        if callable(value):
+            value = value()
+        shape, text = _serialize(value)
+        self.snapshots.append({"name": name, "shape": shape, "text": text, **fields})
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "reason": self.reason,
+            "started_at": self.started_at,
+            "snapshots": self.snapshots,
+        }
+
+
+class DiagnosticsBuffer:
+    """
+    Ring buffer of the last `max_runs` diagnostics runs of this worker.
+    With `dump_dir`, each run is also written to <dump_dir>/<run id>.json.
+    """
+
+    def __init__(self, max_runs=LCA_DIAGNOSTICS_BUFFER, dump_dir=LCA_DIAGNOSTICS_DIR):
+        self.dump_dir = dump_dir
+        self._runs = deque(maxlen=max(int(max_runs), 1))
+        self._lock = threading.Lock()
+
+    def add(self, run):
+        with self._lock:
+            self._runs.append(run)
+
+        if self.dump_dir:
+            try:
+                os.makedirs(self.dump_dir, exist_ok=True)
+                with open(os.path.join(self.dump_dir, f"{run.id}.json"), "w", encoding="utf-8") as f:
+                    json.dump({"owner": run.owner, **run.to_dict()}, f)
+            except OSError as e:
+                logger.error("Could not write diagnostics dump %s: %s", run.id, e)
+
+    def get(self, run_id, owner):
+        with self._lock:
+            for run in self._runs:
+                if run.id == run_id and run.owner == owner:
+                    return run
+        return None
+
+
+diagnostics_buffer = DiagnosticsBuffer()
+
+
+@contextlib.contextmanager
+def diagnostics_session(debug=False, owner=None, keep=True):
+    """
+    Capture snapshots in this block when `debug` is set, or for a sample of
+    runs (LCA_DIAGNOSTICS_SAMPLE_RATE). Yields the run, or None when nothing
+    is captured. With `keep` the run goes to the diagnostics buffer.
+    """
+    if debug:
+        reason = "debug"
+    elif LCA_DIAGNOSTICS_SAMPLE_RATE > 0 and random.random() < LCA_DIAGNOSTICS_SAMPLE_RATE:
+        reason = "sampled"
+    else:
+        reason = None
+
+    if reason is None or _current_run.get() is not None:
+        yield None
+        return
+
+    run = DiagnosticsRun(owner, reason)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+        if keep:
+            diagnostics_buffer.add(run)
+
+
+def capturing() -> bool:
+    return _current_run.get() is not None
+
+
+def snapshot(name, value, **fields):
+    """
+    Record `value` (or the result of calling it) under `name` when the
+    current run captures diagnostics. Nothing is built or serialized
+    otherwise, so pass a callable for values that are costly to build.
+    """
+    run = _current_run.get()
+    if run is None:
+        return
+    try:
+        run.capture(name, value, fields)
+    except Exception as e:
+        logger.error("Diagnostics snapshot '%s' failed: %s", name, e)
+
+
+def merge_snapshots(snapshots, **fields):
+    """
+    Add snapshots taken elsewhere (e.g. in a worker process).
+    """
+    run = _current_run.get()
+    if run is not None:
+        run.snapshots.extend({**s, **fields} for s in snapshots)
+
+
+def get_diagnostics(run_id, owner):
+    """
+    Snapshots of a diagnostics run of `owner`, or None if unknown or evicted.
+    """
+    run = diagnostics_buffer.get(run_id, owner)
+    return run.to_dict() if run is not None else None
@@ -0,0 +1,76 @@
+import atexit
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from config import LCA_PARALLEL_WORKERS, CHART_RENDER_WORKERS
+
+logger = logging.getLogger(__name__)
+
+_executors = {}
+_executor_lock = threading.Lock()
+
+
+def _get_executor(name, max_workers):
+    """
+    Return the named process pool, created on first use and shared by every
+    request of the worker, or None when it is disabled (max_workers <= 0).
+    """
+    if max_workers <= 0:
+        return None
+
+    with _executor_lock:
+        executor = _executors.get(name)
+        if executor is None:
+            # spawn: children must not inherit DB connections or locks of the web worker
+            executor = _executors[name] = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info("Started %s process pool with %s workers.", name, max_workers)
+        return executor
+
+
+def _reset_executor(name):
+    with _executor_lock:
+        executor = _executors.pop(name, None)
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def get_analysis_executor(max_workers=LCA_PARALLEL_WORKERS):
+    """
+    Return the process pool used to analyse tasks in parallel, or None when
+    parallel execution is disabled (LCA_PARALLEL_WORKERS <= 0).
+
+    Jobs sent to it must be plain data: no DB session, no app context.
+    """
+    return _get_executor("analysis", max_workers)
+
+
+def reset_analysis_executor():
+    """
+    Drop the pool (e.g. after a worker crashed and the pool is broken).
+    """
+    _reset_executor("analysis")
+
+
+def get_chart_executor(max_workers=CHART_RENDER_WORKERS):
+    """
+    Return the process pool rendering PNG charts, or None when charts are
+    rendered in the calling thread (CHART_RENDER_WORKERS <= 0).
+    """
+    return _get_executor("chart", max_workers)
+
+
+def reset_chart_executor():
+    _reset_executor("chart")
+
+
+def reset_executors():
+    for name in list(_executors):
+        _reset_executor(name)
+
+
+atexit.register(reset_executors)
@@ -0,0 +1,215 @@
+import hashlib
+import logging
+import threading
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+from config import FACTOR_CACHE_MAX_ENTRIES, FACTOR_CACHE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Optional scipy: LU factors for dense A, sparse LU / LSQR for sparse A
+try:
+    import scipy.sparse as sp
+    from scipy.linalg import lu_factor, lu_solve
+    from scipy.sparse.linalg import splu, lsqr
+except ImportError:
+    sp = None
+
+
+def _is_sparse(M):
+    return sp is not None and sp.issparse(M)
+
+
+def _sparse_lstsq(A, final_demand):
+    """
+    Minimum-norm least-squares solution of A * s = f with LSQR.
+    """
+    return lsqr(A, final_demand, atol=1e-12, btol=1e-12, iter_lim=10 * max(A.shape))[0]
+
+
+def matrix_hash(A) -> str:
+    """
+    Content hash of a dense or sparse matrix (shape + values).
+    """
+    h = hashlib.blake2b(digest_size=16)
+
+    if _is_sparse(A):
+        A = A.tocsc()
+        A.sum_duplicates()
+        h.update(b"sparse")
+        h.update(np.asarray(A.shape, dtype=np.int64).tobytes())
+        for part in (A.indptr, A.indices, A.data.astype(np.float64)):
+            h.update(np.ascontiguousarray(part).tobytes())
+    else:
+        A = np.ascontiguousarray(A, dtype=np.float64)
+        h.update(b"dense")
+        h.update(np.asarray(A.shape, dtype=np.int64).tobytes())
+        h.update(A.tobytes())
+
+    return h.hexdigest()
+
+
+class Factorization:
+    """
+    Reusable solver for A * s = f.
+
+    kind:
+      - 'lu'          -> dense LU factors (scipy.linalg.lu_factor)
+      - 'inverse'     -> dense inverse (square A, scipy not installed)
+      - 'pinv'        -> dense pseudoinverse (non-square or singular A)
+      - 'sparse_lu'   -> scipy.sparse.linalg.splu
+      - 'sparse_lsqr' -> no factors, LSQR against the stored sparse A
+    """
+
+    def __init__(self, kind, payload, nbytes):
+        self.kind = kind
+        self.payload = payload
+        self.nbytes = nbytes
+
+    @classmethod
+    def build(cls, A):
+        if _is_sparse(A):
+            return cls._build_sparse(A)
+
+        A = np.asarray(A, dtype=float)
+
+        # Check if the matrix is square
+        if A.shape[0] == A.shape[1]:
+            # Square matrix: use standard solver
+            logger.debug("A is square (A.s = f). Factorizing A.")
+            try:
+                if sp is not None:
+                    # Singularity is detected below; silence scipy's LinAlgWarning
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("ignore")
+                        lu, piv = lu_factor(A, check_finite=True)
+                    if np.any(np.diag(lu) == 0):
+                        raise np.linalg.LinAlgError("Singular matrix")
+                    return cls('lu', (lu, piv), lu.nbytes + piv.nbytes)
+
+                inverse = np.linalg.inv(A)
+                return cls('inverse', inverse, inverse.nbytes)
+            except np.linalg.LinAlgError as e:
+                # Fallback to pseudoinverse if the square matrix is singular
+                logger.warning(f"Square matrix is singular ({e}). Falling back to pseudoinverse.")
+        else:
+            # Non-square matrix (overdetermined): use pseudoinverse for least-squares solution
+            logger.debug(f"A is non-square {A.shape}. Using pseudoinverse (A+).")
+
+        pinv = np.linalg.pinv(A)
+        return cls('pinv', pinv, pinv.nbytes)
+
+    @classmethod
+    def _build_sparse(cls, A):
+        A = A.tocsc()
+        sparse_nbytes = A.data.nbytes + A.indices.nbytes + A.indptr.nbytes
+
+        if A.shape[0] == A.shape[1]:
+            logger.debug("A is square and sparse (A.s = f). Using sparse LU.")
+            try:
+                lu = splu(A)
+                return cls('sparse_lu', lu, (lu.L.nnz + lu.U.nnz) * (A.data.itemsize + A.indices.itemsize))
+            except RuntimeError as e:
+                # splu raises RuntimeError for an exactly singular matrix
+                logger.warning(f"Sparse square matrix is singular ({e}). Falling back to least squares.")
+        else:
+            logger.debug(f"A is non-square and sparse {A.shape}. Using sparse least squares.")
+
+        return cls('sparse_lsqr', A, sparse_nbytes)
+
+    def solve(self, final_demand):
+        """
+        Solve for one demand vector (n,) or a stack of them (n, k).
+        """
+        final_demand = np.asarray(final_demand, dtype=float)
+
+        if self.kind == 'lu':
+            return lu_solve(self.payload, final_demand)
+        if self.kind in ('inverse', 'pinv'):
+            return np.dot(self.payload, final_demand)
+        if self.kind == 'sparse_lu':
+            return self.payload.solve(final_demand)
+
+        # sparse_lsqr: LSQR only takes one right-hand side
+        if final_demand.ndim == 1:
+            return _sparse_lstsq(self.payload, final_demand)
+        return np.column_stack([
+            _sparse_lstsq(self.payload, final_demand[:, j])
+            for j in range(final_demand.shape[1])
+        ])
+
+
+class FactorizationCache:
+    """
+    LRU cache of Factorization objects keyed by (task_id, hash of A).
+
+    Entries are evicted oldest-first once there are more than `max_entries`
+    of them or their factors use more than `max_bytes`. Because A's content
+    hash is part of the key, a changed datasheet can never hit stale factors;
+    `invalidate_task` only frees the memory of the old ones early.
+
+    The cache is per worker process.
+    """
+
+    def __init__(self, max_entries=FACTOR_CACHE_MAX_ENTRIES, max_bytes=FACTOR_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def get_or_build(self, task_id, A) -> Factorization:
+        if self.max_entries <= 0:
+            return Factorization.build(A)
+
+        key = (str(task_id), matrix_hash(A))
+
+        with self._lock:
+            factorization = self._entries.get(key)
+            if factorization is not None:
+                self._entries.move_to_end(key)
+                logger.info("Reusing cached factorization of A for task %s.", task_id)
+                return factorization
+
+        # Factorize outside the lock; a concurrent build of the same key is harmless
+        factorization = Factorization.build(A)
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = factorization
+                self._nbytes += factorization.nbytes
+            self._evict()
+
+        return factorization
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._nbytes > self.max_bytes
+        ):
+            _, factorization = self._entries.popitem(last=False)
+            self._nbytes -= factorization.nbytes
+
+    def invalidate_task(self, task_id):
+        """
+        Drop every cached factorization of a task.
+        """
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == str(task_id)]:
+                self._nbytes -= self._entries.pop(key).nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+
+factorization_cache = FactorizationCache()
+
+
+def invalidate_task_factorizations(task_id):
+    """
+    Called by the datasheet routes whenever the rows of a task change.
+    """
+    factorization_cache.invalidate_task(task_id)
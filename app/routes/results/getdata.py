@@ -1,32 +1,23 @@
 import pandas as pd
 import numpy as np
 import logging
+from sqlalchemy import String, cast, func
 from sqlalchemy.exc import SQLAlchemyError
 
 from app import db
 from app.models import Step, Datasheet, UOM, Element, Item, BElement
 from .Forest_growth_model import init_param_variable
+from .timing import traced
+from .diagnostics import snapshot
 
 logger = logging.getLogger(__name__)
 
 
-def get_all_processes(idt_param: int):
-    """
-    Return all distinct process names for the task, in DB order.
-    """
-    results = (
-        db.session.query(Step.SName)
-        .join(Datasheet, Datasheet.IDS == Step.IDS)
-        .filter(Datasheet.IDT == idt_param)
-        .distinct()
-        .all()
-    )
-    return [row[0] for row in results]
-
-
-def _get_base_task_data(idt_param: int) -> pd.DataFrame:
+@traced("db_fetch")
+def _get_base_task_data(idt_param: int, idds=None) -> pd.DataFrame:
     """
     Fetch all datasheet rows needed to build Matrix A and Matrix B.
+    With `idds`, only those rows of the task are fetched.
 
     Returned columns:
       - IDD
@@ -39,8 +30,9 @@ def _get_base_task_data(idt_param: int) -> pd.DataFrame:
       - CHK
       - IName     -> Item.IName
       - IDE       -> Element.IDE
+      - ManualAllocation
     """
-    results = (
+    query = (
         db.session.query(
             Datasheet.IDD.label("IDD"),
             Datasheet.IDT.label("IDT"),
@@ -52,6 +44,7 @@ def _get_base_task_data(idt_param: int) -> pd.DataFrame:
             UOM.Unit.label("UnitD"),
             Datasheet.CHK.label("CHK"),
             Item.IName.label("IName"),
+            Datasheet.ManualAllocation.label("ManualAllocation"),
         )
         .join(Element, Datasheet.IDE == Element.IDE)
         .join(BElement, Element.IDBE == BElement.IDBE)
@@ -59,14 +52,17 @@ def _get_base_task_data(idt_param: int) -> pd.DataFrame:
         .join(Step, Datasheet.IDS == Step.IDS)
         .join(UOM, Datasheet.IDU == UOM.IDU)
         .filter(Datasheet.IDT == idt_param)
-        .all()
     )
+    if idds is not None:
+        query = query.filter(Datasheet.IDD.in_(list(idds)))
+
+    results = query.all()
 
     if not results:
         return pd.DataFrame(
             columns=[
                 "IDD", "IDT", "IDE", "Flow_id", "Flow", "Process",
-                "ValueD", "UnitD", "CHK", "IName"
+                "ValueD", "UnitD", "CHK", "IName", "ManualAllocation"
             ]
         )
 
@@ -74,129 +70,109 @@ def _get_base_task_data(idt_param: int) -> pd.DataFrame:
         results,
         columns=[
             "IDD", "IDT", "IDE", "Flow_id", "Flow", "Process",
-            "ValueD", "UnitD", "CHK", "IName"
+            "ValueD", "UnitD", "CHK", "IName", "ManualAllocation"
         ]
     )
 
 
-def _build_output_process_map(df: pd.DataFrame) -> dict:
+def _produced_by_another_process(df: pd.DataFrame, process: pd.Series) -> np.ndarray:
     """
-    Build:
-        Flow_id -> set(process names where this flow is an OUTPUT)
-
-    Output rows are ONLY:
-      - Product
-      - Co-Products with CHK = 0
+    For every row, True if its Flow_id is an output (Product / Co-Products
+    with CHK = 0) of at least one process other than the row's own process.
     """
-    outputs_df = df.loc[
+    output_mask = (
         (df["IName"] == "Product") |
-        ((df["IName"] == "Co-Products") & (df["CHK"] == 0)),
-        ["Flow_id", "Process"]
-    ].drop_duplicates()
+        ((df["IName"] == "Co-Products") & (df["CHK"] == 0))
+    ) & df["Process"].notna()
+
+    outputs = pd.DataFrame({
+        "Flow_id": df.loc[output_mask, "Flow_id"],
+        "Process": process[output_mask],
+    }).drop_duplicates()
+
+    if outputs.empty:
+        return np.zeros(len(df), dtype=bool)
+
+    producer_count = (
+        df["Flow_id"]
+        .map(outputs.groupby("Flow_id")["Process"].nunique())
+        .fillna(0)
+        .to_numpy(dtype=int)
+    )
 
-    if outputs_df.empty:
-        return {}
+    own_process_is_producer = pd.MultiIndex.from_arrays(
+        [df["Flow_id"], process]
+    ).isin(pd.MultiIndex.from_frame(outputs))
 
-    return (
-        outputs_df.groupby("Flow_id")["Process"]
-        .apply(lambda s: set(str(x).strip() for x in s if pd.notna(x)))
-        .to_dict()
-    )
+    return producer_count > own_process_is_producer.astype(int)
 
 
-def _classify_rows(df: pd.DataFrame) -> pd.DataFrame:
+@traced("classification")
+def _classify_rows(df: pd.DataFrame, growth_regrowth=None) -> pd.DataFrame:
     """
     Classify each row into Matrix A or Matrix B and compute signed value.
 
     Business rules:
     - Product -> A, positive
     - Co-Products with CHK=0 -> A, negative
-    - Input Materials and Energy with Flow='Tree' -> A, negative
+    - Input Materials and Energy with Flow='Tree' -> A, negative (growth model only)
     - Input Materials and Energy that exists as output in ANOTHER process -> A, negative
     - Other Input Materials and Energy -> B, positive
     - Co-Products with CHK!=0 -> B, negative
     - Waste Treatment / Emission / Emissions -> B, positive
+
+    `growth_regrowth` is the user's regeneration mode; it is read from the
+    user's parameters only when not supplied.
     """
     if df.empty:
         out = df.copy()
         out["Matrix"] = pd.Series(dtype="object")
+        out["Sign"] = pd.Series(dtype="float64")
         out["Value_Final"] = pd.Series(dtype="float64")
         return out
 
-    output_process_map = _build_output_process_map(df)
-
-    matrix_list = []
-    value_list = []
-    params = init_param_variable()
-    growth_regrowth = params.get('regeneration_mode', 0)
-
-    for _, row in df.iterrows():
-        item = str(row["IName"]).strip() if pd.notna(row["IName"]) else ""
-        flow_name = str(row["Flow"]).strip() if pd.notna(row["Flow"]) else ""
-        flow_id = row["Flow_id"]
-        process = str(row["Process"]).strip() if pd.notna(row["Process"]) else ""
-        chk = row["CHK"] if pd.notna(row["CHK"]) else 0
-        value = float(row["ValueD"]) if pd.notna(row["ValueD"]) else 0.0
-
-        matrix = None
-        signed_value = None
-
-        # 1. Product -> A, positive
-        if item == "Product":
-            matrix = "A"
-            signed_value = value
-
-        # 2. Co-Products CHK=0 -> A, negative
-        elif item == "Co-Products" and chk == 0:
-            matrix = "A"
-            signed_value = value
-
-        # 3. Input Materials and Energy
-        elif item == "Input Materials and Energy":
-            # Special rule: Tree always in A, negative
-            if flow_name.lower() == "tree":
-                if growth_regrowth == 1:
-                    matrix = "A"
-                    signed_value = -value
-                
-            else:
-                producing_processes = output_process_map.get(flow_id, set())
-
-                # Input belongs to A only if same flow is output in another process
-                if any(prod_process != process for prod_process in producing_processes):
-                    matrix = "A"
-                    signed_value = -value
-                else:
-                    matrix = "B"
-                    signed_value = value
-
-        # 4. Co-Products CHK!=0 -> B, negative
-        elif item == "Co-Products" and chk != 0:
-            matrix = "B"
-            signed_value = -value
-
-        # 5. Waste / Emissions -> B, positive
-        elif item in ["Waste Treatment", "Emission", "Emissions"]:
-            matrix = "B"
-            signed_value = value
-
-        matrix_list.append(matrix)
-        value_list.append(signed_value)
+    if growth_regrowth is None:
+        growth_regrowth = init_param_variable().get('regeneration_mode', 0)
+
+    item = df["IName"].fillna("").astype(str).str.strip()
+    flow_name = df["Flow"].fillna("").astype(str).str.strip().str.lower()
+    process = df["Process"].fillna("").astype(str).str.strip()
+    chk = df["CHK"].fillna(0)
+    value = pd.to_numeric(df["ValueD"], errors="coerce").fillna(0.0).to_numpy(dtype=float)
+
+    is_input = (item == "Input Materials and Energy").to_numpy()
+    is_tree = (flow_name == "tree").to_numpy()
+    is_coproduct = (item == "Co-Products").to_numpy()
+    chk_zero = (chk == 0).to_numpy()
+
+    conditions = [
+        (item == "Product").to_numpy(),
+        is_coproduct & chk_zero,
+        is_input & is_tree & (growth_regrowth == 1),
+        is_input & is_tree,
+        is_input & _produced_by_another_process(df, process),
+        is_input,
+        is_coproduct & ~chk_zero,
+        item.isin(["Waste Treatment", "Emission", "Emissions"]).to_numpy(),
+    ]
+    matrices = ["A", "A", "A", "", "A", "B", "B", "B"]
+    signs = [1.0, 1.0, -1.0, 0.0, -1.0, 1.0, -1.0, 1.0]
+
+    matrix = np.select(conditions, matrices, default="")
+    sign = np.select(conditions, signs, default=0.0)
 
     out = df.copy()
-    out["Matrix"] = matrix_list
-    out["Value_Final"] = value_list
+    out["Matrix"] = matrix
+    out["Sign"] = sign
+    out["Value_Final"] = sign * value
 
     # Keep only classified rows
-    out = out[out["Matrix"].notna()].copy()
-
-    logger.warning(
-        "Classified rows:\n%s",
-        out[[
-            "IDD", "IDE", "Flow_id", "Flow", "Process", "IName",
-            "CHK", "ValueD", "Matrix", "Value_Final"
-        ]].to_string(index=False)
-    )
+    out = out[out["Matrix"] != ""].copy()
+
+    snapshot("classified_rows", lambda: out[[
+        "IDD", "IDE", "Flow_id", "Flow", "Process", "IName",
+        "CHK", "ValueD", "Matrix", "Value_Final"
+    ]].reset_index(drop=True))
 
     return out
 
@@ -234,6 +210,7 @@ def _choose_unit_per_flow(df: pd.DataFrame) -> pd.DataFrame:
     return unit_df
 
 
+@traced("pivot")
 def _pivot_matrix(df_matrix: pd.DataFrame, all_processes: list[str]) -> pd.DataFrame:
     """
     Pivot a classified matrix dataframe to:
@@ -266,67 +243,112 @@ def _pivot_matrix(df_matrix: pd.DataFrame, all_processes: list[str]) -> pd.DataF
     return result
 
 
-def get_matrix_a(idt_param: int):
+def _processes_in_order(df: pd.DataFrame) -> list[str]:
     """
-    Build Matrix A for a task.
+    Distinct process names of the task, in order of first appearance.
+
+    Only processes with at least one fully joined row (element, flow, item,
+    step and unit) are listed; a process without any would be an all-zero
+    column of A.
+    """
+    if df.empty:
+        return []
+    return df["Process"].drop_duplicates().tolist()
+
+
+def build_task_matrices(idt_param: int, growth_regrowth=None):
+    """
+    Build Matrix A and Matrix B for a task from one datasheet query.
+
+    The joined rows are fetched and classified once, then both matrices are
+    pivoted from the same frame so they share the same process-column order.
+    `growth_regrowth` is forwarded to _classify_rows.
+
+    Returns:
+        tuple: (matrix_a, matrix_b), each
+            Flow | Flow_id | Unit | Process_1 | Process_2 | ...
     """
     try:
-        all_processes = get_all_processes(idt_param)
         base_df = _get_base_task_data(idt_param)
+        all_processes = _processes_in_order(base_df)
 
         if base_df.empty:
             cols = ["Flow", "Flow_id", "Unit"] + all_processes
-            return pd.DataFrame(columns=cols)
+            return pd.DataFrame(columns=cols), pd.DataFrame(columns=cols)
 
-        classified = _classify_rows(base_df)
-        df_a = classified[classified["Matrix"] == "A"].copy()
+        classified = _classify_rows(base_df, growth_regrowth)
 
-        result = _pivot_matrix(df_a, all_processes)
+        matrix_a = _pivot_matrix(classified[classified["Matrix"] == "A"].copy(), all_processes)
+        matrix_b = _pivot_matrix(classified[classified["Matrix"] == "B"].copy(), all_processes)
 
-        logger.info("Matrix A:\n%s", result.to_string(index=False))
-        logger.info("Matrix A shape: %s", result.shape)
+        logger.info("Matrix A shape: %s", matrix_a.shape)
+        logger.info("Matrix B shape: %s", matrix_b.shape)
+        snapshot("matrix_a", matrix_a, task_id=idt_param)
+        snapshot("matrix_b", matrix_b, task_id=idt_param)
 
-        return result
+        return matrix_a, matrix_b
 
     except SQLAlchemyError as e:
-        logger.exception("SQLAlchemy error in get_matrix_a for IDT=%s: %s", idt_param, e)
+        logger.exception("SQLAlchemy error in build_task_matrices for IDT=%s: %s", idt_param, e)
         db.session.rollback()
-        return pd.DataFrame()
+        return pd.DataFrame(), pd.DataFrame()
 
     except Exception as e:
-        logger.exception("Unexpected error in get_matrix_a for IDT=%s: %s", idt_param, e)
+        logger.exception("Unexpected error in build_task_matrices for IDT=%s: %s", idt_param, e)
         db.session.rollback()
-        return pd.DataFrame()
+        return pd.DataFrame(), pd.DataFrame()
 
 
-def get_matrix_b(idt_param: int):
+def get_datasheet_versions(task_ids) -> dict:
     """
-    Build Matrix B for a task.
+    Datasheet version of each task: (max UpdateDate, row count, max IDD,
+    names checksum). Edits move UpdateDate; inserts and deletes move the
+    count or max IDD. The checksum covers the joined flow, item, step and
+    unit names of the rows, so renaming an element, step or unit (tables
+    without an update date) changes the version too.
+    One grouped query for all tasks.
     """
-    try:
-        all_processes = get_all_processes(idt_param)
-        base_df = _get_base_task_data(idt_param)
+    task_ids = sorted({int(t) for t in task_ids})
+    if not task_ids:
+        return {}
 
-        if base_df.empty:
-            cols = ["Flow", "Flow_id", "Unit"] + all_processes
-            return pd.DataFrame(columns=cols)
+    names = cast(Element.IDBE, String)
+    for column in (BElement.EName, Item.IName, Step.SName, UOM.Unit):
+        names = names + "|" + func.coalesce(column, "")
 
-        classified = _classify_rows(base_df)
-        df_b = classified[classified["Matrix"] == "B"].copy()
+    rows = (
+        db.session.query(
+            Datasheet.IDT,
+            func.max(Datasheet.UpdateDate),
+            func.count(Datasheet.IDD),
+            func.max(Datasheet.IDD),
+            func.sum(func.crc32(func.coalesce(names, "")))
+        )
+        .outerjoin(Element, Datasheet.IDE == Element.IDE)
+        .outerjoin(BElement, Element.IDBE == BElement.IDBE)
+        .outerjoin(Item, Element.IDI == Item.IDI)
+        .outerjoin(Step, Datasheet.IDS == Step.IDS)
+        .outerjoin(UOM, Datasheet.IDU == UOM.IDU)
+        .filter(Datasheet.IDT.in_(task_ids))
+        .group_by(Datasheet.IDT)
+        .all()
+    )
 
-        result = _pivot_matrix(df_b, all_processes)
+    versions = {task_id: (None, 0, None, None) for task_id in task_ids}
+    for idt, updated, count, max_idd, names_checksum in rows:
+        versions[idt] = (str(updated), int(count), max_idd, str(names_checksum))
+    return versions
 
-        logger.info("Matrix B:\n%s", result.to_string(index=False))
-        logger.info("Matrix B shape: %s", result.shape)
 
-        return result
+def get_matrix_a(idt_param: int):
+    """
+    Build Matrix A for a task.
+    """
+    return build_task_matrices(idt_param)[0]
 
-    except SQLAlchemyError as e:
-        logger.exception("SQLAlchemy error in get_matrix_b for IDT=%s: %s", idt_param, e)
-        db.session.rollback()
-        return pd.DataFrame()
 
-    except Exception as e:
-        logger.exception("Unexpected error in get_matrix_b for IDT=%s: %s", idt_param, e)
-        db.session.rollback()
-        return pd.DataFrame()
\ No newline at end of file
+def get_matrix_b(idt_param: int):
+    """
+    Build Matrix B for a task.
+    """
+    return build_task_matrices(idt_param)[1]
@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from config import ANALYSIS_JOB_WORKERS, ANALYSIS_JOB_TTL
+from .result_store import get_result_store, make_result_key
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Task part of job keys in the result store (never a task id, so
+# delete_task leaves jobs alone)
+JOB_KEY_TASK = "job"
+
+
+class AnalysisJob:
+    """
+    One background run of run_analysis and its per-row progress.
+    """
+
+    def __init__(self, owner, rows):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.task_names = [row.get('taskText', 'Unknown Task') for row in rows]
+        self.row_status = [JOB_QUEUED] * len(rows)
+        self.status = JOB_QUEUED
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.updated_at = None
+
+    @property
+    def rows_done(self) -> int:
+        return sum(status in (JOB_DONE, JOB_FAILED) for status in self.row_status)
+
+    @property
+    def key(self) -> str:
+        return make_result_key(self.owner, JOB_KEY_TASK, self.id)
+
+    def mark_row(self, i, result):
+        self.row_status[i] = JOB_FAILED if "error" in result else JOB_DONE
+
+    def to_record(self) -> dict:
+        """
+        JSON-serializable state of the job, as kept in the result store.
+        """
+        self.updated_at = time.time()
+        return dict(vars(self))
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls.__new__(cls)
+        vars(job).update(record)
+        return job
+
+    def to_status(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "rows_total": len(self.row_status),
+            "rows_done": self.rows_done,
+            "rows": [
+                {"task_name": name, "status": status}
+                for name, status in zip(self.task_names, self.row_status)
+            ],
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class AnalysisJobManager:
+    """
+    Job queue for run_analysis.
+
+    Jobs run on a small thread pool of the worker that accepted them, inside
+    an app context of their own. Their status and result are written to the
+    shared result store on every change, so any worker can answer a poll and
+    finished results survive a worker restart. Finished jobs are kept for
+    `ttl` seconds; a job whose record has not changed for `ttl` seconds
+    before finishing (e.g. its worker was restarted) is reported as failed.
+    """
+
+    def __init__(self, max_workers=ANALYSIS_JOB_WORKERS, ttl=ANALYSIS_JOB_TTL, store=None):
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self._store = store
+        self._lock = threading.Lock()
+        self._executor = None
+
+    @property
+    def store(self):
+        return self._store or get_result_store()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="analysis-job"
+            )
+        return self._executor
+
+    def submit(self, app, owner, rows, params, run):
+        """
+        Queue `run(rows, params=..., progress=..., user=owner)` and return the job.
+        """
+        job = AnalysisJob(owner, rows)
+        self._save(job)
+
+        with self._lock:
+            executor = self._get_executor()
+
+        executor.submit(self._run, app, job, rows, params, run)
+        return job
+
+    def _save(self, job):
+        try:
+            self.store.set(job.key, job.to_record())
+        except Exception as e:
+            logger.error("Cannot store analysis job %s: %s", job.id, e)
+
+    def _run(self, app, job, rows, params, run):
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        job.row_status = [JOB_RUNNING] * len(rows)
+        self._save(job)
+
+        def progress(i, result):
+            job.mark_row(i, result)
+            self._save(job)
+
+        try:
+            with app.app_context():
+                job.result = run(rows, params=params, progress=progress, user=job.owner)
+            job.status = JOB_DONE
+        except Exception as e:
+            logger.error("Analysis job %s failed: %s", job.id, e, exc_info=True)
+            job.error = str(e)
+            job.status = JOB_FAILED
+        finally:
+            job.finished_at = time.time()
+            self._save(job)
+
+    def get(self, job_id, owner):
+        """
+        Return the job if it exists, has not expired and belongs to `owner`.
+        """
+        key = make_result_key(owner, JOB_KEY_TASK, job_id)
+        try:
+            record = self.store.get(key)
+        except Exception as e:
+            logger.error("Cannot read analysis job %s: %s", job_id, e)
+            return None
+
+        if record is None:
+            return None
+
+        job = AnalysisJob.from_record(record)
+        if job.owner != owner:
+            return None
+
+        now = time.time()
+        if job.finished_at is not None and now - job.finished_at > self.ttl:
+            self.store.delete(key)
+            return None
+
+        if job.finished_at is None and job.updated_at is not None and now - job.updated_at > self.ttl:
+            job.status = JOB_FAILED
+            job.error = "Job was interrupted"
+            job.finished_at = now
+            self._save(job)
+        return job
+
+
+analysis_jobs = AnalysisJobManager()
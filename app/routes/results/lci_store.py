@@ -0,0 +1,237 @@
+import logging
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import String, cast, func
+
+from app import db
+from app.models import LCI
+from config import LCI_STORE_CHECK_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+# Impact category columns of models.LCI, in matrix column order
+LCI_CATEGORIES = (
+    'GWP',
+    'Smog',
+    'Acidification',
+    'Eutrophication',
+    'Carcinogenics',
+    'Non_carcinogenics',
+    'Respiratory_effects',
+    'Ecotoxicity',
+    'Fossil_fuel_depletion',
+    'Ozone_depletion',
+)
+
+
+def normalize_category(category) -> str:
+    """
+    Map UI labels such as 'Non carcinogenics' to the LCI column name.
+    """
+    return str(category).strip().replace(' ', '_')
+
+
+class LCIFactorStore:
+    """
+    Process-wide in-memory copy of the `lci` table.
+
+    The table is held as a dense float64 matrix (background process x category)
+    plus two index maps:
+      - Background_process -> row
+      - category           -> column
+
+    The store is loaded once and shared by every request of the worker. An
+    aggregate checksum of the table rows is re-checked at most every
+    `check_interval` seconds; the matrix is only reloaded when the fingerprint
+    changes, and `version` is incremented on every reload. `fingerprint` is
+    the checksum of the loaded table, the same in every worker for the same
+    content.
+    """
+
+    def __init__(self, check_interval=LCI_STORE_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.category_index = {name: i for i, name in enumerate(LCI_CATEGORIES)}
+
+        # (factors, process_index, version, fingerprint) is swapped as one
+        # tuple so readers never see a matrix and an index from different loads.
+        self._snapshot = (np.zeros((0, len(LCI_CATEGORIES)), dtype=np.float64), {}, 0, None)
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> int:
+        return self._snapshot[2]
+
+    @property
+    def fingerprint(self):
+        return self._snapshot[3]
+
+    def _table_fingerprint(self):
+        """
+        Row count plus the sum and XOR of a CRC32 per row, over the text of
+        every column. Any change to a row (including factors swapped between
+        processes or edits that cancel out in a column sum) changes its CRC.
+        Computed by the DB server; returns a single row.
+        """
+        row_text = LCI.Background_process + "|" + LCI.Code
+        for name in LCI_CATEGORIES:
+            row_text = row_text + "|" + func.coalesce(cast(getattr(LCI, name), String), "")
+        row_crc = func.crc32(row_text)
+
+        row = db.session.query(
+            func.count(),
+            func.sum(row_crc),
+            func.bit_xor(row_crc)
+        ).one()
+        return tuple(str(v) for v in row)
+
+    def _load(self):
+        rows = (
+            db.session.query(
+                LCI.Background_process,
+                *[getattr(LCI, name) for name in LCI_CATEGORIES]
+            )
+            .order_by(LCI.Background_process, LCI.Code)
+            .all()
+        )
+
+        factors = np.full((len(rows), len(LCI_CATEGORIES)), np.nan, dtype=np.float64)
+        process_index = {}
+
+        for row in rows:
+            name = row[0]
+            if name in process_index:
+                logger.warning("Duplicate LCI entry for '%s'. Keeping the first one.", name)
+                continue
+
+            i = len(process_index)
+            process_index[name] = i
+            factors[i] = [float(v) if v is not None else np.nan for v in row[1:]]
+
+        return factors[:len(process_index)], process_index
+
+    def refresh(self, force=False):
+        """
+        Reload the matrix if the `lci` table changed since the last load.
+        Within `check_interval` seconds of the last check this is a no-op.
+        """
+        if not force and self._is_fresh():
+            return
+
+        with self._lock:
+            if not force and self._is_fresh():
+                return
+
+            fingerprint = self._table_fingerprint()
+
+            if force or fingerprint != self.fingerprint:
+                factors, process_index = self._load()
+                self._snapshot = (factors, process_index, self.version + 1, fingerprint)
+                logger.info(
+                    "LCI factor store loaded %s background processes (version %s).",
+                    len(process_index), self.version
+                )
+
+            self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        """
+        Force a fingerprint check on the next access.
+        """
+        self._checked_at = None
+
+    def subset(self, flows) -> "LCIFactorStore":
+        """
+        Detached copy holding only `flows`, for use outside the app context
+        (e.g. in a worker process). It never reloads from the database.
+        """
+        factors, process_index, version, fingerprint = self._snapshot
+        names = [flow for flow in dict.fromkeys(flows) if flow in process_index]
+
+        store = LCIFactorStore(check_interval=float("inf"))
+        store._snapshot = (
+            factors[[process_index[name] for name in names]].reshape(len(names), factors.shape[1]),
+            {name: i for i, name in enumerate(names)},
+            version,
+            fingerprint
+        )
+        store._checked_at = float("inf")
+        return store
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._checked_at is not None
+            and time.monotonic() - self._checked_at < self.check_interval
+        )
+
+    def get(self, flow: str, category: str):
+        """
+        Return one LCI value, or None if the flow, category or value is missing.
+        """
+        factors, process_index = self._snapshot[:2]
+
+        row = process_index.get(flow)
+        col = self.category_index.get(normalize_category(category))
+        if row is None or col is None:
+            return None
+
+        value = factors[row, col]
+        return None if np.isnan(value) else float(value)
+
+    def vector(self, flows, category: str) -> np.ndarray:
+        """
+        Return the LCI vector for `category` aligned with `flows`.
+        Missing flows and NULL values are returned as 0.0.
+        """
+        return self.matrix(flows, (category,))[0]
+
+    def matrix(self, flows, categories=LCI_CATEGORIES) -> np.ndarray:
+        """
+        Return the characterization matrix C (categories x flows) aligned with
+        `flows`. Missing flows and NULL values are returned as 0.0.
+        """
+        categories = [normalize_category(c) for c in categories]
+        unknown = [c for c in categories if c not in self.category_index]
+        if unknown:
+            raise ValueError(f"Category '{unknown[0]}' not found.")
+
+        factors, process_index = self._snapshot[:2]
+        cols = [self.category_index[c] for c in categories]
+
+        rows = np.array([process_index.get(flow, -1) for flow in flows], dtype=np.intp)
+        found = rows >= 0
+
+        C = np.zeros((len(cols), len(rows)), dtype=np.float64)
+        C[:, found] = factors[np.ix_(rows[found], cols)].T
+
+        missing = [flow for flow, ok in zip(flows, found) if not ok]
+        if missing:
+            logger.warning(
+                "No LCI value found for flows %s in categories %s. Assuming 0.",
+                missing, list(categories)
+            )
+
+        return np.nan_to_num(C, nan=0.0)
+
+
+lci_store = LCIFactorStore()
+
+
+def get_lci_store() -> LCIFactorStore:
+    """
+    Return the shared LCI factor store, refreshed if the table changed.
+    """
+    lci_store.refresh()
+    return lci_store
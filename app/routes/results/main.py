@@ -1,27 +1,45 @@
 import numpy as np
 import pandas as pd
 import logging
+import json
+from concurrent.futures.process import BrokenProcessPool
 
 logger = logging.getLogger(__name__)
 
 from .import_rawdata import import_matrix_b, format_rawdata_a
+from .matrix_cache import get_task_matrices, get_cached_task_rows
 from .calculate import (
     calculate_impact_score,
     calculate_inventory_impact,
     calculate_scaling_vector,
-    diagonal_vector,
     calculate_inventory_matrix,
-    calculate_process_contribution
+    calculate_scaled_contribution,
+    calculate_category_impacts,
+    select_matrix_backend,
+    to_backend
 )
-from .multifunctionality import adjust_matrix_for_multiple_outputs, ManualAllocationRequired
-from .create_graph import create_graph, create_graph_wt
+from .multifunctionality import adjust_matrix_for_multiple_outputs, ManualAllocationRequired, AllocationOutputs
+from .create_graph import chart_series
+from .chart_renderer import chart_job, render_jobs
 from .Forest_growth_model import forest_growth_newA, forest_growth_function, init_param_variable
 from .unit_conversion import unit_conversion, get_si_unit
+from .lci_store import LCI_CATEGORIES, get_lci_store
+from .executor import get_analysis_executor, reset_analysis_executor
+from .result_store import get_result_store, make_result_key, analysis_hash, key_owner
+from .analysis_cache import analysis_cache
+from .timing import analysis_trace, stage, tracing, merge_records
+from .diagnostics import diagnostics_session, snapshot, capturing, merge_snapshots
+from flask import has_request_context, session
 
 import matplotlib
 matplotlib.use('Agg')
 
-graph_data = {}
+# impact_category value selecting every TRACI category in one pass
+ALL_IMPACT_CATEGORIES = "ALL"
+
+# Chart outputs: base64 PNG (report export) or series drawn by the browser
+CHART_OUTPUT_PNG = "png"
+CHART_OUTPUT_SERIES = "series"
 
 
 def build_b_alignment(adjusted_B: pd.DataFrame):
@@ -33,14 +51,11 @@ def build_b_alignment(adjusted_B: pd.DataFrame):
     b_meta["Flow"] = b_meta["Flow"].astype(str).str.strip()
     b_meta["Flow_id"] = b_meta["Flow_id"].astype(str).str.strip()
 
-    logger.warning(
-        "Adjusted B with labels:\n%s",
-        pd.concat(
-            [adjusted_B.iloc[:, :3].reset_index(drop=True),
-             adjusted_B.iloc[:, 3:].reset_index(drop=True)],
-            axis=1
-        ).to_string()
-    )
+    snapshot("adjusted_B_labels", lambda: pd.concat(
+        [adjusted_B.iloc[:, :3].reset_index(drop=True),
+         adjusted_B.iloc[:, 3:].reset_index(drop=True)],
+        axis=1
+    ))
 
     adjusted_B_numeric = adjusted_B.iloc[:, 3:].copy()
     adjusted_B_np = np.nan_to_num(np.array(adjusted_B_numeric, dtype=float), nan=0.0)
@@ -52,383 +67,785 @@ def get_lci_flow_labels(b_meta: pd.DataFrame):
     return b_meta["Flow"].astype(str).reset_index(drop=True)
 
 
-def run_analysis(rows):
-    results = []
-    all_contributions_data = []
+def build_inventory_matrix_payload(G, lci_flow, process_names):
+    """
+    JSON form of the scaled inventory matrix G = B.diag(s) (flows x processes).
+    Only built when a row sets `include_inventory`.
+    """
+    values = G.toarray() if hasattr(G, "toarray") else np.asarray(G, dtype=float)
 
-    logger.warning("--- STARTING run_analysis ---")
+    return {
+        "flows": [str(f) for f in lci_flow],
+        "processes": [str(p) for p in np.array(process_names).flatten()],
+        "values": values.tolist()
+    }
 
-    for i, row in enumerate(rows):
-        task_text = row.get('taskText', 'Unknown Task')
-        logger.warning("--- Processing Row %s (%s) ---", i + 1, task_text)
 
-        try:
-            params = init_param_variable()
-            growth_regrowth = params.get('regeneration_mode', 0)
-
-            task_id = row.get('task')
-            functional_unit = row.get('functional_unit', 1.0)
-            flow = row.get('flow')
-            flow_text = row.get('flowText')
-            flow_unit = row.get('unit')
-            unit_text = row.get('unitText')
-            impact_category = row.get('impact_category', 'GWP')
-            manual_allocation = row.get('manual_allocation', {})
-
-            logger.warning(
-                "Input:\n Task: %s, Flow: %s, Functional unit: %s, Unit: %s, Impact category: %s",
-                task_id, flow, functional_unit, flow_unit, impact_category
-            )
+def build_all_categories_result(
+    task_id, task_text, flow_text, functional_unit, unit_text,
+    functional_unit_si, functional_unit_si_unit, categories,
+    total_impacts, process_names, contribution_cube
+):
+    """
+    Result row for impact_category == 'ALL'.
 
-            try:
-                functional_unit = float(functional_unit)
-            except (ValueError, TypeError):
-                logger.error(
-                    "Task %s: Invalid functional unit '%s'; defaulting to 1.0",
-                    task_id, functional_unit
-                )
-                functional_unit = 1.0
+    Holds one total per category and a category x process contribution cube
+    instead of a single score and contribution vector.
+    """
+    flow_label = str(flow_text).strip() if flow_text is not None else ""
 
-            try:
-                task_id = int(task_id)
-            except (ValueError, TypeError):
-                logger.error("Invalid task_id '%s'; skipping this row", task_id)
-                results.append({
-                    "error": f"Invalid task id: {task_id}",
-                    "task_name": task_text
-                })
-                continue
+    contribution_table = [
+        {"Process": process, **{
+            category: float(contribution_cube[k, j])
+            for k, category in enumerate(categories)
+        }}
+        for j, process in enumerate(process_names)
+    ]
 
-            # ---------------------------------------------------------
-            # 1. Import data
-            # ---------------------------------------------------------
-            A_raw = format_rawdata_a(task_id, A='A')
-            B_raw = import_matrix_b(task_id, sort='yes')
+    return {
+        "task_id": task_id,
+        "task_name": task_text,
+        "flow_name": flow_label,
+        "entered_value": functional_unit,
+        "entered_unit": unit_text,
+        "calculation_value_si": functional_unit_si,
+        "calculation_unit_si": functional_unit_si_unit,
+        "product": f"{functional_unit} {unit_text} {str(flow_text).strip()}",
+        "impact_category": ALL_IMPACT_CATEGORIES,
+        "impact_categories": categories,
+        "total_impact": None,
+        "total_impacts": {
+            category: float(total_impacts[k]) for k, category in enumerate(categories)
+        },
+        "contribution_cube": {
+            "categories": categories,
+            "processes": [str(p) for p in process_names],
+            "values": contribution_cube.tolist()
+        },
+        "chart_base64": None,
+        "chart_note": "Charts are available per impact category.",
+        "contribution_table": contribution_table
+    }
 
-            logger.warning("B_raw with labels:\n%s", B_raw.to_string())
 
-            if A_raw is None or getattr(A_raw, "empty", True):
-                results.append({
-                    "error": "Matrix A is empty or could not be loaded.",
-                    "task_name": task_text
-                })
-                continue
+def parse_flag(value) -> bool:
+    """
+    Read a boolean row flag sent as a bool, number or string ("false", "0").
+    """
+    return str(value).strip().lower() in ("1", "true", "yes")
 
-            if B_raw is None or getattr(B_raw, "empty", True):
-                results.append({
-                    "error": "Matrix B is empty or could not be loaded.",
-                    "task_name": task_text
-                })
-                continue
 
-            # Force B process order to follow A
-            a_process_cols = A_raw.columns.tolist()[3:]
-            b_fixed_cols = B_raw.columns.tolist()[:3]
+def chart_output(value):
+    """
+    Normalize a `render_charts` flag: "series", True (PNG) or False.
+    """
+    if str(value).strip().lower() == CHART_OUTPUT_SERIES:
+        return CHART_OUTPUT_SERIES
+    return bool(value)
 
-            missing_in_b = [c for c in a_process_cols if c not in B_raw.columns]
-            if missing_in_b:
-                raise ValueError(f"Matrix B is missing process columns present in A: {missing_in_b}")
 
-            B_raw = B_raw[b_fixed_cols + a_process_cols]
+class AnalysisRowError(Exception):
+    """
+    Error reported as the result of an analysis row instead of aborting the run.
+    """
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
 
-            if growth_regrowth == 1:
-                value_B, value_A = forest_growth_function(task_id)
-                A_raw = forest_growth_newA(A_raw, value_A, 'A')
-                B_raw = forest_growth_newA(B_raw, value_B, 'B')
-            else:
-                logger.warning("Growth/regrowth model disabled.")
 
-            logger.warning("Shape: %s\nMatrix A:\n%s", A_raw.shape, A_raw.to_string())
-            logger.warning("Shape: %s\nMatrix B:\n%s", B_raw.shape, B_raw.to_string())
+def parse_analysis_row(row):
+    """
+    Read and validate the inputs of one /graph_results row.
+    """
+    task_id = row.get('task')
+    functional_unit = row.get('functional_unit', 1.0)
+
+    spec = {
+        "task_text": row.get('taskText', 'Unknown Task'),
+        "flow": row.get('flow'),
+        "flow_text": row.get('flowText'),
+        "flow_unit": row.get('unit'),
+        "unit_text": row.get('unitText'),
+        "impact_category": row.get('impact_category', 'GWP'),
+        "manual_allocation": row.get('manual_allocation', {}),
+        "backend": row.get('backend'),
+        "include_inventory": parse_flag(row.get('include_inventory', False)),
+    }
 
-            # ---------------------------------------------------------
-            # 2. Multifunctionality
-            # ---------------------------------------------------------
-            try:
-                adjusted_A, adjusted_B = adjust_matrix_for_multiple_outputs(
-                    A_raw,
-                    B_raw,
-                    manual_allocation=manual_allocation,
-                    task_id=task_id
-                )
-            except ManualAllocationRequired as e:
-                logger.error(
-                    "Manual allocation missing in database for task %s. %s",
-                    task_text,
-                    e.message
-                )
-                results.append({
-                    "error": "Manual allocation missing in datasheet. Please configure allocation before running analysis.",
-                    "task_name": task_text
-                })
-                continue
-            except Exception as e:
-                logger.error(
-                    "Error during matrix adjustment for task %s: %s",
-                    task_text, str(e), exc_info=True
-                )
-                results.append({
-                    "error": f"Error adjusting matrices: {str(e)}",
-                    "task_name": task_text
-                })
-                continue
+    logger.debug(
+        "Input:\n Task: %s, Flow: %s, Functional unit: %s, Unit: %s, Impact category: %s",
+        task_id, spec["flow"], functional_unit, spec["flow_unit"], spec["impact_category"]
+    )
 
-            adjusted_A = pd.DataFrame(adjusted_A)
-            adjusted_B = pd.DataFrame(adjusted_B)
+    try:
+        functional_unit = float(functional_unit)
+    except (ValueError, TypeError):
+        logger.error(
+            "Task %s: Invalid functional unit '%s'; defaulting to 1.0",
+            task_id, functional_unit
+        )
+        functional_unit = 1.0
 
-            logger.warning("Adjusted A:\n%s", adjusted_A.to_string())
-            logger.warning("Adjusted B:\n%s", adjusted_B.to_string())
+    try:
+        task_id = int(task_id)
+    except (ValueError, TypeError):
+        logger.error("Invalid task_id '%s'; skipping this row", task_id)
+        raise AnalysisRowError(f"Invalid task id: {task_id}")
 
-            # ---------------------------------------------------------
-            # 3. Build aligned B + LCI labels
-            # ---------------------------------------------------------
-            b_meta, adjusted_B_np = build_b_alignment(adjusted_B)
-            lci_flow = get_lci_flow_labels(b_meta)
+    spec["task_id"] = task_id
+    spec["functional_unit"] = functional_unit
+    return spec
 
-            logger.warning("Aligned LCI flow: %s", list(lci_flow))
 
-            # ---------------------------------------------------------
-            # 4. Functional unit to SI
-            # ---------------------------------------------------------
-            try:
-                functional_unit_si = unit_conversion(functional_unit, unit_text, 'SI')
-                functional_unit_si_unit = get_si_unit(unit_text)
-            except Exception as e:
-                logger.error(
-                    "Unit conversion failed for task %s: %s",
-                    task_text, e, exc_info=True
-                )
-                results.append({
-                    "error": f"Unit conversion failed: {str(e)}",
-                    "task_name": task_text
-                })
-                continue
+def task_group_key(spec):
+    """
+    Rows with the same key share A, B and one factorization of A.
+    """
+    allocation = json.dumps(spec["manual_allocation"] or {}, sort_keys=True, default=str)
+    return spec["task_id"], allocation, str(spec["backend"] or "")
+
+
+def build_task_model(task_id, task_text, growth_regrowth, manual_allocation, backend_request, params=None):
+    """
+    Steps 1-3 and 6 of the analysis: load, allocate and align A and B for a
+    task. Everything returned is independent of the final demand.
+    `params` are the user's analysis parameters (growth model inputs).
+    """
+    # ---------------------------------------------------------
+    # 1. Import data
+    # ---------------------------------------------------------
+    with stage("matrices", task_id=task_id):
+        matrix_a, matrix_b = get_task_matrices(task_id, growth_regrowth)
+        A_raw = format_rawdata_a(task_id, A='A', matrix_a=matrix_a)
+        B_raw = import_matrix_b(task_id, sort='yes', matrix_b=matrix_b)
+
+        # Allocation outputs from the rows the matrices were built from
+        task_rows = get_cached_task_rows(task_id)
+        outputs = AllocationOutputs.from_frame(task_rows) if task_rows is not None else None
+
+    snapshot("B_raw", B_raw, task_id=task_id)
+
+    if A_raw is None or getattr(A_raw, "empty", True):
+        raise AnalysisRowError("Matrix A is empty or could not be loaded.")
+
+    if B_raw is None or getattr(B_raw, "empty", True):
+        raise AnalysisRowError("Matrix B is empty or could not be loaded.")
 
-            # ---------------------------------------------------------
-            # 5. Final demand vector
-            # ---------------------------------------------------------
-            selected_flow_id = str(flow).strip()
+    if growth_regrowth == 1:
+        value_B, value_A = forest_growth_function(task_id, params)
+        A_raw = forest_growth_newA(A_raw, value_A, 'A')
+        B_raw = forest_growth_newA(B_raw, value_B, 'B')
+    else:
+        logger.debug("Growth/regrowth model disabled.")
 
-            flow_names = adjusted_A.iloc[:, :3].copy()
-            flow_names.columns = ['flow', 'flow ID', 'unit']
-            flow_names['flow ID'] = flow_names['flow ID'].astype(str)
+    logger.info("Task %s: A %s, B %s.", task_id, A_raw.shape, B_raw.shape)
+    snapshot("A", A_raw, task_id=task_id)
+    snapshot("B", B_raw, task_id=task_id)
 
-            flow_names['Amount'] = np.where(
-                flow_names['flow ID'] == selected_flow_id,
-                float(functional_unit_si),
-                0.0
+    # ---------------------------------------------------------
+    # 2. Multifunctionality
+    # ---------------------------------------------------------
+    try:
+        with stage("multifunctionality", task_id=task_id):
+            adjusted_A, adjusted_B = adjust_matrix_for_multiple_outputs(
+                A_raw,
+                B_raw,
+                manual_allocation=manual_allocation,
+                task_id=task_id,
+                outputs=outputs
             )
+    except ManualAllocationRequired as e:
+        logger.error(
+            "Manual allocation missing in database for task %s. %s",
+            task_text,
+            e.message
+        )
+        raise AnalysisRowError(
+            "Manual allocation missing in datasheet. Please configure allocation before running analysis."
+        )
+    except Exception as e:
+        logger.error(
+            "Error during matrix adjustment for task %s: %s",
+            task_text, str(e), exc_info=True
+        )
+        raise AnalysisRowError(f"Error adjusting matrices: {str(e)}")
+
+    adjusted_A = pd.DataFrame(adjusted_A)
+    adjusted_B = pd.DataFrame(adjusted_B)
+
+    snapshot("adjusted_A", adjusted_A, task_id=task_id)
+    snapshot("adjusted_B", adjusted_B, task_id=task_id)
 
-            logger.warning("Selected flow from UI: %s", selected_flow_id)
-            logger.warning("Adjusted A flow IDs: %s", flow_names['flow ID'].tolist())
-            logger.warning("Flow mapping table:\n%s", flow_names.to_string())
-
-            final_demand = flow_names['Amount'].values.astype(float)
-            logger.warning("Final demand:\n%s", final_demand.tolist())
-
-            # ---------------------------------------------------------
-            # 6. Extract matrices
-            # ---------------------------------------------------------
-            if adjusted_A.shape[1] <= 3:
-                results.append({
-                    "error": "Adjusted A matrix has no process columns.",
-                    "task_name": task_text
-                })
-                continue
+    # ---------------------------------------------------------
+    # 3. Build aligned B + LCI labels
+    # ---------------------------------------------------------
+    b_meta, adjusted_B_np = build_b_alignment(adjusted_B)
+    lci_flow = get_lci_flow_labels(b_meta)
 
-            if adjusted_B.shape[1] <= 3:
-                results.append({
-                    "error": "Adjusted B matrix has no process columns.",
-                    "task_name": task_text
-                })
-                continue
+    snapshot("lci_flow", lambda: list(lci_flow), task_id=task_id)
+
+    # ---------------------------------------------------------
+    # 6. Extract matrices
+    # ---------------------------------------------------------
+    if adjusted_A.shape[1] <= 3:
+        raise AnalysisRowError("Adjusted A matrix has no process columns.")
+
+    if adjusted_B.shape[1] <= 3:
+        raise AnalysisRowError("Adjusted B matrix has no process columns.")
+
+    process_names = adjusted_A.columns.tolist()[3:]
+
+    adjusted_A_np = np.nan_to_num(
+        np.array(adjusted_A.iloc[:, 3:], dtype=float),
+        nan=0.0
+    )
 
-            process_names = adjusted_A.columns.tolist()[3:]
+    snapshot("process_names", process_names, task_id=task_id)
+    snapshot("adjusted_B_numeric", lambda: pd.DataFrame(adjusted_B_np, columns=process_names), task_id=task_id)
 
-            adjusted_A_np = np.nan_to_num(
-                np.array(adjusted_A.iloc[:, 3:], dtype=float),
-                nan=0.0
+    if adjusted_B_np.shape[1] != adjusted_A_np.shape[1]:
+        raise AnalysisRowError(
+            f"A and B process-column mismatch: "
+            f"A={adjusted_A_np.shape}, B={adjusted_B_np.shape}"
+        )
+
+    backend = select_matrix_backend(backend_request, adjusted_A_np.shape[1])
+    logger.debug("Matrix backend: %s", backend)
+
+    return {
+        "flow_ids": adjusted_A.iloc[:, 1].astype(str).tolist(),
+        "process_names": process_names,
+        "lci_flow": lci_flow,
+        "backend": backend,
+        "A_calc": to_backend(adjusted_A_np, backend, fmt="csc"),
+        "B_calc": to_backend(adjusted_B_np, backend, fmt="csr"),
+    }
+
+
+def build_final_demand(spec, flow_ids):
+    """
+    Steps 4-5: functional unit to SI and the final demand vector f.
+    """
+    # ---------------------------------------------------------
+    # 4. Functional unit to SI
+    # ---------------------------------------------------------
+    try:
+        with stage("unit_conversion", task_id=spec["task_id"]):
+            functional_unit_si = unit_conversion(spec["functional_unit"], spec["unit_text"], 'SI')
+            functional_unit_si_unit = get_si_unit(spec["unit_text"])
+    except Exception as e:
+        logger.error(
+            "Unit conversion failed for task %s: %s",
+            spec["task_text"], e, exc_info=True
+        )
+        raise AnalysisRowError(f"Unit conversion failed: {str(e)}")
+
+    spec["functional_unit_si"] = functional_unit_si
+    spec["functional_unit_si_unit"] = functional_unit_si_unit
+
+    # ---------------------------------------------------------
+    # 5. Final demand vector
+    # ---------------------------------------------------------
+    selected_flow_id = str(spec["flow"]).strip()
+
+    final_demand = np.where(
+        np.asarray(flow_ids) == selected_flow_id,
+        float(functional_unit_si),
+        0.0
+    ).astype(float)
+
+    logger.debug("Selected flow from UI: %s", selected_flow_id)
+    snapshot("final_demand", final_demand, task_id=spec["task_id"])
+
+    return final_demand
+
+
+def solve_task_group(model, final_demands, task_id, task_text):
+    """
+    Step 7: solve A S = F for every final demand of a task group at once.
+    Returns S with one column per final demand.
+    """
+    F = np.column_stack(final_demands)
+
+    try:
+        with stage("solve", task_id=task_id):
+            S = calculate_scaling_vector(model["A_calc"], F, task_id=task_id)
+    except np.linalg.LinAlgError as e:
+        logger.error(
+            "Scaling vector error (singular matrix) for task %s: %s",
+            task_text, e
+        )
+        raise AnalysisRowError(f"Cannot solve linear system (singular matrix): {e}")
+    except Exception as e:
+        logger.error(
+            "Scaling vector error for task %s: %s",
+            task_text, e, exc_info=True
+        )
+        raise AnalysisRowError(f"Scaling vector calculation failed: {str(e)}")
+
+    return np.asarray(S, dtype=float).reshape(-1, F.shape[1])
+
+
+def analyse_row(spec, model, scaling_vector, store=None):
+    """
+    Steps 8-10 for one row: impacts, process contribution and the result
+    entry. Returns (result, contribution records, chart data entry or None).
+    """
+    task_id = spec["task_id"]
+    task_text = spec["task_text"]
+    flow_text = spec["flow_text"]
+    unit_text = spec["unit_text"]
+    functional_unit = spec["functional_unit"]
+    functional_unit_si = spec["functional_unit_si"]
+    functional_unit_si_unit = spec["functional_unit_si_unit"]
+    impact_category = spec["impact_category"]
+    process_names = model["process_names"]
+    lci_flow = model["lci_flow"]
+    B_calc = model["B_calc"]
+
+    # ---------------------------------------------------------
+    # 8. Inventory impact
+    # ---------------------------------------------------------
+    all_categories = str(impact_category).strip().upper() == ALL_IMPACT_CATEGORIES
+
+    try:
+        g = calculate_inventory_impact(B_calc, scaling_vector)
+        g = np.array(g).flatten()
+
+        if not all_categories:
+            total_impact = calculate_impact_score(g, lci_flow, impact_category, store=store)
+            snapshot("total_impact", total_impact, task_id=task_id, category=impact_category)
+    except Exception as e:
+        logger.error(
+            "Impact calculation error for task %s: %s",
+            task_text, e, exc_info=True
+        )
+        raise AnalysisRowError(f"Impact calculation failed: {str(e)}")
+
+    # ---------------------------------------------------------
+    # 9. Process contribution
+    # ---------------------------------------------------------
+    contributions = []
+    try:
+        # G = B.diag(s) is only built when the caller asks for it
+        inventory_matrix = None
+        if spec["include_inventory"]:
+            inventory_matrix = build_inventory_matrix_payload(
+                calculate_inventory_matrix(B_calc, scaling_vector),
+                lci_flow, process_names
             )
 
-            logger.warning("Process names: %s", process_names)
-            logger.warning("Adjusted B numeric:\n%s", pd.DataFrame(adjusted_B_np, columns=process_names).to_string())
-            logger.warning("LCI flows: %s", list(lci_flow))
-
-            if adjusted_A_np.shape[0] != len(final_demand):
-                results.append({
-                    "error": (
-                        f"Final demand length ({len(final_demand)}) does not match "
-                        f"number of A rows ({adjusted_A_np.shape[0]})."
-                    ),
-                    "task_name": task_text
-                })
-                continue
+        if all_categories:
+            categories = list(LCI_CATEGORIES)
+            total_impacts, contribution_cube = calculate_category_impacts(
+                g, B_calc, scaling_vector, lci_flow, categories, store=store
+            )
 
-            if adjusted_B_np.shape[1] != adjusted_A_np.shape[1]:
-                results.append({
-                    "error": (
-                        f"A and B process-column mismatch: "
-                        f"A={adjusted_A_np.shape}, B={adjusted_B_np.shape}"
-                    ),
-                    "task_name": task_text
-                })
-                continue
+            # Keep processes contributing to at least one category
+            process_names_np = np.array(process_names).flatten().astype(str)
+            mask = np.any(contribution_cube != 0, axis=0)
 
-            # ---------------------------------------------------------
-            # 7. Scaling vector
-            # ---------------------------------------------------------
-            try:
-                scaling_vector = calculate_scaling_vector(adjusted_A_np, final_demand)
-            except np.linalg.LinAlgError as e:
-                logger.error(
-                    "Scaling vector error (singular matrix) for task %s: %s",
-                    task_text, e
-                )
-                results.append({
-                    "error": f"Cannot solve linear system (singular matrix): {e}",
-                    "task_name": task_text
-                })
-                continue
-            except Exception as e:
-                logger.error(
-                    "Scaling vector error for task %s: %s",
-                    task_text, e, exc_info=True
+            all_categories_result = build_all_categories_result(
+                task_id, task_text, flow_text, functional_unit, unit_text,
+                functional_unit_si, functional_unit_si_unit, categories,
+                total_impacts, process_names_np[mask], contribution_cube[:, mask]
+            )
+            if inventory_matrix is not None:
+                all_categories_result["inventory_matrix"] = inventory_matrix
+
+            for k, category in enumerate(categories):
+                contributions.extend(
+                    pd.DataFrame({
+                        "Process": process_names_np[mask],
+                        "Task": f"{task_text} - {category}",
+                        "Contribution": contribution_cube[k, mask]
+                    }).to_dict('records')
                 )
-                results.append({
-                    "error": f"Scaling vector calculation failed: {str(e)}",
-                    "task_name": task_text
-                })
-                continue
+            return all_categories_result, contributions, None
 
-            # ---------------------------------------------------------
-            # 8. Inventory impact
-            # ---------------------------------------------------------
-            try:
-                g = calculate_inventory_impact(adjusted_B_np, scaling_vector)
-                g = np.array(g).flatten()
+        process_contribution = calculate_scaled_contribution(
+            B_calc, scaling_vector, lci_flow, impact_category, store=store
+        )
 
-                total_impact = calculate_impact_score(g, lci_flow, impact_category)
-                logger.warning("Total impact:\n%s", total_impact)
-            except Exception as e:
-                logger.error(
-                    "Impact calculation error for task %s: %s",
-                    task_text, e, exc_info=True
-                )
-                results.append({
-                    "error": f"Impact calculation failed: {str(e)}",
-                    "task_name": task_text
-                })
-                continue
+        process_contribution = np.array(process_contribution).flatten().astype(float)
+        process_names_np = np.array(process_names).flatten().astype(str)
 
-            # ---------------------------------------------------------
-            # 9. Process contribution
-            # ---------------------------------------------------------
-            try:
-                diag_s = diagonal_vector(scaling_vector)
-                G = calculate_inventory_matrix(adjusted_B_np, diag_s)
+        mask = process_contribution != 0
+        process_names_filtered = process_names_np[mask]
+        process_contribution_filtered = process_contribution[mask]
 
-                process_contribution = calculate_process_contribution(
-                    G, lci_flow, impact_category
-                )
+        contribution_table_df = pd.DataFrame({
+            "Process": process_names_filtered,
+            "Contribution": process_contribution_filtered
+        })
+
+        snapshot("contribution_table", contribution_table_df, task_id=task_id)
+
+    except Exception as e:
+        logger.error(
+            "Process contribution error for task %s: %s",
+            task_text, e, exc_info=True
+        )
+        raise AnalysisRowError(f"Process contribution calculation failed: {str(e)}")
+
+    # ---------------------------------------------------------
+    # 10. Store comparison rows
+    # ---------------------------------------------------------
+    contributions.extend(
+        pd.DataFrame({
+            "Process": process_names_filtered,
+            "Task": task_text,
+            "Contribution": process_contribution_filtered
+        }).to_dict('records')
+    )
 
-                process_contribution = np.array(process_contribution).flatten().astype(float)
-                process_names_np = np.array(process_names).flatten().astype(str)
+    # Store graph-safe plain list
+    graph_values = None
+    if not contribution_table_df.empty:
+        graph_values = contribution_table_df.astype({
+            "Process": str,
+            "Contribution": float
+        }).values.tolist()
+
+    graph_entry = {
+        "task_name": task_text,
+        "contribution_table_values": graph_values
+    }
 
-                mask = process_contribution != 0
-                process_names_filtered = process_names_np[mask]
-                process_contribution_filtered = process_contribution[mask]
+    # Optional preview chart for summary card. PNG previews (render_charts)
+    # are rendered by run_analysis in one batch; see preview_chart_job.
+    chart_data = None
+    chart_note = None
+    if graph_values:
+        has_negative = (contribution_table_df["Contribution"] < 0).any()
+
+        if has_negative:
+            chart_note = "Negative process contributions detected. Pie chart replaced with bar chart."
+
+        if spec["render_charts"] == CHART_OUTPUT_SERIES:
+            chart_data = chart_series(
+                graph_values,
+                graph_type='bar' if has_negative else 'pie',
+                xlabel="Process",
+                ylabel="Contribution",
+                title=f"Contribution Analysis: {task_text}"
+            )
 
-                contribution_table_df = pd.DataFrame({
-                    "Process": process_names_filtered,
-                    "Contribution": process_contribution_filtered
-                })
+    result = {
+        "task_id": task_id,
+        "task_name": task_text,
+        "flow_name": str(flow_text).strip() if flow_text is not None else "",
+        "entered_value": functional_unit,
+        "entered_unit": unit_text,
+        "calculation_value_si": functional_unit_si,
+        "calculation_unit_si": functional_unit_si_unit,
+        "product": f"{functional_unit} {unit_text} {str(flow_text).strip()}",
+        "impact_category": impact_category,
+        "total_impact": total_impact,
+        "chart_base64": None,
+        "chart_note": chart_note,
+        "contribution_table": contribution_table_df.to_dict('records')
+    }
+    if chart_data is not None:
+        result["chart_series"] = chart_data
+    if inventory_matrix is not None:
+        result["inventory_matrix"] = inventory_matrix
 
-                logger.warning("Contribution table:\n%s", contribution_table_df.to_string())
+    return result, contributions, graph_entry
 
-            except Exception as e:
-                logger.error(
-                    "Process contribution error for task %s: %s",
-                    task_text, e, exc_info=True
+
+def preview_chart_job(graph_entry):
+    """
+    Render job of the summary-card preview of a row (see chart_renderer).
+    """
+    values = graph_entry["contribution_table_values"]
+    has_negative = any(value < 0 for _, value in values)
+
+    return chart_job(
+        values,
+        function="create_graph",
+        graph_type='bar' if has_negative else 'pie',
+        x_column=0,
+        y_column=1,
+        has_header=False,
+        xlabel="Process",
+        ylabel="Contribution",
+        title=f"Contribution Analysis: {graph_entry['task_name']}"
+    )
+
+
+def analyse_task_group(model, pending, final_demands, store=None):
+    """
+    Solve and analyse every pending row of one task group.
+
+    Only uses the arrays in `model` and the given LCI `store`, so it can run in
+    a worker process. Returns [(row index, result, contributions, graph entry)].
+    """
+    task_id = pending[0][1]["task_id"]
+    task_text = pending[0][1]["task_text"]
+
+    try:
+        S = solve_task_group(model, final_demands, task_id, task_text)
+    except AnalysisRowError as e:
+        return [
+            (i, {"error": e.message, "task_name": spec["task_text"]}, [], None)
+            for i, spec in pending
+        ]
+
+    outcomes = []
+    for j, (i, spec) in enumerate(pending):
+        try:
+            with stage("characterization", task_id=task_id):
+                outcomes.append((i, *analyse_row(spec, model, S[:, j], store=store)))
+        except AnalysisRowError as e:
+            outcomes.append((i, {"error": e.message, "task_name": spec["task_text"]}, [], None))
+        except Exception as e:
+            logger.exception("Error in task %s", spec["task_text"])
+            outcomes.append((i, {"error": str(e), "task_name": spec["task_text"]}, [], None))
+
+    return outcomes
+
+
+def analyse_task_group_in_worker(model, pending, final_demands, store=None, trace=False, debug=False):
+    """
+    analyse_task_group in a worker process. Stage timings and diagnostics
+    snapshots taken in the worker are returned with the outcomes:
+    (outcomes, timing records, snapshots).
+    """
+    with analysis_trace(trace, log=False) as worker_trace, \
+            diagnostics_session(debug, keep=False) as worker_diagnostics:
+        outcomes = analyse_task_group(model, pending, final_demands, store)
+
+    return (
+        outcomes,
+        worker_trace.records if worker_trace is not None else [],
+        worker_diagnostics.snapshots if worker_diagnostics is not None else []
+    )
+
+
+def run_analysis(rows, params=None, progress=None, user=None, render_charts=False,
+                 timings=False, debug=False):
+    """
+    Rows are grouped by task (and allocation/backend). Each group builds A and
+    B once, stacks the final demands of its rows into F and solves A S = F in
+    a single call; the results are returned in the original row order.
+
+    With LCA_PARALLEL_WORKERS > 0 and more than one group, the groups are
+    solved and analysed in a process pool.
+
+    `params` are the user's analysis parameters (init_param_variable() of the
+    logged-in user by default). `progress(row_index, result)` is called as
+    soon as each row has its result.
+
+    The chart data of each row is saved in the result store under a key of
+    (user, task, hash of the row), returned to the client as `result_key`.
+    Rows whose inputs and data versions match an earlier run are served from
+    the analysis cache without rebuilding anything.
+
+    PNG preview charts (`chart_base64`) are only rendered for rows with
+    `render_charts` (default: the `render_charts` argument), all at once in
+    the chart pool after the analysis; otherwise charts are drawn on demand
+    from the stored contribution table. With `render_charts="series"` the
+    rows get `chart_series` (see chart_series) for drawing in the browser
+    instead of a PNG.
+
+    With `timings` (or LCA_TIMING_LOG) each stage is timed (see timing.py);
+    with `timings` the summary is returned in the `timings` field.
+
+    With `debug` (or for a sample of runs, LCA_DIAGNOSTICS_SAMPLE_RATE) the
+    matrices and vectors of the run are captured as diagnostics snapshots
+    (see diagnostics.py); their id is returned as `diagnostics_id`.
+    """
+    if user is None and has_request_context():
+        user = session.get('username')
+
+    with analysis_trace(timings) as trace, diagnostics_session(debug, owner=user) as diagnostics:
+        output = analyse_rows(rows, params, progress, user, render_charts)
+
+    if timings and trace is not None:
+        output["timings"] = trace.summary()
+    if diagnostics is not None:
+        output["diagnostics_id"] = diagnostics.id
+    return output
+
+
+def analyse_rows(rows, params=None, progress=None, user=None, render_charts=False):
+    """
+    Body of run_analysis, run inside its timing trace and diagnostics session.
+    """
+    result_store = get_result_store()
+
+    results = [None] * len(rows)
+    row_contributions = [[] for _ in rows]
+
+    def set_result(i, result, contributions=None):
+        results[i] = result
+        row_contributions[i] = contributions or []
+        if progress is not None:
+            progress(i, result)
+
+    logger.debug("--- STARTING run_analysis ---")
+
+    try:
+        if params is None:
+            params = init_param_variable()
+        growth_regrowth = params.get('regeneration_mode', 0)
+    except Exception as e:
+        logger.exception("Error loading analysis parameters")
+        return {
+            "individual_results": [
+                {"error": str(e), "task_name": row.get('taskText', 'Unknown Task')}
+                for row in rows
+            ],
+            "combined_contribution_table": []
+        }
+
+    # ---------------------------------------------------------
+    # Group rows by task
+    # ---------------------------------------------------------
+    specs = []
+    for i, row in enumerate(rows):
+        try:
+            spec = parse_analysis_row(row)
+            spec["render_charts"] = chart_output(row.get('render_charts', render_charts))
+            specs.append((i, spec))
+        except AnalysisRowError as e:
+            set_result(i, {"error": e.message, "task_name": row.get('taskText', 'Unknown Task')})
+
+    cache_keys = {}
+    if analysis_cache.enabled and specs:
+        try:
+            cache_context = analysis_cache.context([spec["task_id"] for _, spec in specs], params)
+            cache_keys = {
+                i: analysis_cache.key(
+                    user, spec["task_id"],
+                    dict(rows[i], render_charts=spec["render_charts"]),
+                    cache_context
                 )
-                results.append({
-                    "error": f"Process contribution calculation failed: {str(e)}",
-                    "task_name": task_text
-                })
+                for i, spec in specs
+            }
+        except Exception as e:
+            logger.error("Analysis cache unavailable for this run: %s", e, exc_info=True)
+
+    # Rows waiting for their PNG preview; their cache entry is written once
+    # the preview is rendered
+    previews = []
+    render_previews = {i for i, spec in specs if spec["render_charts"] is True}
+
+    def collect(outcomes, cached=False):
+        for i, result, contributions, graph_entry in outcomes:
+            set_result(i, result, contributions)
+            if graph_entry is not None:
+                key = make_result_key(user, result["task_id"], analysis_hash(rows[i]))
+                try:
+                    result_store.set(key, graph_entry)
+                    result["result_key"] = key
+                except Exception as e:
+                    logger.error("Could not store chart data for task %s: %s", result["task_id"], e)
+            if cached:
                 continue
+            if (
+                i in render_previews
+                and graph_entry is not None
+                and graph_entry["contribution_table_values"]
+            ):
+                previews.append((i, contributions, graph_entry))
+            elif i in cache_keys:
+                analysis_cache.set(cache_keys[i], result, contributions, graph_entry)
+
+    groups = {}
+    for i, spec in specs:
+        hit = analysis_cache.get(cache_keys[i]) if i in cache_keys else None
+        if hit is not None:
+            logger.info("Row %s (%s) served from the analysis cache.", i + 1, spec["task_text"])
+            collect([(i, hit["result"], hit["contributions"], hit["graph_entry"])], cached=True)
+            continue
+
+        groups.setdefault(task_group_key(spec), []).append((i, spec))
+
+    # Matrix, solve and chart work goes to the process pool when enabled;
+    # DB access (matrices, unit conversion, LCI factors) stays in this thread.
+    executor = get_analysis_executor() if len(groups) > 1 else None
+    submitted = []
+
+    for group in groups.values():
+        task_id = group[0][1]["task_id"]
+        task_text = group[0][1]["task_text"]
+        logger.info(
+            "--- Processing task %s (%s): rows %s ---",
+            task_id, task_text, [i + 1 for i, _ in group]
+        )
 
-            # ---------------------------------------------------------
-            # 10. Store comparison rows
-            # ---------------------------------------------------------
-            all_contributions_data.extend(
-                pd.DataFrame({
-                    "Process": process_names_filtered,
-                    "Task": task_text,
-                    "Contribution": process_contribution_filtered
-                }).to_dict('records')
+        try:
+            model = build_task_model(
+                task_id, task_text, growth_regrowth,
+                group[0][1]["manual_allocation"], group[0][1]["backend"],
+                params
             )
 
-            # Store graph-safe plain list
-            graph_values = None
-            if not contribution_table_df.empty:
-                graph_values = contribution_table_df.astype({
-                    "Process": str,
-                    "Contribution": float
-                }).values.tolist()
-
-            graph_data[task_id] = {
-                "task_name": task_text,
-                "contribution_table_values": graph_values
-            }
+            # Final demands of the group; rows failing here drop out
+            pending, final_demands = [], []
+            for i, spec in group:
+                try:
+                    final_demands.append(build_final_demand(spec, model["flow_ids"]))
+                    pending.append((i, spec))
+                except AnalysisRowError as e:
+                    set_result(i, {"error": e.message, "task_name": spec["task_text"]})
 
-            # Optional preview chart for summary card
-            chart_base64 = None
-            chart_note = None
-            if graph_values:
-                has_negative = (contribution_table_df["Contribution"] < 0).any()
-
-                if has_negative:
-                    chart_note = "Negative process contributions detected. Pie chart replaced with bar chart."
-                    chart_base64 = create_graph(
-                        graph_values,
-                        graph_type='bar',
-                        x_column=0,
-                        y_column=1,
-                        has_header=False,
-                        xlabel="Process",
-                        ylabel="Contribution",
-                        title=f"Contribution Analysis: {task_text}"
-                    )
-                else:
-                    chart_base64 = create_graph(
-                        graph_values,
-                        graph_type='pie',
-                        x_column=0,
-                        y_column=1,
-                        has_header=False,
-                        xlabel="Process",
-                        ylabel="Contribution",
-                        title=f"Contribution Analysis: {task_text}"
-                    )
-
-            results.append({
-                "task_id": task_id,
-                "task_name": task_text,
-                "flow_name": str(flow_text).strip() if flow_text is not None else "",
-                "entered_value": functional_unit,
-                "entered_unit": unit_text,
-                "calculation_value_si": functional_unit_si,
-                "calculation_unit_si": functional_unit_si_unit,
-                "product": f"{functional_unit} {unit_text} {str(flow_text).strip()}",
-                "impact_category": impact_category,
-                "total_impact": total_impact,
-                "chart_base64": chart_base64,
-                "chart_note": chart_note,
-                "contribution_table": contribution_table_df.to_dict('records')
-            })
+            if not pending:
+                continue
 
+            store = get_lci_store().subset(model["lci_flow"])
+        except AnalysisRowError as e:
+            for i, spec in group:
+                if results[i] is None:
+                    set_result(i, {"error": e.message, "task_name": spec["task_text"]})
+            continue
         except Exception as e:
             logger.exception("Error in task %s", task_text)
-            results.append({"error": str(e), "task_name": task_text})
+            for i, spec in group:
+                if results[i] is None:
+                    set_result(i, {"error": str(e), "task_name": spec["task_text"]})
+            continue
+
+        if executor is None:
+            collect(analyse_task_group(model, pending, final_demands, store))
+        else:
+            submitted.append((pending, executor.submit(
+                analyse_task_group_in_worker, model, pending, final_demands, store,
+                trace=tracing(), debug=capturing()
+            )))
+
+    for pending, future in submitted:
+        try:
+            outcomes, records, snapshots = future.result()
+            merge_records(records, worker=True)
+            merge_snapshots(snapshots, worker=True)
+            collect(outcomes)
+        except Exception as e:
+            logger.error("Analysis worker failed: %s", e, exc_info=True)
+            if isinstance(e, BrokenProcessPool):
+                reset_analysis_executor()
+            for i, spec in pending:
+                set_result(i, {"error": str(e), "task_name": spec["task_text"]})
+
+    if previews:
+        with stage("chart_render", charts=len(previews)):
+            rendered = render_jobs(
+                [preview_chart_job(graph_entry) for _, _, graph_entry in previews],
+                return_exceptions=True
+            )
+        for (i, contributions, graph_entry), chart_base64 in zip(previews, rendered):
+            if isinstance(chart_base64, Exception):
+                logger.error("Preview chart failed for row %s: %s", i + 1, chart_base64)
+                continue
+            results[i]["chart_base64"] = chart_base64
+            if i in cache_keys:
+                analysis_cache.set(cache_keys[i], results[i], contributions, graph_entry)
+
+    all_contributions_data = [
+        record for contributions in row_contributions for record in contributions
+    ]
 
     # ---------------------------------------------------------
     # FINAL COMPARISON TABLE
@@ -450,7 +867,7 @@ def run_analysis(rows):
     else:
         combined = []
 
-    logger.warning("--- ENDING run_analysis ---")
+    logger.debug("--- ENDING run_analysis ---")
 
     return {
         "individual_results": results,
@@ -458,24 +875,146 @@ def run_analysis(rows):
     }
 
 
-def graph_results_single(chart_type='pie', theme='vibrant', task_name=None, task_id=None):
-    task_id = int(task_id)
-    data = graph_data.get(task_id, {}).get("contribution_table_values")
+def render_charts(charts, user=None):
+    """
+    Render a batch of charts of contribution tables, e.g. a comparison page.
+
+    Each chart is a dict of render_chart's arguments (data, chart_type,
+    theme, title, task_id, output). PNGs are cached in the result store by
+    a hash of the data, chart type, theme and title; the missing ones are
+    rendered concurrently in the chart pool.
+
+    Returns one dict per chart: {"chart_base64": ...}, {"chart_series": ...}
+    or {"error": ...}.
+    """
+    result_store = get_result_store()
+    outputs = [None] * len(charts)
+    pending = []
+
+    for n, chart in enumerate(charts):
+        data = chart.get("data")
+        chart_type = chart.get("chart_type", "pie")
+        theme = chart.get("theme", "vibrant")
+        title = chart.get("title")
+
+        if chart.get("output", CHART_OUTPUT_PNG) == CHART_OUTPUT_SERIES:
+            try:
+                outputs[n] = {"chart_series": chart_series(
+                    data,
+                    graph_type=chart_type,
+                    xlabel="Process",
+                    ylabel="Contribution",
+                    title=title,
+                    theme=theme
+                )}
+            except Exception as e:
+                outputs[n] = {"error": str(e)}
+            continue
+
+        digest = analysis_hash({"data": data, "chart_type": chart_type, "theme": theme, "title": title})
+        key = make_result_key(user, chart.get("task_id"), f"chart-{digest}")
+
+        try:
+            cached = result_store.get(key)
+        except Exception as e:
+            logger.error("Chart cache lookup failed: %s", e)
+            cached = None
+        if cached:
+            outputs[n] = {"chart_base64": cached["chart_base64"]}
+            continue
+
+        pending.append((n, key, chart_job(
+            data,
+            graph_type=chart_type,
+            x_column=0,
+            y_column=1,
+            has_header=False,
+            xlabel="Process",
+            ylabel="Contribution",
+            title=title,
+            theme=theme
+        )))
+
+    with stage("chart_render", charts=len(pending)):
+        rendered = render_jobs([job for _, _, job in pending], return_exceptions=True)
+
+    for (n, key, _), chart_base64 in zip(pending, rendered):
+        if isinstance(chart_base64, Exception):
+            outputs[n] = {"error": str(chart_base64)}
+            continue
+
+        if chart_base64:
+            try:
+                result_store.set(key, {"chart_base64": chart_base64})
+            except Exception as e:
+                logger.error("Chart cache write failed: %s", e)
+        outputs[n] = {"chart_base64": chart_base64}
+
+    return outputs
+
+
+def render_chart(data, chart_type='pie', theme='vibrant', title=None, user=None, task_id=None,
+                 output=CHART_OUTPUT_PNG):
+    """
+    PNG chart (base64) of a contribution table, or its chart-ready series
+    with `output="series"` (no matplotlib work). See render_charts.
+    """
+    chart = render_charts([{
+        "data": data,
+        "chart_type": chart_type,
+        "theme": theme,
+        "title": title,
+        "task_id": task_id,
+        "output": output,
+    }], user=user)[0]
+
+    if "error" in chart:
+        raise ValueError(chart["error"])
+    return chart.get("chart_series", chart.get("chart_base64"))
+
+
+def get_stored_contribution_table(result_key, user):
+    """
+    Contribution table values saved by run_analysis under `result_key`, or
+    None if missing, expired or owned by another user.
+    """
+    if not result_key or key_owner(result_key) != str(user):
+        return None, None
+
+    entry = get_result_store().get(result_key)
+    if not entry:
+        return None, None
+
+    return entry.get("contribution_table_values"), entry.get("task_name")
+
+
+def graph_results_single(chart_type='pie', theme='vibrant', task_name=None, task_id=None,
+                         result_key=None, user=None, process_contribution=None,
+                         output=CHART_OUTPUT_PNG):
+    """
+    Render the chart of one analysed row.
+
+    The data is read from the result store by `result_key` (only for the
+    user it belongs to). When the entry is missing or expired, the
+    contribution table sent back by the client is used instead.
+    """
+    data, _ = get_stored_contribution_table(result_key, user)
+
+    if not data and process_contribution:
+        data = [
+            [str(r.get("Process")), float(r.get("Contribution", 0.0))]
+            for r in process_contribution
+            if isinstance(r, dict) and "Process" in r
+        ]
 
     if not data or len(data) == 0:
         logger.warning("No data available for graph for task %s", task_id)
         return None
 
-    logger.warning("Graph data for task %s:\n%s", task_id, data)
+    logger.debug("Graph data for task %s: %s processes", task_id, len(data))
 
-    return create_graph_wt(
-        data,
-        graph_type=chart_type,
-        x_column=0,
-        y_column=1,
-        has_header=False,
-        xlabel="Process",
-        ylabel="Contribution",
+    return render_chart(
+        data, chart_type, theme,
         title=f"Contribution Analysis: {task_name}",
-        theme=theme
-    )
\ No newline at end of file
+        user=user, task_id=task_id, output=output
+    )
@@ -0,0 +1,386 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from config import TASK_MATRIX_CACHE_MAX_ENTRIES
+from .getdata import (
+    _get_base_task_data,
+    _classify_rows,
+    _pivot_matrix,
+    _processes_in_order,
+    build_task_matrices,
+    get_datasheet_versions
+)
+
+logger = logging.getLogger(__name__)
+
+# Row fields whose change moves a row to another flow, process or matrix
+STRUCTURAL_FIELDS = ("IDE", "Flow_id", "Flow", "Process", "IName")
+
+
+def _same(a, b) -> bool:
+    if pd.isna(a) and pd.isna(b):
+        return True
+    return a == b
+
+
+def _is_output(row) -> bool:
+    """
+    Product, or Co-Products with CHK = 0 (see _produced_by_another_process).
+    """
+    item = str(row["IName"] or "").strip()
+    chk = 0 if pd.isna(row["CHK"]) else row["CHK"]
+    return item == "Product" or (item == "Co-Products" and chk == 0)
+
+
+class PivotedMatrix:
+    """
+    One pivoted matrix of a task: flow metadata (Flow, Flow_id, Unit), the
+    values (flows x processes) and a (Flow, Flow_id) -> row index map.
+    """
+
+    def __init__(self, frame: pd.DataFrame, processes: list):
+        self.meta = frame[["Flow", "Flow_id", "Unit"]].reset_index(drop=True).copy()
+        self.values = frame[processes].to_numpy(dtype=float, copy=True).reshape(len(frame), len(processes))
+        self.flow_index = {
+            (flow, flow_id): i
+            for i, (flow, flow_id) in enumerate(zip(self.meta["Flow"], self.meta["Flow_id"]))
+        }
+
+    def copy(self) -> "PivotedMatrix":
+        matrix = PivotedMatrix.__new__(PivotedMatrix)
+        matrix.meta = self.meta.copy()
+        matrix.values = self.values.copy()
+        matrix.flow_index = self.flow_index
+        return matrix
+
+    def to_frame(self, processes: list) -> pd.DataFrame:
+        return pd.concat(
+            [self.meta.copy(), pd.DataFrame(self.values.copy(), columns=processes)],
+            axis=1
+        )
+
+
+class TaskMatrices:
+    """
+    Cached A and B of one task, as classified datasheet rows plus pivoted
+    arrays with flow and process index maps.
+
+    `apply_rows` patches the arrays for edited, inserted or deleted rows.
+    It returns False when a change is structural (new process or flow, a
+    row becoming or ceasing to be an output, ...) and the task has to be
+    rebuilt.
+    """
+
+    def __init__(self, task_id, growth_regrowth, rows, processes, matrices, version):
+        self.task_id = task_id
+        self.growth_regrowth = growth_regrowth
+        self.rows = rows
+        self.processes = processes
+        self.process_index = {p: j for j, p in enumerate(processes)}
+        self.matrices = matrices
+        self.version = version
+
+    @classmethod
+    def build(cls, task_id, growth_regrowth, version):
+        """
+        Full build with the same steps as build_task_matrices; returns None
+        for a task without datasheet rows.
+        """
+        base_df = _get_base_task_data(task_id)
+        if base_df.empty:
+            return None
+
+        processes = _processes_in_order(base_df)
+        classified = _classify_rows(base_df, growth_regrowth)
+
+        rows = base_df.copy()
+        rows["Matrix"] = ""
+        rows["Sign"] = 0.0
+        rows["Value_Final"] = 0.0
+        rows.loc[classified.index, ["Matrix", "Sign", "Value_Final"]] = \
+            classified[["Matrix", "Sign", "Value_Final"]]
+
+        matrices = {
+            name: PivotedMatrix(
+                _pivot_matrix(classified[classified["Matrix"] == name].copy(), processes),
+                processes
+            )
+            for name in ("A", "B")
+        }
+
+        return cls(task_id, growth_regrowth, rows.set_index("IDD", drop=False), processes, matrices, version)
+
+    def copy(self) -> "TaskMatrices":
+        """
+        Copy to patch while readers keep using this one.
+        """
+        return TaskMatrices(
+            self.task_id,
+            self.growth_regrowth,
+            self.rows.copy(),
+            self.processes,
+            {name: matrix.copy() for name, matrix in self.matrices.items()},
+            self.version
+        )
+
+    def to_frames(self):
+        return (
+            self.matrices["A"].to_frame(self.processes),
+            self.matrices["B"].to_frame(self.processes),
+        )
+
+    def _classify_new_row(self, row: pd.DataFrame):
+        """
+        Matrix and sign of an inserted row. Only output rows decide how an
+        input is classified, so they are the only context needed.
+        """
+        is_output = (
+            (self.rows["IName"] == "Product") |
+            ((self.rows["IName"] == "Co-Products") & (self.rows["CHK"].fillna(0) == 0))
+        )
+        outputs = self.rows[is_output]
+        context = pd.concat([outputs.reset_index(drop=True), row.reset_index(drop=True)], ignore_index=True)
+        classified = _classify_rows(context.drop(columns=["Matrix", "Sign", "Value_Final"], errors="ignore"), self.growth_regrowth)
+
+        last = len(context) - 1
+        if last not in classified.index:
+            return "", 0.0
+        return classified.at[last, "Matrix"], float(classified.at[last, "Sign"])
+
+    def _is_first_row_of_process(self, idd) -> bool:
+        process = self.rows.at[idd, "Process"]
+        return self.rows.index[self.rows["Process"] == process][0] == idd
+
+    def apply_rows(self, fetched: pd.DataFrame, idds) -> bool:
+        fetched = fetched.set_index("IDD", drop=False)
+        touched = set()
+
+        for idd in idds:
+            old = self.rows.loc[idd] if idd in self.rows.index else None
+            new = fetched.loc[idd] if idd in fetched.index else None
+
+            if old is None and new is None:
+                continue
+
+            if old is not None and new is not None:
+                # Edit of ValueD / IDU / CHK / ManualAllocation
+                if any(not _same(old[f], new[f]) for f in STRUCTURAL_FIELDS):
+                    return False
+                if _is_output(old) != _is_output(new):
+                    return False
+
+                for field in ("ValueD", "UnitD", "CHK", "ManualAllocation"):
+                    self.rows.at[idd, field] = new[field]
+                value = pd.to_numeric(new["ValueD"], errors="coerce")
+                self.rows.at[idd, "Value_Final"] = old["Sign"] * (0.0 if pd.isna(value) else float(value))
+                touched.add((old["Matrix"], old["Flow"], old["Flow_id"]))
+
+            elif new is not None:
+                # Insert
+                if new["Process"] not in self.process_index or _is_output(new):
+                    return False
+
+                row = fetched.loc[[idd]].copy()
+                matrix, sign = self._classify_new_row(row)
+                if matrix:
+                    pivoted = self.matrices[matrix]
+                    i = pivoted.flow_index.get((new["Flow"], new["Flow_id"]))
+                    if i is None:
+                        return False
+                    # The flow unit is the first one in DB row order; an insert
+                    # with a different unit may change it, so rebuild
+                    if not _same(str(new["UnitD"]).strip(), pivoted.meta.at[i, "Unit"]):
+                        return False
+
+                value = pd.to_numeric(new["ValueD"], errors="coerce")
+                row["Matrix"] = matrix
+                row["Sign"] = sign
+                row["Value_Final"] = sign * (0.0 if pd.isna(value) else float(value))
+                self.rows = pd.concat([self.rows, row])
+                touched.add((matrix, new["Flow"], new["Flow_id"]))
+
+            else:
+                # Delete
+                if _is_output(old) or self._is_first_row_of_process(idd):
+                    return False
+                if old["Matrix"]:
+                    same_flow = (
+                        (self.rows["Matrix"] == old["Matrix"]) &
+                        (self.rows["Flow"] == old["Flow"]) &
+                        (self.rows["Flow_id"] == old["Flow_id"])
+                    )
+                    if same_flow.sum() <= 1:
+                        return False
+
+                self.rows = self.rows.drop(index=idd)
+                touched.add((old["Matrix"], old["Flow"], old["Flow_id"]))
+
+        for matrix, flow, flow_id in touched:
+            if matrix:
+                self._refresh_flow(matrix, flow, flow_id)
+
+        return True
+
+    def _refresh_flow(self, matrix, flow, flow_id):
+        """
+        Recompute one flow row (values per process and unit) from the rows.
+        """
+        pivoted = self.matrices[matrix]
+        i = pivoted.flow_index[(flow, flow_id)]
+
+        rows = self.rows[
+            (self.rows["Matrix"] == matrix) &
+            (self.rows["Flow"] == flow) &
+            (self.rows["Flow_id"] == flow_id)
+        ]
+
+        values = np.zeros(len(self.processes), dtype=float)
+        sums = rows.groupby("Process", sort=False)["Value_Final"].sum()
+        for process, total in sums.items():
+            values[self.process_index[process]] = total
+        pivoted.values[i] = values
+
+        # First non-empty unit, as in _choose_unit_per_flow
+        pivoted.meta.at[i, "Unit"] = next(
+            (str(u).strip() for u in rows["UnitD"] if pd.notna(u) and str(u).strip() != ""),
+            np.nan
+        )
+
+
+class TaskMatrixCache:
+    """
+    Per-worker LRU cache of TaskMatrices.
+
+    Every read checks the task's datasheet version (one aggregate query) and
+    rebuilds on mismatch, so writes made through another worker are picked
+    up. The datasheet routes of this worker patch entries in place through
+    `patch_rows`.
+    """
+
+    def __init__(self, max_entries=TASK_MATRIX_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_matrices(self, task_id, growth_regrowth):
+        task_id = int(task_id)
+        version = get_datasheet_versions([task_id])[task_id]
+
+        with self._lock:
+            state = self._entries.get(task_id)
+            if (
+                state is not None
+                and state.version == version
+                and state.growth_regrowth == growth_regrowth
+            ):
+                self._entries.move_to_end(task_id)
+                logger.info("Using cached matrices for task %s.", task_id)
+                return state.to_frames()
+
+        state = TaskMatrices.build(task_id, growth_regrowth, version)
+        if state is None:
+            self.invalidate(task_id)
+            return build_task_matrices(task_id, growth_regrowth)
+
+        with self._lock:
+            self._entries[task_id] = state
+            self._entries.move_to_end(task_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return state.to_frames()
+
+    def patch_rows(self, task_id, idds):
+        """
+        Bring a cached task up to date after its rows `idds` were inserted,
+        edited or deleted (call after commit).
+
+        The rows are fetched and a copy of the entry is patched without
+        holding the cache lock; the lock is only taken to swap it in.
+        """
+        task_id = int(task_id)
+        idds = [int(i) for i in idds if i is not None]
+
+        with self._lock:
+            state = self._entries.get(task_id)
+        if state is None:
+            return
+
+        patched = None
+        try:
+            # Version first: a write landing after it makes the entry stale
+            version = get_datasheet_versions([task_id])[task_id]
+            fetched = _get_base_task_data(task_id, idds=idds)
+            candidate = state.copy()
+            if candidate.apply_rows(fetched, idds):
+                candidate.version = version
+                patched = candidate
+            else:
+                logger.info("Structural change in task %s; cached matrices dropped.", task_id)
+        except Exception as e:
+            logger.error("Could not patch matrices of task %s: %s", task_id, e, exc_info=True)
+
+        with self._lock:
+            if self._entries.get(task_id) is not state:
+                # Rebuilt or patched by another thread meanwhile
+                self._entries.pop(task_id, None)
+                return
+            if patched is None:
+                self._entries.pop(task_id, None)
+                return
+            self._entries[task_id] = patched
+
+        logger.info("Patched cached matrices of task %s for rows %s.", task_id, idds)
+
+    def get_rows(self, task_id):
+        """
+        Datasheet rows of a cached task (as returned by _get_base_task_data),
+        or None when the task is not cached.
+        """
+        with self._lock:
+            state = self._entries.get(int(task_id))
+            return state.rows.reset_index(drop=True).copy() if state is not None else None
+
+    def invalidate(self, task_id):
+        with self._lock:
+            self._entries.pop(int(task_id), None)
+
+
+task_matrix_cache = TaskMatrixCache()
+
+
+def get_task_matrices(task_id, growth_regrowth):
+    """
+    Matrix A and Matrix B of a task, as build_task_matrices, from the cache.
+    """
+    if task_matrix_cache.max_entries <= 0:
+        return build_task_matrices(task_id, growth_regrowth)
+
+    try:
+        return task_matrix_cache.get_matrices(task_id, growth_regrowth)
+    except Exception as e:
+        logger.error("Task matrix cache failed for task %s: %s", task_id, e, exc_info=True)
+        task_matrix_cache.invalidate(task_id)
+        return build_task_matrices(task_id, growth_regrowth)
+
+
+def get_cached_task_rows(task_id):
+    """
+    Datasheet rows of a task from the cache, or None when it is not cached
+    (valid right after get_task_matrices).
+    """
+    if task_matrix_cache.max_entries <= 0:
+        return None
+    return task_matrix_cache.get_rows(task_id)
+
+
+def patch_task_matrices(task_id, idds):
+    task_matrix_cache.patch_rows(task_id, idds)
+
+
+def invalidate_task_matrices(task_id):
+    task_matrix_cache.invalidate(task_id)
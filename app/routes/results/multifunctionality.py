@@ -5,6 +5,13 @@ import logging
 from app import db
 from app.models import Datasheet, Element, Item, Step
 from .unit_conversion import unit_conversion, get_si_unit
+from .diagnostics import snapshot
+
+# Optional sparse expansion matrix
+try:
+    import scipy.sparse as sp
+except ImportError:
+    sp = None
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +26,95 @@ class ManualAllocationRequired(Exception):
         self.outputs = outputs or []
 
 
-def get_relevant_output_rows(A, retained_columns_Aa, process_idx, task_id, process_name):
+def _is_allocation_output(item, chk) -> bool:
+    """
+    Product, or Co-Products with CHK == 0.
+    """
+    return item == "Product" or (item == "Co-Products" and not pd.isna(chk) and chk == 0)
+
+
+class AllocationOutputs:
+    """
+    Allocation-relevant outputs of a task, by process name: the flow ids of
+    its Product / Co-Products (CHK = 0) rows and their DB ManualAllocation.
+
+    Built once per task, from one query or from datasheet rows already
+    loaded by getdata._get_base_task_data, so the allocation loop does not
+    query the DB per process column.
+    """
+
+    def __init__(self):
+        self.flow_ids = {}
+        self.allocations = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        `rows`: (process, flow_id, IName, CHK, ManualAllocation) in DB order.
+        """
+        outputs = cls()
+        for process, flow_id, item, chk, manual_allocation in rows:
+            if not _is_allocation_output(item, chk):
+                continue
+
+            process, flow_id = str(process), str(flow_id)
+            outputs.flow_ids.setdefault(process, set()).add(flow_id)
+
+            # First non-zero DB allocation of a flow wins
+            allocations = outputs.allocations.setdefault(process, {})
+            if (
+                flow_id not in allocations
+                and not pd.isna(manual_allocation)
+                and manual_allocation != 0
+            ):
+                allocations[flow_id] = float(manual_allocation)
+
+        return outputs
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame):
+        return cls.from_rows(zip(
+            df["Process"], df["Flow_id"], df["IName"], df["CHK"], df["ManualAllocation"]
+        ))
+
+    @classmethod
+    def load(cls, task_id):
+        """
+        One query for all processes of the task.
+        """
+        if not task_id:
+            return cls()
+
+        db_rows = (
+            db.session.query(
+                Step.SName.label("process"),
+                Element.IDBE.label("flow_id"),
+                Item.IName.label("item"),
+                Datasheet.CHK.label("chk"),
+                Datasheet.ManualAllocation.label("manual_allocation")
+            )
+            .join(Datasheet, Datasheet.IDE == Element.IDE)
+            .join(Item, Element.IDI == Item.IDI)
+            .join(Step, Datasheet.IDS == Step.IDS)
+            .filter(Datasheet.IDT == task_id)
+            .filter(
+                db.or_(
+                    Item.IName == "Product",
+                    db.and_(Item.IName == "Co-Products", Datasheet.CHK == 0)
+                )
+            )
+            .all()
+        )
+        return cls.from_rows(db_rows)
+
+    def allowed_flow_ids(self, process_name) -> set:
+        return self.flow_ids.get(str(process_name), set())
+
+    def db_allocation(self, process_name) -> dict:
+        return self.allocations.get(str(process_name), {})
+
+
+def get_relevant_output_rows(A, retained_columns_Aa, process_idx, task_id, process_name, outputs=None):
     """
     Return matrix row indices corresponding to relevant outputs for allocation.
 
@@ -27,8 +122,8 @@ def get_relevant_output_rows(A, retained_columns_Aa, process_idx, task_id, proce
       - Product
       - Co-Products with CHK == 0
 
-    These are retrieved from the database for the same task and process.
-    No other rows are eligible for allocation.
+    These are looked up in `outputs` (AllocationOutputs of the task, loaded
+    when not given). No other rows are eligible for allocation.
     """
     if not task_id or not process_name:
         logger.warning(
@@ -38,46 +133,26 @@ def get_relevant_output_rows(A, retained_columns_Aa, process_idx, task_id, proce
         )
         return np.array([], dtype=int)
 
-    db_rows = (
-        db.session.query(
-            Element.IDBE.label("flow_id")
-        )
-        .join(Datasheet, Datasheet.IDE == Element.IDE)
-        .join(Item, Element.IDI == Item.IDI)
-        .join(Step, Datasheet.IDS == Step.IDS)
-        .filter(Datasheet.IDT == task_id)
-        .filter(Step.SName == process_name)
-        .filter(
-            db.or_(
-                Item.IName == "Product",
-                db.and_(Item.IName == "Co-Products", Datasheet.CHK == 0)
-            )
-        )
-        .all()
-    )
+    if outputs is None:
+        outputs = AllocationOutputs.load(task_id)
 
-    allowed_flow_ids = {str(r.flow_id) for r in db_rows}
+    allowed_flow_ids = outputs.allowed_flow_ids(process_name)
 
     if not allowed_flow_ids:
-        logger.warning(
+        logger.debug(
             "Process '%s': no Product / Co-Products(CHK=0) found in DB.",
             process_name
         )
         return np.array([], dtype=int)
 
-    output_rows = []
-    candidate_rows = np.where(A[:, process_idx] != 0)[0]
-
-    for row_idx in candidate_rows:
-        matrix_flow_id = str(retained_columns_Aa.iloc[row_idx, 1])
-        if matrix_flow_id in allowed_flow_ids:
-            output_rows.append(row_idx)
+    candidate_rows = np.flatnonzero(A[:, process_idx] != 0)
+    candidate_flow_ids = retained_columns_Aa.iloc[candidate_rows, 1].astype(str)
+    output_rows = candidate_rows[candidate_flow_ids.isin(allowed_flow_ids).to_numpy()]
 
-    logger.warning(
-        "Process '%s': allowed_flow_ids=%s, detected_output_rows=%s",
-        process_name,
-        sorted(list(allowed_flow_ids)),
-        output_rows
+    snapshot(
+        "detected_outputs",
+        lambda: {"allowed_flow_ids": sorted(allowed_flow_ids), "rows": [int(r) for r in output_rows]},
+        process=process_name
     )
 
     return np.array(output_rows, dtype=int)
@@ -103,7 +178,9 @@ def calculate_allocation_factors_with_units(
     process_idx,
     process_name=None,
     process_id=None,
-    task_id=None
+    task_id=None,
+    output_rows=None,
+    outputs=None
 ):
     """
     Automatic allocation based only on relevant outputs:
@@ -112,14 +189,17 @@ def calculate_allocation_factors_with_units(
 
     Uses absolute output magnitudes for allocation.
     All relevant outputs must have the same SI property.
+    `output_rows` are looked up when not given.
     """
-    output_rows = get_relevant_output_rows(
-        A,
-        retained_columns_Aa,
-        process_idx,
-        task_id,
-        process_name
-    )
+    if output_rows is None:
+        output_rows = get_relevant_output_rows(
+            A,
+            retained_columns_Aa,
+            process_idx,
+            task_id,
+            process_name,
+            outputs
+        )
 
     if len(output_rows) == 0:
         raise ValueError(
@@ -176,13 +256,11 @@ def calculate_allocation_factors_with_units(
 
     total_output_si = np.sum(values_si)
 
-    logger.warning(
-        "Automatic allocation for process '%s': raw_values=%s raw_units=%s values_si=%s total=%s",
-        process_name,
-        raw_values.tolist(),
-        raw_units,
-        values_si.tolist(),
-        total_output_si
+    snapshot(
+        "automatic_allocation",
+        lambda: {"raw_values": raw_values.tolist(), "raw_units": list(raw_units),
+                 "values_si": values_si.tolist(), "total": float(total_output_si)},
+        process=process_name
     )
 
     if total_output_si == 0:
@@ -205,7 +283,9 @@ def get_manual_allocation_factors(
     provided_factors,
     process_id,
     task_id=None,
-    process_name=None
+    process_name=None,
+    output_rows=None,
+    outputs=None
 ):
     """
     Manual allocation for relevant outputs only:
@@ -214,14 +294,17 @@ def get_manual_allocation_factors(
 
     Each factor must be between 0 and 1.
     Sum must be <= 1.
+    `output_rows` are looked up when not given.
     """
-    output_rows = get_relevant_output_rows(
-        A,
-        retained_columns_Aa,
-        process_idx,
-        task_id,
-        process_name
-    )
+    if output_rows is None:
+        output_rows = get_relevant_output_rows(
+            A,
+            retained_columns_Aa,
+            process_idx,
+            task_id,
+            process_name,
+            outputs
+        )
 
     if len(output_rows) == 0:
         raise ValueError(
@@ -230,9 +313,7 @@ def get_manual_allocation_factors(
 
     allocation_factors = []
 
-    for row in output_rows:
-        flow_id = str(retained_columns_Aa.iloc[row, 1])
-
+    for flow_id in retained_columns_Aa.iloc[output_rows, 1].astype(str):
         if flow_id not in provided_factors:
             raise ValueError(
                 f"Missing manual allocation factor for flow_id '{flow_id}' in process '{process_id}'."
@@ -255,17 +336,12 @@ def get_manual_allocation_factors(
             f"Manual allocation factors for process '{process_id}' exceed 1."
         )
 
-    logger.warning(
-        "Manual/DB allocation for process '%s': factors=%s total=%s",
-        process_name or process_id,
-        allocation_factors.tolist(),
-        total
-    )
+    snapshot("manual_allocation", allocation_factors, process=process_name or process_id)
 
     return allocation_factors, output_rows
 
 
-def get_db_allocation_for_process(retained_columns_Aa, output_rows, task_id, process_name):
+def get_db_allocation_for_process(retained_columns_Aa, output_rows, task_id, process_name, outputs=None):
     """
     Get Datasheet.ManualAllocation for relevant outputs only:
       - Product
@@ -276,50 +352,105 @@ def get_db_allocation_for_process(retained_columns_Aa, output_rows, task_id, pro
     if not task_id or not process_name:
         return {}
 
-    db_rows = (
-        db.session.query(
-            Element.IDBE.label("flow_id"),
-            Datasheet.ManualAllocation.label("manual_allocation")
-        )
-        .join(Datasheet, Datasheet.IDE == Element.IDE)
-        .join(Item, Element.IDI == Item.IDI)
-        .join(Step, Datasheet.IDS == Step.IDS)
-        .filter(Datasheet.IDT == task_id)
-        .filter(Step.SName == process_name)
-        .filter(
-            db.or_(
-                Item.IName == "Product",
-                db.and_(Item.IName == "Co-Products", Datasheet.CHK == 0)
-            )
-        )
-        .all()
-    )
+    if outputs is None:
+        outputs = AllocationOutputs.load(task_id)
 
+    allocations = outputs.db_allocation(process_name)
     db_alloc = {}
 
-    for row in output_rows:
-        flow_id = str(retained_columns_Aa.iloc[row, 1])
-
-        matches = [
-            float(r.manual_allocation)
-            for r in db_rows
-            if str(r.flow_id) == flow_id and r.manual_allocation not in (None, 0)
-        ]
+    for flow_id in retained_columns_Aa.iloc[output_rows, 1].astype(str):
+        if flow_id in allocations:
+            db_alloc[flow_id] = allocations[flow_id]
 
-        if matches:
-            db_alloc[flow_id] = matches[0]
-
-    logger.warning("DB allocation for process '%s': %s", process_name, db_alloc)
+    logger.debug("DB allocation for process '%s': %s", process_name, db_alloc)
     return db_alloc
 
 
-def keep_column_unchanged(A, B, col, new_A, new_B, new_column_names, process_name):
-    new_A.append(A[:, col])
-    new_B.append(B[:, col])
-    new_column_names.append(process_name)
+class ColumnExpansion:
+    """
+    Split of process columns into one column per allocated output.
+
+    Column j of the result comes from original column `sources[j]` scaled
+    by `factors[j]`, i.e. M @ E with the expansion matrix
+    E[sources[j], j] = factors[j]. In A, a split column then has the other
+    outputs of its process zeroed and its own output restored at the full
+    original amount.
+    """
 
+    def __init__(self, num_columns):
+        self.num_columns = num_columns
+        self.sources = []
+        self.factors = []
+        self.names = []
+        self._zero_rows = []
+        self._zero_cols = []
+        self._output_rows = []
+        self._output_cols = []
+
+    def keep(self, col, name):
+        self.sources.append(col)
+        self.factors.append(1.0)
+        self.names.append(name)
+
+    def split(self, col, factors, output_rows, names):
+        first = len(self.sources)
+        split_cols = np.arange(first, first + len(output_rows))
+
+        self.sources.extend([col] * len(output_rows))
+        self.factors.extend(float(f) for f in factors)
+        self.names.extend(names)
+
+        self._zero_rows.append(np.tile(output_rows, len(output_rows)))
+        self._zero_cols.append(np.repeat(split_cols, len(output_rows)))
+        self._output_rows.append(np.asarray(output_rows))
+        self._output_cols.append(split_cols)
+
+    def matrix(self):
+        """
+        E (original columns x split columns); sparse when scipy is installed.
+        """
+        shape = (self.num_columns, len(self.sources))
+        if sp is not None:
+            return sp.csc_matrix(
+                (self.factors, (self.sources, np.arange(len(self.sources)))),
+                shape=shape
+            )
 
-def adjust_matrix_for_multiple_outputs(Aa, Bb, manual_allocation=None, task_id=None):
+        E = np.zeros(shape)
+        E[self.sources, np.arange(len(self.sources))] = self.factors
+        return E
+
+    def expand(self, M, E=None, restore_outputs=False):
+        """
+        M @ E for a dense or sparse M. With `restore_outputs` (matrix A),
+        the outputs of split columns are zeroed and each split column gets
+        its own output back from M.
+        """
+        if E is None:
+            E = self.matrix()
+
+        if sp is not None and sp.issparse(M):
+            expanded = (sp.csr_matrix(M) @ E).tolil()
+        elif sp is None:
+            # Dense E has one entry per column: gather instead of multiplying
+            expanded = M[:, self.sources] * np.asarray(self.factors)
+        else:
+            expanded = np.asarray(M @ E)
+
+        if restore_outputs and self._output_rows:
+            output_rows = np.concatenate(self._output_rows)
+            output_cols = np.concatenate(self._output_cols)
+            restored = M[output_rows, np.asarray(self.sources)[output_cols]]
+            if sp is not None and sp.issparse(M):
+                restored = np.asarray(restored).ravel()
+
+            expanded[np.concatenate(self._zero_rows), np.concatenate(self._zero_cols)] = 0.0
+            expanded[output_rows, output_cols] = restored
+
+        return expanded.tocsr() if sp is not None and sp.issparse(expanded) else expanded
+
+
+def adjust_matrix_for_multiple_outputs(Aa, Bb, manual_allocation=None, task_id=None, outputs=None):
     """
     Adjust A and B matrices for multifunctionality.
 
@@ -333,8 +464,13 @@ def adjust_matrix_for_multiple_outputs(Aa, Bb, manual_allocation=None, task_id=N
     - 0 relevant outputs  -> keep column unchanged
     - 1 relevant output   -> keep column unchanged
     - automatic allocation fails and no manual/db allocation -> keep unchanged
+
+    `outputs` are the AllocationOutputs of the task; they are loaded with
+    one query when not given.
     """
     manual_allocation = manual_allocation or {}
+    if outputs is None:
+        outputs = AllocationOutputs.load(task_id)
 
     retained_columns_Aa = Aa.iloc[:, :3].copy()
     retained_columns_Bb = Bb.iloc[:, :3].copy()
@@ -356,9 +492,7 @@ def adjust_matrix_for_multiple_outputs(Aa, Bb, manual_allocation=None, task_id=N
             f"A={A.shape}, B={B.shape}"
         )
 
-    new_A = []
-    new_B = []
-    new_column_names = []
+    expansion = ColumnExpansion(num_columns)
 
     for col in range(num_columns):
         process_name = str(process_names[col])
@@ -369,33 +503,32 @@ def adjust_matrix_for_multiple_outputs(Aa, Bb, manual_allocation=None, task_id=N
             retained_columns_Aa,
             col,
             task_id,
-            process_name
+            process_name,
+            outputs
         )
 
-        logger.warning(
-            "Process '%s' col=%s relevant output rows=%s values=%s",
-            process_name,
-            col,
-            output_rows.tolist(),
-            A[output_rows, col].tolist() if len(output_rows) > 0 else []
+        snapshot(
+            "relevant_outputs",
+            lambda: {"rows": output_rows.tolist(), "values": A[output_rows, col].tolist()},
+            process=process_name, column=col
         )
 
         num_outputs = len(output_rows)
 
         if num_outputs == 0:
-            logger.warning(
+            logger.debug(
                 "Process '%s' has no relevant Product/Co-Product outputs. Keeping column unchanged.",
                 process_name
             )
-            keep_column_unchanged(A, B, col, new_A, new_B, new_column_names, process_name)
+            expansion.keep(col, process_name)
             continue
 
         if num_outputs == 1:
-            logger.warning(
+            logger.debug(
                 "Process '%s' has one relevant output. Keeping column unchanged.",
                 process_name
             )
-            keep_column_unchanged(A, B, col, new_A, new_B, new_column_names, process_name)
+            expansion.keep(col, process_name)
             continue
 
         try:
@@ -405,11 +538,12 @@ def adjust_matrix_for_multiple_outputs(Aa, Bb, manual_allocation=None, task_id=N
                 col,
                 process_name=process_name,
                 process_id=process_id,
-                task_id=task_id
+                task_id=task_id,
+                output_rows=output_rows
             )
 
         except ManualAllocationRequired as e:
-            logger.warning(
+            logger.info(
                 "Automatic allocation failed for process '%s': %s",
                 process_name,
                 e.message
@@ -425,7 +559,8 @@ def adjust_matrix_for_multiple_outputs(Aa, Bb, manual_allocation=None, task_id=N
                     provided_factors,
                     process_id,
                     task_id=task_id,
-                    process_name=process_name
+                    process_name=process_name,
+                    output_rows=output_rows
                 )
 
             else:
@@ -433,13 +568,13 @@ def adjust_matrix_for_multiple_outputs(Aa, Bb, manual_allocation=None, task_id=N
                     retained_columns_Aa,
                     output_rows,
                     task_id,
-                    process_name
+                    process_name,
+                    outputs
                 )
 
                 if db_alloc:
                     full_alloc = {}
-                    for row in output_rows:
-                        flow_id = str(retained_columns_Aa.iloc[row, 1])
+                    for flow_id in retained_columns_Aa.iloc[output_rows, 1].astype(str):
                         full_alloc[flow_id] = float(db_alloc.get(flow_id, 0.0))
 
                     total = sum(full_alloc.values())
@@ -454,21 +589,22 @@ def adjust_matrix_for_multiple_outputs(Aa, Bb, manual_allocation=None, task_id=N
                             full_alloc,
                             process_id,
                             task_id=task_id,
-                            process_name=process_name
+                            process_name=process_name,
+                            output_rows=output_rows
                         )
                     else:
                         logger.warning(
                             "Process '%s' DB allocation sums to 0. Keeping column unchanged.",
                             process_name
                         )
-                        keep_column_unchanged(A, B, col, new_A, new_B, new_column_names, process_name)
+                        expansion.keep(col, process_name)
                         continue
                 else:
                     logger.warning(
                         "No frontend/DB allocation found for process '%s'. Keeping column unchanged.",
                         process_name
                     )
-                    keep_column_unchanged(A, B, col, new_A, new_B, new_column_names, process_name)
+                    expansion.keep(col, process_name)
                     continue
 
         except Exception as e:
@@ -477,40 +613,26 @@ def adjust_matrix_for_multiple_outputs(Aa, Bb, manual_allocation=None, task_id=N
                 process_name,
                 e
             )
-            keep_column_unchanged(A, B, col, new_A, new_B, new_column_names, process_name)
+            expansion.keep(col, process_name)
             continue
 
-        logger.warning(
-            "Final allocation for process '%s': factors=%s outputs=%s",
-            process_name,
-            allocation_factors.tolist(),
-            output_rows.tolist()
+        snapshot(
+            "final_allocation",
+            lambda: {"factors": allocation_factors.tolist(), "outputs": output_rows.tolist()},
+            process=process_name
         )
 
         # Split into one column per relevant output
-        for i, factor in enumerate(allocation_factors):
-            new_column_A = np.zeros(num_rows)
-            new_column_B = np.zeros(num_rowsB)
-
-            # Allocate the entire column proportionally first
-            new_column_A[:] = A[:, col] * factor
-            new_column_B[:] = B[:, col] * factor
-
-            # Zero-out all relevant outputs in this split column
-            new_column_A[output_rows] = 0.0
-
-            # Restore the chosen output at full original amount
-            chosen_row = output_rows[i]
-            new_column_A[chosen_row] = A[chosen_row, col]
-
-            new_A.append(new_column_A)
-            new_B.append(new_column_B)
-
-            output_flow_name = str(retained_columns_Aa.iloc[chosen_row, 0])
-            new_column_names.append(f"{process_name} - {output_flow_name}")
+        expansion.split(
+            col,
+            allocation_factors,
+            output_rows,
+            [f"{process_name} - {flow}" for flow in retained_columns_Aa.iloc[output_rows, 0].astype(str)]
+        )
 
-    adjusted_A_val = pd.DataFrame(np.column_stack(new_A), columns=new_column_names)
-    adjusted_B_val = pd.DataFrame(np.column_stack(new_B), columns=new_column_names)
+    E = expansion.matrix()
+    adjusted_A_val = pd.DataFrame(expansion.expand(A, E, restore_outputs=True), columns=expansion.names)
+    adjusted_B_val = pd.DataFrame(expansion.expand(B, E), columns=expansion.names)
 
     adjusted_A = pd.concat(
         [retained_columns_Aa.reset_index(drop=True), adjusted_A_val.reset_index(drop=True)],
@@ -521,7 +643,7 @@ def adjust_matrix_for_multiple_outputs(Aa, Bb, manual_allocation=None, task_id=N
         axis=1
     )
 
-    logger.warning("Adjusted A shape: %s", adjusted_A.shape)
-    logger.warning("Adjusted B shape: %s", adjusted_B.shape)
+    logger.debug("Adjusted A shape: %s", adjusted_A.shape)
+    logger.debug("Adjusted B shape: %s", adjusted_B.shape)
 
     return adjusted_A, adjusted_B
\ No newline at end of file
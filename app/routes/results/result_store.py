@@ -0,0 +1,206 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    RESULT_STORE_BACKEND,
+    RESULT_STORE_PATH,
+    RESULT_STORE_MAX_ENTRIES,
+    RESULT_STORE_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+
+def analysis_hash(payload) -> str:
+    """
+    Short content hash of a JSON-serializable analysis input.
+    """
+    data = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=12).hexdigest()
+
+
+def make_result_key(user, task_id, digest) -> str:
+    return f"{user}:{task_id}:{digest}"
+
+
+def key_owner(key) -> str:
+    """
+    User part of a key built by make_result_key.
+    """
+    return str(key).rsplit(":", 2)[0]
+
+
+def key_task(key) -> str:
+    """
+    Task part of a key built by make_result_key.
+    """
+    parts = str(key).rsplit(":", 2)
+    return parts[1] if len(parts) == 3 else ""
+
+
+class MemoryResultStore:
+    """
+    LRU result store held in the memory of one worker process. Values are
+    kept as JSON like in SQLiteResultStore, so callers changing a value
+    after set or get never change the stored entry.
+    """
+
+    def __init__(self, max_entries=RESULT_STORE_MAX_ENTRIES, ttl=RESULT_STORE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            stored_at, value = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+
+        return json.loads(value)
+
+    def set(self, key, value):
+        value = json.dumps(value, default=str)
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_task(self, task_id):
+        with self._lock:
+            for key in [k for k in self._entries if key_task(k) == str(task_id)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SQLiteResultStore:
+    """
+    Result store in a local SQLite file, shared by every worker process of
+    the host. Values are stored as JSON; the least recently used entries are
+    dropped beyond `max_entries`.
+    """
+
+    def __init__(self, path=RESULT_STORE_PATH, max_entries=RESULT_STORE_MAX_ENTRIES, ttl=RESULT_STORE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " task TEXT NOT NULL DEFAULT '',"
+                " value TEXT NOT NULL,"
+                " stored_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+            if "task" not in columns:
+                conn.execute("ALTER TABLE results ADD COLUMN task TEXT NOT NULL DEFAULT ''")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_results_accessed ON results (accessed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_results_task ON results (task)")
+
+    def _connect(self):
+        # One connection per thread; sqlite3 connections are not thread-safe
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, stored_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            if now - row[1] > self.ttl:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+
+            conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+
+        return json.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, task, value, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, key_task(key), json.dumps(value, default=str), now, now)
+            )
+            conn.execute("DELETE FROM results WHERE stored_at < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM results WHERE key NOT IN ("
+                " SELECT key FROM results ORDER BY accessed_at DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def delete_task(self, task_id):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results WHERE task = ?", (str(task_id),))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM results")
+
+
+RESULT_STORE_BACKENDS = {
+    "memory": MemoryResultStore,
+    "sqlite": SQLiteResultStore,
+}
+
+_result_store = None
+_result_store_lock = threading.Lock()
+
+
+def get_result_store():
+    """
+    Return the configured result store (RESULT_STORE_BACKEND), created on
+    first use. Falls back to memory if the SQLite file cannot be opened.
+    """
+    global _result_store
+
+    with _result_store_lock:
+        if _result_store is None:
+            backend = str(RESULT_STORE_BACKEND).strip().lower()
+            if backend not in RESULT_STORE_BACKENDS:
+                logger.warning("Unknown result store backend '%s'. Using memory.", backend)
+                backend = "memory"
+
+            try:
+                _result_store = RESULT_STORE_BACKENDS[backend]()
+            except sqlite3.Error as e:
+                logger.error("Cannot open result store at %s (%s). Using memory.", RESULT_STORE_PATH, e)
+                _result_store = MemoryResultStore()
+
+        return _result_store
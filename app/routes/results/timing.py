@@ -0,0 +1,154 @@
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import LCA_TIMING_LOG
+
+logger = logging.getLogger(__name__)
+
+# Trace of the run_analysis call running in this thread (None when disabled)
+_current_trace = contextvars.ContextVar("lca_trace", default=None)
+
+_NULL_STAGE = contextlib.nullcontext()
+
+_query_counter_installed = False
+_query_counter_lock = threading.Lock()
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.queries += 1
+
+
+def _install_query_counter():
+    """
+    Count DB queries of traced runs (installed on the first trace only).
+    """
+    global _query_counter_installed
+
+    with _query_counter_lock:
+        if not _query_counter_installed:
+            event.listen(Engine, "before_cursor_execute", _count_query)
+            _query_counter_installed = True
+
+
+class AnalysisTrace:
+    """
+    Wall time, CPU time (of the tracing thread) and DB query count of each
+    stage of one run_analysis call. Stages may nest; a record counts the
+    time and queries of its nested stages too.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.queries = 0
+        self._stack = []
+        self._started = time.perf_counter()
+        self._cpu_started = time.thread_time()
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        parent = self._stack[-1] if self._stack else None
+        self._stack.append(name)
+        wall, cpu, queries = time.perf_counter(), time.thread_time(), self.queries
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            self.records.append({
+                "stage": name,
+                "parent": parent,
+                "wall_ms": round((time.perf_counter() - wall) * 1000, 3),
+                "cpu_ms": round((time.thread_time() - cpu) * 1000, 3),
+                "queries": self.queries - queries,
+                **fields,
+            })
+
+    def merge(self, records, **fields):
+        """
+        Add records traced elsewhere (e.g. in a worker process).
+        """
+        parent = self._stack[-1] if self._stack else None
+        for record in records:
+            self.records.append({**record, "parent": record["parent"] or parent, **fields})
+
+    def summary(self) -> dict:
+        stages = {}
+        for record in self.records:
+            total = stages.setdefault(record["stage"], {"count": 0, "wall_ms": 0.0, "cpu_ms": 0.0, "queries": 0})
+            total["count"] += 1
+            total["wall_ms"] = round(total["wall_ms"] + record["wall_ms"], 3)
+            total["cpu_ms"] = round(total["cpu_ms"] + record["cpu_ms"], 3)
+            total["queries"] += record["queries"]
+
+        return {
+            "wall_ms": round((time.perf_counter() - self._started) * 1000, 3),
+            "cpu_ms": round((time.thread_time() - self._cpu_started) * 1000, 3),
+            "queries": self.queries,
+            "stages": stages,
+            "records": self.records,
+        }
+
+
+@contextlib.contextmanager
+def analysis_trace(enabled=None, log=LCA_TIMING_LOG):
+    """
+    Trace the stages run in this block when `enabled` or LCA_TIMING_LOG is
+    set; yields the trace, or None when tracing is off or a trace is already
+    running. With `log` the summary is logged as one JSON record.
+    """
+    if not (enabled or LCA_TIMING_LOG) or _current_trace.get() is not None:
+        yield None
+        return
+
+    _install_query_counter()
+    trace = AnalysisTrace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+        if log:
+            logger.info("run_analysis timings %s", json.dumps(trace.summary(), default=str))
+
+
+def tracing() -> bool:
+    return _current_trace.get() is not None
+
+
+def stage(name, **fields):
+    """
+    Time a stage of the current trace; a no-op when nothing is traced.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return _NULL_STAGE
+    return trace.stage(name, **fields)
+
+
+def traced(name):
+    """
+    Decorator timing every call of a function as the stage `name`.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def merge_records(records, **fields):
+    trace = _current_trace.get()
+    if trace is not None and records:
+        trace.merge(records, **fields)
+
@@ -1,6 +1,25 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from types import MappingProxyType
+
+import numpy as np
 import pandas as pd
 from app import db
 from app.models import ForestryConversionFactorsFIA, UnitConversion, UnitAlias
+from config import UNIT_REGISTRY_MAX_AGE
+
+logger = logging.getLogger(__name__)
+
+# FIA units converted through the forestry table before the SI step:
+# raw unit -> (FIA input unit, FIA output unit, multiplier, resulting unit)
+FIA_SPECIAL_UNITS = {
+    'mbf_international': ('mbf_international', 'green_tons', 0.5, 'dry_metric_tonnes'),
+    'mbf': ('mbf_international', 'green_tons', 0.5, 'dry_metric_tonnes'),
+    'standard_cords': ('standard_cords', 'dry_metric_tonnes', 1.0, 'dry_metric_tonnes'),
+}
 
 
 def _normalize_unit(unit: str) -> str:
@@ -10,43 +29,129 @@ def _normalize_unit(unit: str) -> str:
     return str(unit).strip().lower()
 
 
+class UnitRegistry:
+    """
+    Immutable snapshot of the `unit_conversion` and `unit_alias` tables.
+
+    conversions -> {
+        'kg': {'factor_to_si': 1.0, 'si_unit': 'kg', 'category': 'mass'},
+        ...
+    }
+    aliases     -> {'kilogram': 'kg', ...}
+    digest      -> hash of both, equal in every worker for the same rows
+    """
+
+    def __init__(self, conversions: dict, aliases: dict, version: int = 0):
+        self.conversions = MappingProxyType({
+            unit: MappingProxyType(meta) for unit, meta in conversions.items()
+        })
+        self.aliases = MappingProxyType(dict(aliases))
+        self.version = version
+        self.digest = hashlib.blake2b(
+            json.dumps([conversions, aliases], sort_keys=True).encode("utf-8"),
+            digest_size=12
+        ).hexdigest()
+        self.loaded_at = time.monotonic()
+
+        # FIAConversionIndex, built lazily by get_fia_index()
+        self.fia_index = None
+
+    @classmethod
+    def load(cls, version: int = 0):
+        """
+        Read both tables once (active rows only).
+        """
+        rows = UnitConversion.query.filter_by(is_active=True).all()
+        conversions = {
+            row.unit_name.strip().lower(): {
+                'factor_to_si': float(row.factor_to_si),
+                'si_unit': row.si_unit.strip().lower(),
+                'category': row.category.strip().lower()
+            }
+            for row in rows
+        }
+
+        aliases = UnitAlias.query.filter_by(is_active=True).all()
+        alias_map = {
+            row.alias_name.strip().lower(): row.canonical_unit.strip().lower()
+            for row in aliases
+        }
+
+        return cls(conversions, alias_map, version)
+
+    def resolve(self, unit: str) -> str:
+        """
+        Normalize input and resolve aliases to canonical unit.
+        """
+        unit = _normalize_unit(unit)
+        return self.aliases.get(unit, unit)
+
+    def is_stale(self, max_age: float) -> bool:
+        return time.monotonic() - self.loaded_at >= max_age
+
+
+_registry = None
+_registry_version = 0
+_registry_lock = threading.Lock()
+
+
+def get_unit_registry() -> UnitRegistry:
+    """
+    Return the shared unit registry, loading it on first use.
+
+    The registry is dropped by `invalidate_unit_registry()` when the unit
+    routes change a row, and reloaded after UNIT_REGISTRY_MAX_AGE seconds so
+    edits made through another worker are eventually picked up.
+    """
+    global _registry, _registry_version
+
+    registry = _registry
+    if registry is not None and not registry.is_stale(UNIT_REGISTRY_MAX_AGE):
+        return registry
+
+    with _registry_lock:
+        registry = _registry
+        if registry is None or registry.is_stale(UNIT_REGISTRY_MAX_AGE):
+            _registry_version += 1
+            registry = UnitRegistry.load(_registry_version)
+            _registry = registry
+
+    return registry
+
+
+def invalidate_unit_registry():
+    """
+    Drop the cached registry. Call after committing changes to
+    `unit_conversion` or `unit_alias`.
+    """
+    global _registry
+    with _registry_lock:
+        _registry = None
+
+
 def _get_alias_map():
     """
-    Returns alias -> canonical mapping from DB.
+    Returns alias -> canonical mapping from the unit registry.
     """
-    aliases = UnitAlias.query.filter_by(is_active=True).all()
-    return {
-        row.alias_name.strip().lower(): row.canonical_unit.strip().lower()
-        for row in aliases
-    }
+    return get_unit_registry().aliases
 
 
 def _get_conversion_map():
     """
-    Returns unit metadata from DB:
+    Returns unit metadata from the unit registry:
     {
         'kg': {'factor_to_si': 1.0, 'si_unit': 'kg', 'category': 'mass'},
         ...
     }
     """
-    rows = UnitConversion.query.filter_by(is_active=True).all()
-    return {
-        row.unit_name.strip().lower(): {
-            'factor_to_si': float(row.factor_to_si),
-            'si_unit': row.si_unit.strip().lower(),
-            'category': row.category.strip().lower()
-        }
-        for row in rows
-    }
+    return get_unit_registry().conversions
 
 
 def _resolve_unit(unit: str) -> str:
     """
     Normalize input and resolve aliases to canonical unit.
     """
-    unit = _normalize_unit(unit)
-    alias_map = _get_alias_map()
-    return alias_map.get(unit, unit)
+    return get_unit_registry().resolve(unit)
 
 
 # Function to convert unit-- given the value with unit and the desired (final) unit.
@@ -59,9 +164,10 @@ def unit_conversion(value, unit, final_unit='SI'):
     :param final_unit: 'SI' for standard output, or any other valid unit to convert to.
     :return: The converted value.
     """
-    conversion_map = _get_conversion_map()
+    registry = get_unit_registry()
+    conversion_map = registry.conversions
 
-    unit_normalized = _resolve_unit(unit)
+    unit_normalized = registry.resolve(unit)
 
     if unit_normalized not in conversion_map:
         raise ValueError(f"Unit '{unit}' not recognized for conversion.")
@@ -77,7 +183,7 @@ def unit_conversion(value, unit, final_unit='SI'):
         converted_value = float(value) * source_factor
         return converted_value
 
-    final_unit_normalized = _resolve_unit(final_unit)
+    final_unit_normalized = registry.resolve(final_unit)
 
     if final_unit_normalized not in conversion_map:
         raise ValueError(
@@ -98,72 +204,111 @@ def unit_conversion(value, unit, final_unit='SI'):
     return converted_value
 
 
-def clean_dataframe(df):
-    # Strip whitespace and lowercase column names
-    df.columns = df.columns.str.strip().str.lower()
+class FIAConversionIndex:
+    """
+    Lookup table for `forestry_conversion_factors_fia`.
 
-    # Apply string cleanup only to object (string) columns
-    for col in df.select_dtypes(include='object').columns:
-        df[col] = df[col].map(lambda x: x.strip().lower() if isinstance(x, str) else x)
+    Keys are normalized (input_unit, output_unit, materials, species_class,
+    species_name) tuples. For every row the reverse direction is added with the
+    reciprocal factor unless the table already defines that direction.
+    """
 
-    return df
+    def __init__(self, rows):
+        self.factors = {}
+        self.pair_factors = {}
+
+        entries = []
+        for row in rows:
+            input_unit = _normalize_fia_key(row.input_unit)
+            output_unit = _normalize_fia_key(row.output_unit)
+            qualifiers = (
+                _normalize_fia_key(row.materials),
+                _normalize_fia_key(row.species_class),
+                _normalize_fia_key(row.species_name),
+            )
+            factor = float(row.factor) if row.factor is not None else 0.0
+            entries.append((input_unit, output_unit, qualifiers, factor))
+
+        # Direct entries first so they always win over computed reciprocals
+        for input_unit, output_unit, qualifiers, factor in entries:
+            self.factors.setdefault((input_unit, output_unit) + qualifiers, factor)
+            self.pair_factors.setdefault((input_unit, output_unit), factor)
+
+        for input_unit, output_unit, qualifiers, factor in entries:
+            reciprocal = 1 / factor if factor != 0 else 0.0
+            self.factors.setdefault((output_unit, input_unit) + qualifiers, reciprocal)
+            self.pair_factors.setdefault((output_unit, input_unit), reciprocal)
+
+    @classmethod
+    def load(cls):
+        return cls(ForestryConversionFactorsFIA.query.order_by(ForestryConversionFactorsFIA.ID).all())
+
+    def lookup(self, input_unit, output_unit, materials='roundwood',
+               species_class='undefined', species_name='undefined') -> float:
+        """
+        Return the factor for the most specific matching entry:
+          1. exact material and species
+          2. same material, undefined species
+          3. any material / species for the unit pair
+        """
+        input_unit = _normalize_fia_key(input_unit)
+        output_unit = _normalize_fia_key(output_unit)
+        materials = _normalize_fia_key(materials)
+
+        candidates = (
+            (input_unit, output_unit, materials,
+             _normalize_fia_key(species_class), _normalize_fia_key(species_name)),
+            (input_unit, output_unit, materials, 'undefined', 'undefined'),
+        )
+
+        for key in candidates:
+            if key in self.factors:
+                return self.factors[key]
+
+        if (input_unit, output_unit) in self.pair_factors:
+            return self.pair_factors[(input_unit, output_unit)]
+
+        raise ValueError("No matching conversion found in FIA conversion table for the provided parameters.")
+
+
+def _normalize_fia_key(value) -> str:
+    return _normalize_unit(value) if value is not None else ''
+
+
+def get_fia_index() -> FIAConversionIndex:
+    """
+    Return the FIA index attached to the current unit registry, building it
+    on first use. It is rebuilt together with the registry.
+    """
+    registry = get_unit_registry()
+
+    if registry.fia_index is None:
+        with _registry_lock:
+            if registry.fia_index is None:
+                registry.fia_index = FIAConversionIndex.load()
+
+    return registry.fia_index
 
 
 def unit_conversion_FIA(value, input_unit, output_unit, materials='roundwood', species_class='undefined', species_name='undefined'):
-    all_factors = ForestryConversionFactorsFIA.query.all()
-    df = pd.DataFrame([{
-        'materials': row.materials,
-        'species_class': row.species_class,
-        'species_name': row.species_name,
-        'input_unit': row.input_unit,
-        'output_unit': row.output_unit,
-        'factor': row.factor,
-    } for row in all_factors])
-
-    # Clean the dataframe (convert everything to lowercase and strip whitespace)
-    df = clean_dataframe(df)
-
-    input_unit = _normalize_unit(input_unit)
-    output_unit = _normalize_unit(output_unit)
-    materials = _normalize_unit(materials)
-    species_class = _normalize_unit(species_class)
-    species_name = _normalize_unit(species_name)
-
-    # Optional: include material/species filtering if desired
-    conversion_row = df[
-        (df['input_unit'] == input_unit) &
-        (df['output_unit'] == output_unit)
-    ]
-
-    if conversion_row.empty:
-        conversion_row = df[
-            (df['input_unit'] == output_unit) &
-            (df['output_unit'] == input_unit)
-        ]
-
-        if conversion_row.empty:
-            raise ValueError("No matching conversion found in FIA conversion table for the provided parameters.")
-
-        factor_value = float(conversion_row['factor'].values[0])
-
-        if factor_value == 0:
-            print("[Warning] Conversion factor is 0. Returning converted value as 0.")
-            conversion_factor = 0
-        else:
-            conversion_factor = 1 / factor_value
-    else:
-        factor_value = float(conversion_row['factor'].values[0])
-
-        if factor_value == 0:
-            print("[Warning] Conversion factor is 0. Returning converted value as 0.")
-            conversion_factor = 0
-        else:
-            conversion_factor = factor_value
+    conversion_factor = get_fia_index().lookup(
+        input_unit,
+        output_unit,
+        materials=materials,
+        species_class=species_class,
+        species_name=species_name
+    )
+
+    if conversion_factor == 0:
+        logger.warning(
+            "FIA conversion factor from '%s' to '%s' is 0. Returning converted value as 0.",
+            input_unit, output_unit
+        )
 
     value = float(value)
     converted_value = value * conversion_factor
 
-    return converted_value, output_unit
+    return converted_value, _normalize_unit(output_unit)
 
 
 def get_si_unit(unit):
@@ -173,11 +318,87 @@ def get_si_unit(unit):
     :param unit: The input unit (e.g., 'lb', 'ft3', 'g', 'ton', etc.)
     :return: The equivalent SI unit (e.g., 'kg', 'm3', etc.)
     """
-    conversion_map = _get_conversion_map()
+    registry = get_unit_registry()
+    conversion_map = registry.conversions
 
-    unit_normalized = _resolve_unit(unit)
+    unit_normalized = registry.resolve(unit)
 
     if unit_normalized not in conversion_map:
         raise ValueError(f"SI equivalent not found for unit: '{unit}'")
 
-    return conversion_map[unit_normalized]['si_unit']
\ No newline at end of file
+    return conversion_map[unit_normalized]['si_unit']
+
+
+def _unit_group_factor(registry: UnitRegistry, unit_key: str):
+    """
+    Return (factor_to_si, si_unit) for one normalized raw unit, including the
+    FIA special cases (mbf -> green tons x 0.5 -> dry tonnes, cords -> dry tonnes).
+    """
+    factor = 1.0
+    unit = unit_key
+
+    if unit_key in FIA_SPECIAL_UNITS:
+        fia_input, fia_output, multiplier, unit = FIA_SPECIAL_UNITS[unit_key]
+        fia_factor, _ = unit_conversion_FIA(1.0, fia_input, fia_output)
+        factor = float(fia_factor) * multiplier
+
+    meta = registry.conversions.get(registry.resolve(unit))
+    if meta is None:
+        raise ValueError(f"Unit '{unit}' not recognized for conversion.")
+
+    return factor * meta['factor_to_si'], meta['si_unit']
+
+
+def unit_conversion_array(values, units):
+    """
+    Convert a block of values to SI, one unit per row.
+
+    :param values: NumPy array of shape (n,) or (n, k); row i is expressed in units[i].
+    :param units: Sequence of n raw unit strings (None / blank = no unit).
+    :return: (converted_values, si_units)
+        converted_values -> float64 array with the shape of `values`
+        si_units         -> object array of n SI units; rows without a unit keep
+                            it as given ('' for a blank unit, None for a missing one)
+
+    Rows are grouped by unit and each group is scaled by a single factor, so the
+    Python work is proportional to the number of distinct units. Rows whose unit
+    cannot be converted are returned unchanged with their raw unit.
+    """
+    values = np.asarray(values, dtype=float)
+    units = pd.Series(list(units), dtype=object)
+
+    if values.shape[0] != len(units):
+        raise ValueError(
+            f"values has {values.shape[0]} rows but {len(units)} units were given."
+        )
+
+    raw_units = units.astype(str).str.strip()
+    has_unit = units.notna() & (raw_units != "")
+    keys = raw_units.str.lower().where(has_unit, "")
+
+    codes, distinct = pd.factorize(keys, sort=False)
+
+    registry = get_unit_registry()
+    factors = np.ones(len(distinct), dtype=float)
+    group_si = np.empty(len(distinct), dtype=object)
+    group_failed = np.zeros(len(distinct), dtype=bool)
+
+    for g, unit_key in enumerate(distinct):
+        if unit_key == "":
+            continue
+
+        try:
+            factors[g], group_si[g] = _unit_group_factor(registry, unit_key)
+        except Exception as e:
+            logger.warning("[Warning] Conversion error for unit '%s' -> SI: %s", unit_key, e)
+            group_failed[g] = True
+
+    row_factors = factors[codes]
+    converted = values * row_factors.reshape((-1,) + (1,) * (values.ndim - 1))
+
+    si_units = group_si[codes]
+    keep_raw = group_failed[codes] | (~has_unit & units.notna()).to_numpy()
+    si_units[keep_raw] = raw_units.to_numpy(dtype=object)[keep_raw]
+
+    return converted, si_units
+
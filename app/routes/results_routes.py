@@ -4,9 +4,14 @@ from app import db
 import logging
 
 # Import the analysis function
-from .results.main import run_analysis, graph_results_single
-
-logging.basicConfig(level=logging.DEBUG)
+from .results.main import (
+    run_analysis, graph_results_single, get_stored_contribution_table, render_chart, render_charts,
+    CHART_OUTPUT_PNG, CHART_OUTPUT_SERIES
+)
+from .results.jobs import analysis_jobs, JOB_DONE, JOB_FAILED
+from .results.result_store import key_task
+from .results.diagnostics import get_diagnostics
+from .results.Forest_growth_model import init_param_variable
 
 results_bp = Blueprint('results_bp', __name__)
 
@@ -36,7 +41,13 @@ def graph_results():
     try:
         # run_analysis now returns a dictionary: 
         # { "individual_results": [...], "combined_contribution_table": [...] }
-        analysis_output = run_analysis(rows) 
+        analysis_output = run_analysis(
+            rows,
+            user=session['username'],
+            render_charts=payload.get('render_charts', False),
+            timings=bool(payload.get('timings', False)),
+            debug=bool(payload.get('debug', False))
+        )
     except Exception as e:
         current_app.logger.error(f"Error in run_analysis: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
@@ -53,11 +64,186 @@ def graph_results():
 
     # --- The Core Fix ---
     # Return the full dictionary structure so the frontend can display all results.
-    return jsonify({
+    response = {
         "individual_results": analysis_output['individual_results'],
         "combined_contribution_table": analysis_output['combined_contribution_table']
+    }
+    for field in ('timings', 'diagnostics_id'):
+        if field in analysis_output:
+            response[field] = analysis_output[field]
+    return jsonify(response)
+
+# --- Route: Diagnostics snapshots of a run ---
+@results_bp.route('/graph_results/diagnostics/<run_id>', methods=['GET'])
+def graph_results_diagnostics(run_id):
+    """
+    Matrix snapshots of a /graph_results call made with "debug": true (or
+    sampled), while it is in this worker's diagnostics buffer.
+    """
+    if 'username' not in session:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    diagnostics = get_diagnostics(run_id, session['username'])
+    if diagnostics is None:
+        return jsonify({"error": "Diagnostics not found or expired"}), 404
+    return jsonify(diagnostics)
+
+# --- Routes: Asynchronous analysis jobs ---
+@results_bp.route('/graph_results/jobs', methods=['POST'])
+def submit_graph_results_job():
+    if 'username' not in session:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    payload = request.get_json()
+    if not payload:
+        return jsonify({"error": "No input data provided"}), 400
+
+    rows = payload.get('rows')
+    if not rows:
+        return jsonify({"error": "No rows data provided"}), 400
+
+    if 'render_charts' in payload:
+        rows = [{"render_charts": payload['render_charts'], **row} for row in rows]
+
+    try:
+        # The job runs outside this request, so read the user's parameters now
+        params = init_param_variable()
+        job = analysis_jobs.submit(
+            current_app._get_current_object(), session['username'], rows, params, run_analysis
+        )
+    except Exception as e:
+        current_app.logger.error(f"Error submitting analysis job: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": url_for('results_bp.graph_results_job_status', job_id=job.id),
+        "result_url": url_for('results_bp.graph_results_job_result', job_id=job.id)
+    }), 202
+
+
+@results_bp.route('/graph_results/jobs/<job_id>', methods=['GET'])
+def graph_results_job_status(job_id):
+    if 'username' not in session:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    job = analysis_jobs.get(job_id, session['username'])
+    if job is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+
+    return jsonify(job.to_status())
+
+
+@results_bp.route('/graph_results/jobs/<job_id>/result', methods=['GET'])
+def graph_results_job_result(job_id):
+    if 'username' not in session:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    job = analysis_jobs.get(job_id, session['username'])
+    if job is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+
+    if job.status == JOB_FAILED:
+        return jsonify({"error": job.error}), 500
+
+    if job.status != JOB_DONE:
+        return jsonify(job.to_status()), 202
+
+    # Same format as /graph_results
+    return jsonify({
+        "individual_results": job.result['individual_results'],
+        "combined_contribution_table": job.result['combined_contribution_table']
     })
 
+def chart_response(chart, output):
+    if output == CHART_OUTPUT_SERIES:
+        return {"chart_series": chart}
+    return {"chart_base64": chart}
+
+# --- Route: Chart of a stored analysis result ---
+@results_bp.route('/graph_results/chart', methods=['GET'])
+def graph_results_chart():
+    """
+    Render on demand from the contribution table stored by /graph_results,
+    e.g. /graph_results/chart?result_key=...&chart_type=bar&theme=vibrant
+
+    `output=series` returns the chart series (`chart_series`) for drawing
+    in the browser instead of a PNG.
+    """
+    if 'username' not in session:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    result_key = request.args.get('result_key')
+    chart_type = request.args.get('chart_type', 'pie')
+    theme = request.args.get('theme', 'vibrant')
+    output = request.args.get('output', CHART_OUTPUT_PNG)
+
+    if not result_key:
+        return jsonify({"error": "No result key provided"}), 400
+
+    try:
+        data, task_name = get_stored_contribution_table(result_key, session['username'])
+        if not data:
+            return jsonify({"error": "Result not found or expired"}), 404
+
+        chart = render_chart(
+            data, chart_type, theme,
+            title=f"Contribution Analysis: {task_name}",
+            user=session['username'],
+            task_id=key_task(result_key),
+            output=output
+        )
+        if chart is None:
+            return jsonify({"error": "No data available"}), 400
+        return jsonify(chart_response(chart, output))
+    except Exception as e:
+        current_app.logger.error(f"Error generating chart: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+# --- Route: Charts of several stored analysis results ---
+@results_bp.route('/graph_results/charts', methods=['POST'])
+def graph_results_charts():
+    """
+    Render a batch of charts (e.g. a comparison page) concurrently:
+    {"charts": [{"result_key": ..., "chart_type": "pie", "theme": "vibrant", "output": "png"}, ...]}
+    Returns {"charts": [...]} in the same order, each with chart_base64,
+    chart_series or error.
+    """
+    if 'username' not in session:
+        return jsonify({"error": "Unauthorized"}), 403
+
+    payload = request.get_json()
+    requested = (payload or {}).get('charts')
+    if not requested:
+        return jsonify({"error": "No charts requested"}), 400
+
+    charts, outputs = [], [None] * len(requested)
+    for n, chart in enumerate(requested):
+        result_key = chart.get('result_key')
+        data, task_name = get_stored_contribution_table(result_key, session['username'])
+        if not data:
+            outputs[n] = {"error": "Result not found or expired"}
+            continue
+        charts.append((n, {
+            "data": data,
+            "chart_type": chart.get('chart_type', 'pie'),
+            "theme": chart.get('theme', 'vibrant'),
+            "title": f"Contribution Analysis: {task_name}",
+            "task_id": key_task(result_key),
+            "output": chart.get('output', CHART_OUTPUT_PNG),
+        }))
+
+    try:
+        rendered = render_charts([chart for _, chart in charts], user=session['username'])
+    except Exception as e:
+        current_app.logger.error(f"Error generating charts: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
+
+    for (n, _), chart in zip(charts, rendered):
+        outputs[n] = chart
+    return jsonify({"charts": outputs})
+
 # --- Route: Generate Single Task Graph ---
 @results_bp.route('/graph_results_single', methods=['POST'])
 def graph_results_single_route():
@@ -68,18 +254,26 @@ def graph_results_single_route():
     logging.debug("Payload : %s", payload)
     task_name = payload.get('task_name', 'Task')
     task_id = payload.get('task_id', '0')
+    result_key = payload.get('result_key')
     process_contribution = payload.get('process_contribution', [])
     chart_type = payload.get('chart_type', 'pie')
     theme = payload.get('theme', 'vibrant')
+    output = payload.get('output', CHART_OUTPUT_PNG)
 
     if not process_contribution:
         return jsonify({"error": "No contribution data provided"}), 400
 
     try:
-        chart_base64 = graph_results_single(chart_type, theme, task_name, task_id) 
-        if chart_base64 is None:
+        chart = graph_results_single(
+            chart_type, theme, task_name, task_id,
+            result_key=result_key,
+            user=session['username'],
+            process_contribution=process_contribution,
+            output=output
+        )
+        if chart is None:
             return jsonify({"error": "No data available"}), 400
-        return jsonify({"chart_base64": chart_base64})
+        return jsonify(chart_response(chart, output))
     except Exception as e:
         current_app.logger.error(f"Error generating single chart: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
\ No newline at end of file
@@ -3,6 +3,7 @@ from datetime import datetime, timezone
 from sqlalchemy import or_, cast, String
 from app import db
 from app.models import UnitConversion, UnitAlias
+from app.routes.results.unit_conversion import invalidate_unit_registry
 
 uoc_bp = Blueprint('uoc_bp', __name__)
 
@@ -175,6 +176,7 @@ def registeruoc():
                 return jsonify({"success": False, "message": "No valid Units of Conversion to insert."}), 400
 
             db.session.commit()
+            invalidate_unit_registry()
             return jsonify({"success": True, "message": f"{added_count} Unit(s) of Conversion registered successfully."}), 200
 
         except Exception as e:
@@ -235,6 +237,7 @@ def updateuoc():
             uoc_to_update.is_active = isactive
 
             db.session.commit()
+            invalidate_unit_registry()
             return jsonify({"success": True, "message": "Unit of Conversion updated successfully."}), 200
 
         except Exception as e:
@@ -261,6 +264,7 @@ def delete_uoc(uoc_id):
     try:
         db.session.delete(uoc)
         db.session.commit()
+        invalidate_unit_registry()
         return jsonify({"success": True, "message": "Unit of conversion deleted successfully"})
     except Exception as e:
         db.session.rollback()
@@ -295,6 +299,7 @@ def delete_uocs():
             results.append({"id": uoc_id, "status": "deleted"})
 
         db.session.commit()
+        invalidate_unit_registry()
 
     except Exception:
         db.session.rollback()
@@ -637,6 +637,7 @@ document.addEventListener("DOMContentLoaded", () => {
                     body: JSON.stringify({
                         task_id: selectedTaskId,
                         task_name: selectedTaskName,
+                        result_key: taskResult.result_key || null,
                         process_contribution: selectedTaskContribution,
                         chart_type: selectedChartType,
                         theme: selectedChartTheme
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()  # Load environment variables from .env
@@ -59,3 +60,63 @@ LEVELS = {
     4: 'Manager/Supervisor',
     5: 'Full Access (Non-Superuser Admin)'
 }
+
+# 5. Results engine settings
+# Seconds between fingerprint checks of the `lci` table by the in-memory LCI factor store.
+LCI_STORE_CHECK_INTERVAL = float(os.getenv("LCI_STORE_CHECK_INTERVAL", "60"))
+# Seconds before the cached unit-conversion registry is reloaded from the DB.
+UNIT_REGISTRY_MAX_AGE = float(os.getenv("UNIT_REGISTRY_MAX_AGE", "300"))
+# Matrix backend for run_analysis: 'dense', 'sparse' (needs scipy) or 'auto'.
+LCA_MATRIX_BACKEND = os.getenv("LCA_MATRIX_BACKEND", "dense")
+# With 'auto', number of process columns from which the sparse backend is used.
+LCA_SPARSE_MIN_PROCESSES = int(os.getenv("LCA_SPARSE_MIN_PROCESSES", "200"))
+# Max number of cached factorizations of A (0 disables the cache).
+FACTOR_CACHE_MAX_ENTRIES = int(os.getenv("FACTOR_CACHE_MAX_ENTRIES", "64"))
+# Max memory, in bytes, held by cached factorizations of A.
+FACTOR_CACHE_MAX_BYTES = int(os.getenv("FACTOR_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Worker processes for run_analysis (0 runs every task in the request thread).
+LCA_PARALLEL_WORKERS = int(os.getenv("LCA_PARALLEL_WORKERS", "0"))
+# Threads running background analysis jobs (/graph_results/jobs).
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+# Seconds a finished analysis job and its result are kept.
+ANALYSIS_JOB_TTL = float(os.getenv("ANALYSIS_JOB_TTL", "3600"))
+# Store for per-task chart data between /graph_results and /graph_results_single:
+# 'sqlite' (shared by all workers of the host) or 'memory' (per worker).
+RESULT_STORE_BACKEND = os.getenv("RESULT_STORE_BACKEND", "sqlite")
+RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH", os.path.join(tempfile.gettempdir(), "lca_result_store.sqlite3"))
+RESULT_STORE_MAX_ENTRIES = int(os.getenv("RESULT_STORE_MAX_ENTRIES", "5000"))
+# Seconds a stored result stays available.
+RESULT_STORE_TTL = float(os.getenv("RESULT_STORE_TTL", "86400"))
+# Reuse stored run_analysis results for identical rows while nothing they depend on changed.
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Tasks whose A/B matrices are kept in memory and patched on datasheet edits (0 disables).
+TASK_MATRIX_CACHE_MAX_ENTRIES = int(os.getenv("TASK_MATRIX_CACHE_MAX_ENTRIES", "32"))
+# Worker processes rendering PNG charts, per gunicorn worker (0 renders in the request thread).
+CHART_RENDER_WORKERS = int(os.getenv("CHART_RENDER_WORKERS", "0"))
+# Log wall time, CPU time and DB queries of each run_analysis stage as one JSON record per run.
+LCA_TIMING_LOG = os.getenv("LCA_TIMING_LOG", "false").lower() in ("1", "true", "yes")
+# Share of run_analysis calls capturing matrix snapshots without a debug flag (0 to 1).
+LCA_DIAGNOSTICS_SAMPLE_RATE = float(os.getenv("LCA_DIAGNOSTICS_SAMPLE_RATE", "0"))
+# Diagnostics runs kept in memory per worker (see /graph_results/diagnostics/<id>).
+LCA_DIAGNOSTICS_BUFFER = int(os.getenv("LCA_DIAGNOSTICS_BUFFER", "20"))
+# Directory receiving one JSON dump file per diagnostics run (empty: no dump files).
+LCA_DIAGNOSTICS_DIR = os.getenv("LCA_DIAGNOSTICS_DIR", "")
+# Level of the root logger.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Gunicorn worker processes and threads per worker (gunicorn.conf.py; size the DB pool of each worker).
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", "1"))
+# DB connections kept open per worker (default: one per request thread and analysis job thread).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(GUNICORN_THREADS + ANALYSIS_JOB_WORKERS)))
+# Connections a worker may open above DB_POOL_SIZE under bursts.
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "2"))
+# Seconds a request waits for a free connection before failing.
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds after which a pooled connection is replaced (keep below the server's wait_timeout).
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "280"))
+# Test connections on checkout and reconnect when the server dropped them.
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Server-side limit, in seconds, on a single statement (0: no limit).
+DB_STATEMENT_TIMEOUT = float(os.getenv("DB_STATEMENT_TIMEOUT", "0"))
+# Connections opened per worker at boot (capped at DB_POOL_SIZE).
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", "1"))
@@ -0,0 +1,6 @@
+# Gunicorn settings, read from the working directory by `gunicorn run:app`.
+# The same values size the DB pool of each worker (see config.py).
+from config import WEB_CONCURRENCY, GUNICORN_THREADS
+
+workers = WEB_CONCURRENCY
+threads = GUNICORN_THREADS
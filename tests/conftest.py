@@ -0,0 +1,126 @@
+import os
+import sys
+import zlib
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep results and charts inside the test process
+os.environ.setdefault("RESULT_STORE_BACKEND", "memory")
+os.environ.setdefault("CHART_RENDER_WORKERS", "0")
+
+from app import db  # noqa: E402
+
+
+class _BitXor:
+    """
+    BIT_XOR aggregate (MySQL) for SQLite.
+    """
+
+    def __init__(self):
+        self.value = 0
+
+    def step(self, value):
+        self.value ^= int(value or 0)
+
+    def finalize(self):
+        return self.value
+
+
+def _add_mysql_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function("crc32", 1, lambda s: zlib.crc32(str(s).encode()))
+    dbapi_connection.create_aggregate("bit_xor", 1, _BitXor)
+
+
+LCI_COLUMNS = (
+    'GWP', 'Smog', 'Acidification', 'Eutrophication', 'Carcinogenics',
+    'Non_carcinogenics', 'Respiratory_effects', 'Ecotoxicity',
+    'Fossil_fuel_depletion', 'Ozone_depletion'
+)
+
+
+def seed(session):
+    """
+    Two processes: Harvest produces Logs from Diesel and emits CO2; Sawmill
+    turns Logs into Lumber with Sawdust (CHK 0) and Chips (CHK 1) as
+    co-products, using Electricity.
+    """
+    from app.models import (
+        User, Tasks, Item, Step, UOM, UnitConversion, UnitAlias,
+        BElement, Element, Datasheet, LCI
+    )
+
+    session.add(User(id=1, username='admin', password='x', regeneration_mode=0))
+    session.add(Tasks(IDT=10, TName='T1', Region='NE', user_id=1))
+
+    items = {'I1': 'Product', 'I2': 'Co-Products', 'I3': 'Input Materials and Energy', 'I4': 'Emission'}
+    for idi, name in items.items():
+        session.add(Item(IDI=idi, IName=name))
+    for ids, name in {'S1': 'Harvest', 'S2': 'Sawmill', 'S3': 'Kiln'}.items():
+        session.add(Step(IDS=ids, SName=name))
+    for idu, unit in {'U1': 'kg', 'U2': 't', 'U3': 'kWh', 'U4': 'm3'}.items():
+        session.add(UOM(IDU=idu, UName=unit, Unit=unit))
+
+    conversions = [('kg', 1, 'mass', 'kg'), ('t', 1000, 'mass', 'kg'), ('kWh', 1, 'energy', 'kWh'), ('m3', 1, 'volume', 'm3')]
+    for i, (unit, factor, category, si_unit) in enumerate(conversions):
+        session.add(UnitConversion(id=i, unit_name=unit, factor_to_si=factor, si_unit=si_unit, category=category))
+    session.add(UnitAlias(id=1, alias_name='tonne', canonical_unit='t'))
+
+    flows = {1: 'Logs', 2: 'Lumber', 3: 'Sawdust', 4: 'Electricity', 5: 'Diesel', 6: 'Carbon dioxide', 8: 'Chips'}
+    for idbe, name in flows.items():
+        session.add(BElement(IDBE=idbe, EName=name, user_id=1))
+    session.flush()
+
+    elements = [(101, 1, 'I1'), (102, 1, 'I3'), (103, 2, 'I1'), (104, 3, 'I2'),
+                (105, 4, 'I3'), (106, 5, 'I3'), (107, 6, 'I4'), (109, 8, 'I2')]
+    for ide, idbe, idi in elements:
+        session.add(Element(IDE=ide, IDBE=idbe, IDI=idi, user_id=1))
+    session.flush()
+
+    rows = [
+        (1, 101, 'S1', 'U2', 2.0, 0),
+        (2, 106, 'S1', 'U1', 5.0, 0),
+        (3, 107, 'S1', 'U1', 7.0, 0),
+        (4, 102, 'S2', 'U1', 2000.0, 0),
+        (5, 103, 'S2', 'U4', 1.0, 0),
+        (6, 104, 'S2', 'U1', 300.0, 0),
+        (7, 109, 'S2', 'U1', 50.0, 1),
+        (8, 105, 'S2', 'U3', 40.0, 0),
+    ]
+    for idd, ide, ids, idu, value, chk in rows:
+        session.add(Datasheet(IDD=idd, IDT=10, IDE=ide, IDS=ids, IDU=idu, ValueD=value, CHK=chk, user_id=1))
+
+    lci = {
+        'Diesel': [3.2, 0.1, 0.01, 0.001, 1e-6, 2e-6, 3e-4, 0.5, 4.0, 1e-9],
+        'Electricity': [0.4, 0.01, 0.002, 3e-4, 1e-7, 1e-7, 1e-5, 0.2, 0.9, 1e-10],
+        'Chips': [-0.1, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+    }
+    for name, values in lci.items():
+        session.add(LCI(Background_process=name, Code='C', Unit='kg', **dict(zip(LCI_COLUMNS, values))))
+
+    session.commit()
+
+
+@pytest.fixture
+def app():
+    app = Flask('app', root_path=os.path.join(ROOT, 'app'))
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
+    app.config['SECRET_KEY'] = 'test'
+    db.init_app(app)
+
+    with app.app_context():
+        event.listen(db.engine, "connect", _add_mysql_functions)
+        db.engine.dispose()
+
+        from app import models  # noqa: F401
+        db.create_all()
+        seed(db.session)
+
+        yield app
+
+        db.session.remove()
+        db.drop_all()
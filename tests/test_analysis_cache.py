@@ -0,0 +1,55 @@
+import pytest
+
+from app import db
+from app.models import LCI, UnitConversion
+from app.routes.results.analysis_cache import AnalysisCache
+from app.routes.results.lci_store import lci_store
+from app.routes.results.unit_conversion import invalidate_unit_registry
+
+ROW = {'task': 10, 'taskText': 'T1', 'flow': '2', 'functional_unit': 1, 'unit': 'U4', 'impact_category': 'GWP'}
+
+
+@pytest.fixture
+def cache_key(app):
+    invalidate_unit_registry()
+    lci_store.refresh(force=True)
+    cache = AnalysisCache(enabled=True)
+
+    def key():
+        lci_store.refresh(force=True)
+        return cache.key('admin', 10, ROW, cache.context([10], {'regeneration_mode': 0}))
+
+    return key
+
+
+def test_key_is_stable_across_reloads(cache_key):
+    before = cache_key()
+    invalidate_unit_registry()
+    assert cache_key() == before
+
+
+def test_key_changes_with_unit_table(cache_key):
+    before = cache_key()
+    UnitConversion.query.filter_by(unit_name='t').one().factor_to_si = 907.18
+    db.session.commit()
+    invalidate_unit_registry()
+    assert cache_key() != before
+
+
+def test_key_changes_when_lci_factors_are_swapped(cache_key):
+    before = cache_key()
+    diesel = LCI.query.filter_by(Background_process='Diesel').one()
+    electricity = LCI.query.filter_by(Background_process='Electricity').one()
+    diesel.GWP, electricity.GWP = electricity.GWP, diesel.GWP
+    db.session.commit()
+    assert cache_key() != before
+
+
+def test_key_changes_when_lci_edits_cancel_out(cache_key):
+    before = cache_key()
+    diesel = LCI.query.filter_by(Background_process='Diesel').one()
+    electricity = LCI.query.filter_by(Background_process='Electricity').one()
+    diesel.Smog += 1
+    electricity.Smog -= 1
+    db.session.commit()
+    assert cache_key() != before
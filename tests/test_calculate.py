@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from app.routes.results.calculate import (
+    calculate_scaling_vector, calculate_scaled_contribution, calculate_category_impacts, to_backend
+)
+from app.routes.results.lci_store import LCIFactorStore, LCI_CATEGORIES
+
+pytest.importorskip("scipy.sparse")
+
+A = np.array([
+    [2.0, -0.5, 0.0],
+    [0.0, 1.0, -0.25],
+    [-0.1, 0.0, 1.0],
+])
+B = np.array([
+    [5.0, 0.0, 1.0],
+    [0.0, 40.0, 0.0],
+    [0.0, 0.0, 0.0],
+    [0.5, -2.0, 3.0],
+])
+LCI_FLOW = ["Diesel", "Electricity", "Logs", "Chips"]
+
+
+@pytest.fixture
+def store(app):
+    store = LCIFactorStore()
+    store.refresh(force=True)
+    return store
+
+
+def test_sparse_and_dense_scaling_vectors_match():
+    F = np.array([[1.0, 0.0], [0.0, 2.0], [0.0, 0.5]])
+
+    dense = calculate_scaling_vector(to_backend(A, "dense"), F)
+    sparse = calculate_scaling_vector(to_backend(A, "sparse", fmt="csc"), F)
+
+    np.testing.assert_allclose(sparse, dense, rtol=1e-12)
+    np.testing.assert_allclose(A @ dense, F, atol=1e-12)
+
+
+@pytest.mark.parametrize("category", ["GWP", "Smog"])
+def test_sparse_and_dense_contributions_match(store, category):
+    s = calculate_scaling_vector(A, np.array([1.0, 0.0, 0.0]))
+
+    dense = calculate_scaled_contribution(to_backend(B, "dense"), s, LCI_FLOW, category, store=store)
+    sparse = calculate_scaled_contribution(to_backend(B, "sparse"), s, LCI_FLOW, category, store=store)
+
+    c = np.array([store.get(flow, category) or 0.0 for flow in LCI_FLOW])
+    np.testing.assert_allclose(dense, (c @ B) * s, rtol=1e-12)
+    np.testing.assert_allclose(sparse, dense, rtol=1e-12)
+
+
+def test_sparse_and_dense_category_impacts_match(store):
+    s = calculate_scaling_vector(A, np.array([0.0, 1.0, 0.0]))
+    g = B @ s
+
+    dense = calculate_category_impacts(g, to_backend(B, "dense"), s, LCI_FLOW, LCI_CATEGORIES, store=store)
+    sparse = calculate_category_impacts(g, to_backend(B, "sparse"), s, LCI_FLOW, LCI_CATEGORIES, store=store)
+
+    for dense_part, sparse_part in zip(dense, sparse):
+        np.testing.assert_allclose(sparse_part, dense_part, rtol=1e-12)
+    np.testing.assert_allclose(dense[1].sum(axis=1), dense[0], rtol=1e-12)
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from app.routes.results.calculate import calculate_scaling_vector
+from app.routes.results.factorization import Factorization, FactorizationCache, factorization_cache
+
+sp = pytest.importorskip("scipy.sparse")
+
+A = np.array([
+    [4.0, -1.0, 0.0, 0.0],
+    [-2.0, 5.0, -1.0, 0.0],
+    [0.0, -1.0, 3.0, -0.5],
+    [0.0, 0.0, -1.0, 2.0],
+])
+SINGULAR = np.array([
+    [1.0, -1.0, 0.0],
+    [-1.0, 1.0, 0.0],
+    [0.0, -2.0, 1.0],
+])
+NON_SQUARE = np.vstack([A, [0.0, 1.0, 0.0, -1.0]])
+
+
+def demands(n, k=3):
+    return np.random.default_rng(1).normal(size=(n, k))
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    factorization_cache.clear()
+    yield
+    factorization_cache.clear()
+
+
+@pytest.mark.parametrize("matrix, kind", [
+    (A, "lu"),
+    (SINGULAR, "pinv"),
+    (NON_SQUARE, "pinv"),
+    (sp.csc_matrix(A), "sparse_lu"),
+    (sp.csc_matrix(SINGULAR), "sparse_lsqr"),
+    (sp.csc_matrix(NON_SQUARE), "sparse_lsqr"),
+])
+def test_cached_factorization_matches_a_fresh_solve(matrix, kind):
+    dense = matrix.toarray() if sp.issparse(matrix) else matrix
+    F = demands(dense.shape[0])
+    expected = np.linalg.pinv(dense) @ F
+
+    assert Factorization.build(matrix).kind == kind
+
+    first = calculate_scaling_vector(matrix, F[:, 0], task_id=10)
+    cached = calculate_scaling_vector(matrix, F[:, 0], task_id=10)
+    np.testing.assert_allclose(first, expected[:, 0], atol=1e-8)
+    np.testing.assert_array_equal(cached, first)
+    assert len(factorization_cache._entries) == 1
+
+    # Stacked demands give the per-column solutions
+    stacked = calculate_scaling_vector(matrix, F, task_id=10)
+    per_column = np.column_stack([
+        calculate_scaling_vector(matrix, F[:, j], task_id=10) for j in range(F.shape[1])
+    ])
+    np.testing.assert_allclose(stacked, per_column, atol=1e-10)
+    np.testing.assert_allclose(stacked, expected, atol=1e-8)
+
+
+def test_changed_matrix_is_not_served_from_the_cache():
+    f = demands(4)[:, 0]
+    calculate_scaling_vector(A, f, task_id=10)
+
+    edited = A.copy()
+    edited[0, 0] = 8.0
+    np.testing.assert_allclose(calculate_scaling_vector(edited, f, task_id=10), np.linalg.solve(edited, f))
+    assert len(factorization_cache._entries) == 2
+
+
+def test_cache_evicts_beyond_max_bytes():
+    cache = FactorizationCache(max_entries=10, max_bytes=Factorization.build(A).nbytes)
+    cache.get_or_build(1, A)
+    cache.get_or_build(2, A)
+
+    assert [key[0] for key in cache._entries] == ["2"]
+
+
+def test_datasheet_edit_invalidates_task_factorizations(app):
+    from app.routes.datasheet_routes import datasheet_changed
+
+    f = demands(4)[:, 0]
+    calculate_scaling_vector(A, f, task_id=10)
+    calculate_scaling_vector(A, f, task_id=11)
+
+    datasheet_changed(10, [2])
+
+    assert [key[0] for key in factorization_cache._entries] == ["11"]
+
+
+def test_stacked_task_group_solve_matches_per_row_solves(app):
+    from app.routes.results.main import build_task_model, build_final_demand, solve_task_group
+
+    rows = [
+        {"task_id": 10, "task_text": "T1", "flow": "2", "functional_unit": 1, "unit_text": "m3"},
+        {"task_id": 10, "task_text": "T1", "flow": "2", "functional_unit": 3, "unit_text": "m3"},
+        {"task_id": 10, "task_text": "T1", "flow": "1", "functional_unit": 2, "unit_text": "t"},
+    ]
+    model = build_task_model(10, "T1", 0, {}, "dense")
+    final_demands = [build_final_demand(spec, model["flow_ids"]) for spec in rows]
+
+    stacked = solve_task_group(model, final_demands, 10, "T1")
+    per_row = np.column_stack([
+        solve_task_group(model, [f], 10, "T1")[:, 0] for f in final_demands
+    ])
+
+    assert stacked.shape == (len(model["process_names"]), len(rows))
+    np.testing.assert_allclose(stacked, per_row, atol=1e-12)
+    assert np.any(stacked)
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.routes.results.getdata import _classify_rows, _get_base_task_data
+
+
+def classify_row_by_row(df, growth_regrowth):
+    """
+    Row-by-row classification rules the vectorized _classify_rows replaced.
+    """
+    outputs = df.loc[
+        (df["IName"] == "Product") | ((df["IName"] == "Co-Products") & (df["CHK"] == 0)),
+        ["Flow_id", "Process"]
+    ].drop_duplicates()
+    producers = {}
+    for flow_id, process in outputs.itertuples(index=False):
+        if pd.notna(process):
+            producers.setdefault(flow_id, set()).add(str(process).strip())
+
+    matrices, values = [], []
+    for _, row in df.iterrows():
+        item = str(row["IName"]).strip() if pd.notna(row["IName"]) else ""
+        flow_name = str(row["Flow"]).strip() if pd.notna(row["Flow"]) else ""
+        process = str(row["Process"]).strip() if pd.notna(row["Process"]) else ""
+        chk = row["CHK"] if pd.notna(row["CHK"]) else 0
+        value = float(row["ValueD"]) if pd.notna(row["ValueD"]) else 0.0
+
+        matrix, signed_value = None, None
+        if item == "Product" or (item == "Co-Products" and chk == 0):
+            matrix, signed_value = "A", value
+        elif item == "Input Materials and Energy":
+            if flow_name.lower() == "tree":
+                if growth_regrowth == 1:
+                    matrix, signed_value = "A", -value
+            elif any(p != process for p in producers.get(row["Flow_id"], set())):
+                matrix, signed_value = "A", -value
+            else:
+                matrix, signed_value = "B", value
+        elif item == "Co-Products" and chk != 0:
+            matrix, signed_value = "B", -value
+        elif item in ["Waste Treatment", "Emission", "Emissions"]:
+            matrix, signed_value = "B", value
+
+        matrices.append(matrix)
+        values.append(signed_value)
+
+    out = df.assign(Matrix=matrices, Value_Final=values)
+    return out[out["Matrix"].notna()]
+
+
+def assert_same_classification(df, growth_regrowth):
+    expected = classify_row_by_row(df, growth_regrowth)
+    actual = _classify_rows(df, growth_regrowth)
+
+    assert actual["IDD"].tolist() == expected["IDD"].tolist()
+    assert actual["Matrix"].tolist() == expected["Matrix"].tolist()
+    np.testing.assert_array_equal(
+        actual["Value_Final"].to_numpy(dtype=float),
+        expected["Value_Final"].to_numpy(dtype=float)
+    )
+
+
+COLUMNS = ["IDD", "IDT", "IDE", "Flow_id", "Flow", "Process", "ValueD", "UnitD", "CHK", "IName", "ManualAllocation"]
+
+ROWS = [
+    (1, 10, 101, 1, "Logs", "Harvest", 2.0, "t", 0, "Product", None),
+    (2, 10, 102, 1, "Logs", "Sawmill", 2000.0, "kg", 0, "Input Materials and Energy", None),
+    # Input produced by its own process only -> B
+    (3, 10, 102, 1, "Logs", "Harvest", 1.0, "kg", 0, "Input Materials and Energy", None),
+    (4, 10, 110, 9, " Tree ", "Harvest", 4.0, "kg", 0, "Input Materials and Energy", None),
+    (5, 10, 104, 3, "Sawdust", "Sawmill", 300.0, "kg", 0, "Co-Products", None),
+    (6, 10, 109, 8, "Chips", "Sawmill", 50.0, "kg", 1, "Co-Products", None),
+    (7, 10, 111, 8, "Chips", "Kiln", 5.0, "kg", 0, "Input Materials and Energy", None),
+    (8, 10, 107, 6, "Carbon dioxide", "Harvest", 7.0, "kg", 0, "Emission", None),
+    (9, 10, 112, 7, "Ash", "Kiln", 1.0, "kg", 0, "Waste Treatment", None),
+    (10, 10, 113, 7, "Ash", "Kiln", 1.0, "kg", 0, "Emissions", None),
+    # Unjoined rows: missing item, process, flow name, CHK or value
+    (11, 10, 114, 5, "Diesel", "Harvest", 3.0, "kg", 0, None, None),
+    (12, 10, 106, 1, "Logs", None, 3.0, "kg", 0, "Input Materials and Energy", None),
+    (13, 10, 106, 5, None, "Kiln", 3.0, "kg", 0, "Input Materials and Energy", None),
+    (14, 10, 103, 2, "Lumber", None, 1.0, "m3", 0, "Product", None),
+    (15, 10, 109, 8, "Chips", "Kiln", 2.0, "kg", None, "Co-Products", None),
+    (16, 10, 105, 4, "Electricity", "Sawmill", None, "kWh", 0, "Input Materials and Energy", None),
+    (17, 10, 115, 4, "Electricity", "Sawmill", 1.0, "kWh", 0, "Unknown", None),
+]
+
+
+@pytest.mark.parametrize("growth_regrowth", [0, 1])
+def test_classification_matches_row_by_row_rules(growth_regrowth):
+    assert_same_classification(pd.DataFrame(ROWS, columns=COLUMNS), growth_regrowth)
+
+
+def test_classification_of_empty_frame():
+    out = _classify_rows(pd.DataFrame(columns=COLUMNS), 0)
+    assert out.empty
+    assert {"Matrix", "Value_Final"} <= set(out.columns)
+
+
+@pytest.mark.parametrize("growth_regrowth", [0, 1])
+def test_classification_of_fixture_datasheet(app, growth_regrowth):
+    from app import db
+    from app.models import BElement, Element, Datasheet
+
+    db.session.add(BElement(IDBE=9, EName='Tree', user_id=1))
+    db.session.add(Element(IDE=110, IDBE=9, IDI='I3', user_id=1))
+    db.session.add(Element(IDE=111, IDBE=2, IDI='I3', user_id=1))
+    db.session.flush()
+    # Tree input of Harvest, Lumber consumed by the Kiln and a row whose
+    # step does not exist (dropped by the join)
+    db.session.add(Datasheet(IDD=20, IDT=10, IDE=110, IDS='S1', IDU='U1', ValueD=4.0, CHK=0, user_id=1))
+    db.session.add(Datasheet(IDD=21, IDT=10, IDE=111, IDS='S3', IDU='U4', ValueD=1.0, CHK=0, user_id=1))
+    db.session.add(Datasheet(IDD=22, IDT=10, IDE=105, IDS='S9', IDU='U3', ValueD=1.0, CHK=0, user_id=1))
+    db.session.commit()
+
+    df = _get_base_task_data(10)
+    assert 22 not in df["IDD"].tolist()
+
+    # Lumber is the Product of Sawmill, so as a Kiln input it goes to A
+    classified = _classify_rows(df, growth_regrowth).set_index("IDD")
+    assert classified.loc[21, "Matrix"] == "A"
+    assert classified.loc[21, "Value_Final"] == -1.0
+    assert (20 in classified.index) == (growth_regrowth == 1)
+
+    assert_same_classification(df, growth_regrowth)
@@ -0,0 +1,60 @@
+import time
+
+from app.routes.results.jobs import AnalysisJob, AnalysisJobManager, JOB_DONE, JOB_FAILED, JOB_RUNNING
+from app.routes.results.main import run_analysis
+from app.routes.results.result_store import SQLiteResultStore
+
+ROW = {'task': 10, 'taskText': 'T1', 'flow': '2', 'flowText': 'Lumber', 'functional_unit': 1,
+       'unit': 'U4', 'unitText': 'm3', 'impact_category': 'GWP'}
+
+GROWTH_PARAMS = {
+    'regeneration_mode': True,
+    'pre_harvest_yield': 2.0,
+    'post_harvest_yield': 3.0,
+    'time_horizon': 10,
+    'p_residues': 20.0,
+    'T_half_decay': 5.0,
+    'c_content': 50.0,
+    'standing_biomass': 100.0,
+}
+
+
+def test_job_with_regeneration_mode_runs_outside_a_request(app):
+    jobs = AnalysisJobManager(max_workers=1)
+    job = jobs.submit(app, 'admin', [ROW], GROWTH_PARAMS, run_analysis)
+    jobs._executor.shutdown(wait=True)
+
+    assert job.status == JOB_DONE
+    result = job.result['individual_results'][0]
+    assert 'error' not in result, result.get('error')
+
+
+def test_job_can_be_polled_through_another_worker(app, tmp_path):
+    path = str(tmp_path / "results.sqlite3")
+    submitting = AnalysisJobManager(max_workers=1, store=SQLiteResultStore(path=path))
+    polling = AnalysisJobManager(store=SQLiteResultStore(path=path))
+
+    job = submitting.submit(app, 'admin', [ROW], GROWTH_PARAMS, run_analysis)
+    submitting._executor.shutdown(wait=True)
+
+    polled = polling.get(job.id, 'admin')
+    assert polled.status == JOB_DONE
+    assert polled.to_status()["rows_done"] == 1
+    assert polled.result == job.result
+    assert polling.get(job.id, 'someone-else') is None
+
+
+def test_stale_running_job_is_reported_as_failed(tmp_path):
+    store = SQLiteResultStore(path=str(tmp_path / "results.sqlite3"))
+    jobs = AnalysisJobManager(ttl=60, store=store)
+    assert jobs.get('missing', 'admin') is None
+
+    job = AnalysisJob('admin', [ROW])
+    job.status = JOB_RUNNING
+    record = job.to_record()
+    record["updated_at"] = time.time() - 120
+    store.set(job.key, record)
+
+    polled = jobs.get(job.id, 'admin')
+    assert polled.status == JOB_FAILED
+    assert polled.error
@@ -0,0 +1,56 @@
+import numpy as np
+
+from app.routes.results.lci_store import LCIFactorStore, LCI_CATEGORIES
+
+
+def loaded_store():
+    store = LCIFactorStore()
+    store.refresh(force=True)
+    return store
+
+
+def test_subset_without_matches(app):
+    subset = loaded_store().subset(["Logs", "Lumber"])
+
+    assert subset.matrix(["Logs", "Lumber"]).shape == (len(LCI_CATEGORIES), 2)
+    assert not subset.matrix(["Logs", "Lumber"]).any()
+    assert subset.get("Logs", "GWP") is None
+
+
+def test_subset_of_empty_flow_list(app):
+    subset = loaded_store().subset([])
+
+    assert subset.matrix([]).shape == (len(LCI_CATEGORIES), 0)
+
+
+def test_subset_with_partial_matches(app):
+    store = loaded_store()
+    flows = ["Logs", "Diesel", "Electricity", "Diesel"]
+    subset = store.subset(flows)
+
+    np.testing.assert_array_equal(subset.matrix(flows), store.matrix(flows))
+    assert subset.get("Diesel", "GWP") == store.get("Diesel", "GWP")
+    assert subset.get("Chips", "GWP") is None
+    assert subset.version == store.version
+
+
+def test_task_without_lci_matches_has_zero_impact(app):
+    from flask import session
+    from app import db
+    from app.models import LCI
+    from app.routes.results.lci_store import lci_store
+    from app.routes.results.main import run_analysis
+
+    LCI.query.delete()
+    db.session.commit()
+    lci_store.refresh(force=True)
+
+    row = {'task': 10, 'taskText': 'T1', 'flow': '2', 'flowText': 'Lumber', 'functional_unit': 1,
+           'unit': 'U4', 'unitText': 'm3', 'impact_category': 'GWP'}
+    with app.test_request_context('/'):
+        session['username'] = 'admin'
+        output = run_analysis([row])
+
+    result = output['individual_results'][0]
+    assert 'error' not in result
+    assert result['total_impact'] == 0
@@ -0,0 +1,83 @@
+import pandas as pd
+import pytest
+
+from app import db
+from app.models import BElement, Datasheet
+from app.routes.results.getdata import build_task_matrices
+from app.routes.results.matrix_cache import TaskMatrixCache
+
+
+def edit(idd, **fields):
+    row = db.session.get(Datasheet, idd)
+    for name, value in fields.items():
+        setattr(row, name, value)
+
+
+def insert(idd, ide, ids, idu, value, chk=0):
+    db.session.add(Datasheet(IDD=idd, IDT=10, IDE=ide, IDS=ids, IDU=idu, ValueD=value, CHK=chk, user_id=1))
+
+
+def delete(idd):
+    db.session.delete(db.session.get(Datasheet, idd))
+
+
+def assert_matches_fresh_build(cache):
+    a, b = cache.get_matrices(10, 0)
+    fresh_a, fresh_b = build_task_matrices(10, 0)
+    pd.testing.assert_frame_equal(a, fresh_a)
+    pd.testing.assert_frame_equal(b, fresh_b)
+
+
+# (change, changed IDDs, patched in place)
+CASES = {
+    "edit B value": (lambda: edit(2, ValueD=8.0), [2], True),
+    "edit A input": (lambda: edit(4, ValueD=1500.0), [4], True),
+    "edit product value": (lambda: edit(5, ValueD=2.0), [5], True),
+    "edit unit": (lambda: edit(8, IDU='U1'), [8], True),
+    "insert into existing flow": (lambda: insert(50, 105, 'S2', 'U3', 10.0), [50], True),
+    "insert into other process": (lambda: insert(51, 105, 'S1', 'U3', 3.0), [51], True),
+    "insert new process": (lambda: insert(52, 106, 'S3', 'U1', 1.0), [52], False),
+    "co-product becomes output": (lambda: edit(7, CHK=0), [7], False),
+    "delete last row of a flow": (lambda: delete(3), [3], False),
+    "delete first row of a process": (lambda: delete(1), [1], False),
+}
+
+
+@pytest.mark.parametrize("case", CASES)
+def test_apply_rows_matches_fresh_build(app, case):
+    change, idds, patched = CASES[case]
+    cache = TaskMatrixCache(max_entries=4)
+    cache.get_matrices(10, 0)
+
+    change()
+    db.session.commit()
+    cache.patch_rows(10, idds)
+
+    assert (10 in cache._entries) == patched
+    assert_matches_fresh_build(cache)
+
+
+def test_delete_of_duplicate_row_is_patched(app):
+    insert(50, 105, 'S2', 'U3', 10.0)
+    db.session.commit()
+    cache = TaskMatrixCache(max_entries=4)
+    cache.get_matrices(10, 0)
+
+    delete(50)
+    db.session.commit()
+    cache.patch_rows(10, [50])
+
+    assert 10 in cache._entries
+    assert_matches_fresh_build(cache)
+
+
+def test_unpatched_rename_is_picked_up(app):
+    cache = TaskMatrixCache(max_entries=4)
+    cache.get_matrices(10, 0)
+
+    db.session.get(BElement, 5).EName = 'Diesel fuel'
+    db.session.commit()
+
+    _, b = cache.get_matrices(10, 0)
+    assert 'Diesel fuel' in b['Flow'].tolist()
+    assert_matches_fresh_build(cache)
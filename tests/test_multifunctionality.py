@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.routes.results import multifunctionality
+from app.routes.results.multifunctionality import (
+    AllocationOutputs, ColumnExpansion, adjust_matrix_for_multiple_outputs
+)
+
+# Harvest has one output (Logs). Sawmill has three outputs in different
+# units (Lumber m3, Sawdust kg, Chips kg), so it needs manual allocation.
+A_ROWS = [
+    ("Logs", "1", "kg", 2000.0, -2000.0),
+    ("Lumber", "2", "m3", 0.0, 1.0),
+    ("Sawdust", "3", "kg", 0.0, 300.0),
+    ("Chips", "8", "kg", 0.0, 50.0),
+    ("Diesel", "5", "kg", -5.0, -1.0),
+]
+B_ROWS = [
+    ("Carbon dioxide", "6", "kg", 7.0, 2.0),
+    ("Electricity", "4", "kWh", 0.0, 40.0),
+]
+COLUMNS = ["Flow", "Flow_id", "Unit", "Harvest", "Sawmill"]
+
+OUTPUTS = AllocationOutputs.from_rows([
+    ("Harvest", 1, "Product", 0, None),
+    ("Sawmill", 2, "Product", 0, None),
+    ("Sawmill", 3, "Co-Products", 0, None),
+    ("Sawmill", 8, "Co-Products", 0, None),
+])
+
+MANUAL_ALLOCATION = {"Sawmill__col_1": {"2": 0.6, "3": 0.3, "8": 0.1}}
+
+
+def split_columns(A, B, splits):
+    """
+    Column-by-column split the expansion matrix replaced. `splits` maps a
+    column to (factors, output_rows); other columns are kept.
+    """
+    new_A, new_B = [], []
+    for col in range(A.shape[1]):
+        if col not in splits:
+            new_A.append(A[:, col])
+            new_B.append(B[:, col])
+            continue
+
+        factors, output_rows = splits[col]
+        for i, factor in enumerate(factors):
+            column_A = A[:, col] * factor
+            column_B = B[:, col] * factor
+            column_A[output_rows] = 0.0
+            column_A[output_rows[i]] = A[output_rows[i], col]
+            new_A.append(column_A)
+            new_B.append(column_B)
+
+    return np.column_stack(new_A), np.column_stack(new_B)
+
+
+def test_manual_allocation_matches_column_split(app):
+    Aa = pd.DataFrame(A_ROWS, columns=COLUMNS)
+    Bb = pd.DataFrame(B_ROWS, columns=COLUMNS)
+
+    adjusted_A, adjusted_B = adjust_matrix_for_multiple_outputs(
+        Aa, Bb, manual_allocation=MANUAL_ALLOCATION, task_id=10, outputs=OUTPUTS
+    )
+
+    expected_A, expected_B = split_columns(
+        Aa.iloc[:, 3:].to_numpy(dtype=float),
+        Bb.iloc[:, 3:].to_numpy(dtype=float),
+        {1: ([0.6, 0.3, 0.1], np.array([1, 2, 3]))}
+    )
+
+    assert adjusted_A.columns.tolist()[3:] == [
+        "Harvest", "Sawmill - Lumber", "Sawmill - Sawdust", "Sawmill - Chips"
+    ]
+    np.testing.assert_array_equal(adjusted_A.iloc[:, 3:].to_numpy(dtype=float), expected_A)
+    np.testing.assert_array_equal(adjusted_B.iloc[:, 3:].to_numpy(dtype=float), expected_B)
+
+    # Each split column keeps its own output at the full original amount
+    np.testing.assert_array_equal(adjusted_A.iloc[1:4, 4:].to_numpy(), np.diag([1.0, 300.0, 50.0]))
+
+
+@pytest.mark.parametrize("operand", ["dense", "sparse", "without_scipy"])
+def test_column_expansion_matches_column_split(monkeypatch, operand):
+    rng = np.random.default_rng(0)
+    A = rng.normal(size=(6, 4))
+    B = rng.normal(size=(3, 4))
+    splits = {1: ([0.5, 0.25, 0.25], np.array([0, 2, 5])), 3: ([0.7, 0.3], np.array([4, 1]))}
+
+    expansion = ColumnExpansion(4)
+    for col in range(4):
+        if col in splits:
+            factors, rows = splits[col]
+            expansion.split(col, factors, rows, [f"P{col}-{r}" for r in rows])
+        else:
+            expansion.keep(col, f"P{col}")
+
+    if operand == "without_scipy":
+        monkeypatch.setattr(multifunctionality, "sp", None)
+    if operand == "sparse":
+        import scipy.sparse as sp
+        A, B = sp.csr_matrix(A), sp.csr_matrix(B)
+
+    new_A = expansion.expand(A, restore_outputs=True)
+    new_B = expansion.expand(B)
+    if operand == "sparse":
+        A, B, new_A, new_B = A.toarray(), B.toarray(), new_A.toarray(), new_B.toarray()
+
+    expected_A, expected_B = split_columns(A, B, splits)
+    np.testing.assert_allclose(new_A, expected_A, rtol=1e-15, atol=0)
+    np.testing.assert_allclose(new_B, expected_B, rtol=1e-15, atol=0)
@@ -0,0 +1,73 @@
+import pytest
+
+from app.routes.results.result_store import (
+    MemoryResultStore, SQLiteResultStore, make_result_key, key_owner, key_task
+)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return MemoryResultStore(**kwargs)
+        return SQLiteResultStore(path=str(tmp_path / "results.sqlite3"), **kwargs)
+    return make
+
+
+def test_key_parts():
+    key = make_result_key("a:b", 10, "abc")
+    assert key_owner(key) == "a:b"
+    assert key_task(key) == "10"
+
+
+def test_set_get_delete(make_store):
+    store = make_store()
+    key = make_result_key("admin", 10, "x")
+    store.set(key, {"data": [["Harvest", 1.5]]})
+
+    assert store.get(key) == {"data": [["Harvest", 1.5]]}
+    store.delete(key)
+    assert store.get(key) is None
+
+
+def test_expired_entries_are_dropped(make_store):
+    store = make_store(ttl=-1)
+    key = make_result_key("admin", 10, "x")
+    store.set(key, {"a": 1})
+    assert store.get(key) is None
+
+
+def test_least_recently_used_entries_are_evicted(make_store):
+    store = make_store(max_entries=2)
+    keys = [make_result_key("admin", 10, str(i)) for i in range(3)]
+    store.set(keys[0], 0)
+    store.set(keys[1], 1)
+    store.get(keys[0])
+    store.set(keys[2], 2)
+
+    assert store.get(keys[0]) == 0
+    assert store.get(keys[1]) is None
+    assert store.get(keys[2]) == 2
+
+
+def test_delete_task_only_drops_that_task(make_store):
+    store = make_store()
+    store.set(make_result_key("admin", 10, "x"), 1)
+    store.set(make_result_key("admin", 100, "x"), 2)
+
+    store.delete_task(10)
+
+    assert store.get(make_result_key("admin", 10, "x")) is None
+    assert store.get(make_result_key("admin", 100, "x")) == 2
+
+
+def test_stored_value_is_not_shared_with_callers(make_store):
+    store = make_store()
+    key = make_result_key("admin", 10, "x")
+    value = {"result": {"total_impact": 1.0}}
+    store.set(key, value)
+
+    value["result"]["chart_base64"] = "png"
+    store.get(key)["result"]["result_key"] = key
+
+    assert store.get(key) == {"result": {"total_impact": 1.0}}
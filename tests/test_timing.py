@@ -0,0 +1,16 @@
+from flask import session
+
+from app.routes.results.main import run_analysis
+
+ROW = {'task': 10, 'taskText': 'T1', 'flow': '2', 'flowText': 'Lumber', 'functional_unit': 1,
+       'unit': 'U4', 'unitText': 'm3', 'impact_category': 'GWP'}
+
+
+def test_matrix_a_conversion_is_timed_as_unit_conversion(app):
+    with app.test_request_context('/'):
+        session['username'] = 'admin'
+        output = run_analysis([ROW], timings=True)
+
+    records = [r for r in output['timings']['records'] if r['stage'] == 'unit_conversion']
+    assert any(r.get('matrix') == 'A' and r['parent'] == 'matrices' for r in records)
+    assert any(r['parent'] != 'matrices' for r in records)
@@ -0,0 +1,140 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app import db
+from app.models import ForestryConversionFactorsFIA, UnitConversion, UnitAlias
+from app.routes.results.import_rawdata import convert_matrix_a
+from app.routes.results.unit_conversion import (
+    FIAConversionIndex, get_unit_registry, invalidate_unit_registry, unit_conversion,
+    unit_conversion_array
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry():
+    invalidate_unit_registry()
+    yield
+    invalidate_unit_registry()
+
+
+def fia_row(input_unit, output_unit, factor, materials='roundwood', species_class='undefined',
+            species_name='undefined'):
+    return SimpleNamespace(input_unit=input_unit, output_unit=output_unit, factor=factor,
+                           materials=materials, species_class=species_class, species_name=species_name)
+
+
+def test_grouped_conversion_matches_per_row_conversion(app):
+    units = ['t', 'kg', ' T ', 'tonne', 'kWh', 't']
+    values = np.arange(1.0, 13.0).reshape(6, 2)
+
+    converted, si_units = unit_conversion_array(values, units)
+
+    expected = np.array([[unit_conversion(v, unit, 'SI') for v in row] for row, unit in zip(values, units)])
+    np.testing.assert_array_equal(converted, expected)
+    assert si_units.tolist() == ['kg', 'kg', 'kg', 'kg', 'kwh', 'kg']
+
+
+def test_rows_without_a_known_unit_keep_their_unit(app):
+    converted, si_units = unit_conversion_array(np.array([2.0, 3.0, 4.0, 5.0]), [None, '', ' ', 'furlong '])
+
+    np.testing.assert_array_equal(converted, [2.0, 3.0, 4.0, 5.0])
+    assert si_units.tolist() == [None, '', '', 'furlong']
+
+
+def test_convert_matrix_a_keeps_blank_units(app):
+    meta = pd.DataFrame({'Flow': ['Lumber', 'Logs'], 'Flow_id': [2, 1], 'Unit': ['', 't']})
+    values, meta_si = convert_matrix_a(np.array([[1.0], [2.0]]), meta)
+
+    assert meta_si['SI Unit'].tolist() == ['kg', '']
+    np.testing.assert_array_equal(values, [[2000.0], [1.0]])
+
+
+def test_fia_reciprocal_and_direct_entries():
+    index = FIAConversionIndex([
+        fia_row('standard_cords', 'dry_metric_tonnes', 2.0),
+        fia_row('green_tons', 'mbf_international', 0.25),
+        fia_row('mbf_international', 'green_tons', 5.0),
+        fia_row('cubic_meters', 'green_tons', 0),
+    ])
+
+    assert index.lookup('dry_metric_tonnes', 'standard_cords') == 0.5
+    # A direct entry wins over the reciprocal of the opposite direction
+    assert index.lookup('mbf_international', 'green_tons') == 5.0
+    assert index.lookup('green_tons', 'mbf_international') == 0.25
+    assert index.lookup('green_tons', 'cubic_meters') == 0.0
+
+
+def test_fia_lookup_falls_back_to_less_specific_entries():
+    index = FIAConversionIndex([
+        fia_row('mbf', 'green_tons', 4.0, 'sawlogs', 'softwood', 'pine'),
+        fia_row('mbf', 'green_tons', 3.0, 'sawlogs'),
+        fia_row('mbf', 'green_tons', 2.0, 'pulpwood', 'hardwood', 'oak'),
+    ])
+
+    assert index.lookup('MBF', 'Green_Tons', 'sawlogs', 'softwood', 'pine') == 4.0
+    assert index.lookup('mbf', 'green_tons', 'sawlogs', 'softwood', 'spruce') == 3.0
+    assert index.lookup('mbf', 'green_tons', 'roundwood') == 4.0
+    assert index.lookup('green_tons', 'mbf', 'pulpwood', 'hardwood', 'oak') == 0.5
+
+    with pytest.raises(ValueError):
+        index.lookup('mbf', 'cubic_meters')
+
+
+def test_fia_units_are_converted_through_the_forestry_table(app):
+    db.session.add(UnitConversion(id=10, unit_name='dry_metric_tonnes', factor_to_si=1000,
+                                  si_unit='kg', category='mass'))
+    db.session.add(ForestryConversionFactorsFIA(input_unit='mbf_international', output_unit='green_tons',
+                                                materials='roundwood', species_class='undefined',
+                                                species_name='undefined', factor=6))
+    db.session.add(ForestryConversionFactorsFIA(input_unit='dry_metric_tonnes', output_unit='standard_cords',
+                                                materials='roundwood', species_class='undefined',
+                                                species_name='undefined', factor=0.5))
+    db.session.commit()
+
+    converted, si_units = unit_conversion_array(np.array([1.0, 2.0, 3.0]), ['MBF', 'mbf_international', 'standard_cords'])
+
+    # mbf -> 6 green tons x 0.5 dry tonnes; cords -> reciprocal of 0.5 dry tonnes
+    np.testing.assert_allclose(converted, [3000.0, 6000.0, 6000.0])
+    assert si_units.tolist() == ['kg', 'kg', 'kg']
+
+
+@pytest.fixture
+def unit_routes(app):
+    from app.routes.auoc_routes import auoc_bp
+    from app.routes.uoc_routes import uoc_bp
+
+    app.register_blueprint(uoc_bp)
+    app.register_blueprint(auoc_bp)
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['username'] = 'admin'
+    return client
+
+
+def test_unit_edit_reloads_the_registry(app, unit_routes):
+    registry = get_unit_registry()
+    assert unit_conversion(1, 't') == 1000
+
+    response = unit_routes.post('/updateuoc', json={
+        'IDU': 1, 'UName': 't', 'Unit': 'kg', 'UFactor': '907.18474', 'UCategory': 'mass', 'State': 1
+    })
+
+    assert response.status_code == 200
+    assert get_unit_registry() is not registry
+    assert get_unit_registry().digest != registry.digest
+    assert unit_conversion(1, 't') == pytest.approx(907.18474)
+
+
+def test_alias_edit_reloads_the_registry(app, unit_routes):
+    assert get_unit_registry().resolve('tonne') == 't'
+
+    response = unit_routes.post('/updateauoc', json={
+        'IDU': 1, 'UAlias': 'tonne', 'CanonicalUnit': 'kg', 'State': 1
+    })
+
+    assert response.status_code == 200
+    assert get_unit_registry().resolve('tonne') == 'kg'
+    assert db.session.get(UnitAlias, 1).canonical_unit == 'kg'